@@ -12,5 +12,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from nailgun.api.handlers.base import buffer_notifications
 from nailgun.api.handlers.base import check_client_content_type
 from nailgun.api.handlers.base import forbid_client_caching
@@ -16,8 +16,10 @@
 
 from datetime import datetime
 from decorator import decorator
+import hashlib
 import json
 
+from sqlalchemy import func
 import web
 
 from nailgun.api.serializers.base import BasicSerializer
@@ -49,6 +51,15 @@ def forbid_client_caching(handler):
     return handler()
 
 
+def buffer_notifications(handler):
+    """Writes all notifications added by request handler at once.
+    HTTP errors are normal responses, so notifications are written
+    for them too.
+    """
+    with notifier.buffered(flush_on=(web.HTTPError,)):
+        return handler()
+
+
 @decorator
 def content_json(func, *args, **kwargs):
     web.header('Content-Type', 'application/json')
@@ -59,10 +70,45 @@ def content_json(func, *args, **kwargs):
 def build_json_response(data):
     web.header('Content-Type', 'application/json')
     if type(data) in (dict, list):
-        return json.dumps(data)
+        data = json.dumps(data)
+        # handlers which know cheaper way to build ETag
+        # set it by themselves before serialization
+        if web.ctx.method == 'GET' and not get_etag():
+            set_etag(hashlib.md5(data).hexdigest())
     return data
 
 
+def get_etag():
+    """:returns: ETag header of current response or None.
+    """
+    for header, value in web.ctx.headers:
+        if header.lower() == 'etag':
+            return value
+
+
+def set_etag(tag):
+    """Sets ETag header of response and stops request processing
+    with 304 Not Modified if client already has data with this tag.
+
+    :param tag: opaque string which changes with data.
+    :raises: web.notmodified
+    """
+    etag = '"{0}"'.format(tag)
+    web.header('ETag', etag)
+    if_none_match = web.ctx.env.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return
+    client_etags = [t.strip() for t in if_none_match.split(',')]
+    if '*' in client_etags or etag in client_etags \
+            or 'W/' + etag in client_etags:
+        # 304 response must not have content
+        web.ctx.headers = [
+            (header, value) for header, value in web.ctx.headers
+            if header.lower() != 'content-type'
+        ]
+        raise web.notmodified()
+
+
 handlers = {}
 
 
@@ -94,6 +140,68 @@ class JSONHandler(object):
             fields=fields or cls.fields
         )
 
+    def get_int_param(self, user_data, name):
+        """Returns non-negative integer value of request
+        parameter or None if it is not specified.
+
+        :raises: web.badrequest
+        """
+        value = user_data.get(name)
+        if value is None or value == '':
+            return None
+        try:
+            value = int(value)
+        except ValueError:
+            raise web.badrequest("Invalid '{0}' value".format(name))
+        if value < 0:
+            raise web.badrequest("Invalid '{0}' value".format(name))
+        return value
+
+    def check_etag(self, *state):
+        """Sets ETag built from state of objects which are rendered
+        by handler, e.g. their ids and revisions, so response isn't
+        serialized at all if client already has it.
+
+        :raises: web.notmodified
+        """
+        set_etag(hashlib.md5(repr(state)).hexdigest())
+
+    @classmethod
+    def get_revision(cls):
+        """Returns revision for the next poll of changed objects: id
+        of the oldest transaction which is still in progress. Objects
+        changed by transactions committed later aren't visible yet,
+        but their revisions aren't less than it, so they are returned
+        by the next poll, possibly along with already returned ones.
+        Must be called before changed objects are queried.
+        """
+        return db().query(
+            func.txid_snapshot_xmin(func.txid_current_snapshot())
+        ).scalar()
+
+    @classmethod
+    def render_changes(cls, revision, ids, items):
+        """Wraps objects changed since some revision into document
+        with new revision and ids of all objects, so client is able
+        to find out which objects were deleted.
+
+        :param revision: Revision which should be used in the next poll.
+        :param ids: ids of all objects matching request.
+        :param items: list of rendered objects or generator of
+            parts of JSON array.
+        """
+        if isinstance(items, list):
+            return {'revision': revision, 'ids': ids, 'items': items}
+        return cls._stream_changes(revision, ids, items)
+
+    @classmethod
+    def _stream_changes(cls, revision, ids, items):
+        yield '{{"revision": {0}, "ids": {1}, "items": '.format(
+            json.dumps(revision), json.dumps(ids))
+        for chunk in items:
+            yield chunk
+        yield '}'
+
     def checked_data(self, validate_method=None):
         try:
             if validate_method:
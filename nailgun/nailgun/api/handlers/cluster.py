@@ -76,9 +76,16 @@ class ClusterHandler(JSONHandler):
     def GET(self, cluster_id):
         """:returns: JSONized Cluster object.
         :http: * 200 (OK)
+               * 304 (cluster wasn't changed since ETag of client)
                * 404 (cluster not found in db)
         """
         cluster = self.get_object_or_404(Cluster, cluster_id)
+        self.check_etag(
+            cluster.id,
+            cluster.revision,
+            cluster.release.revision,
+            [change.id for change in cluster.changes]
+        )
         return self.render(cluster)
 
     @content_json
@@ -282,6 +289,7 @@ class ClusterAttributesHandler(JSONHandler):
     def GET(self, cluster_id):
         """:returns: JSONized Cluster attributes.
         :http: * 200 (OK)
+               * 304 (attributes weren't changed since ETag of client)
                * 404 (cluster not found in db)
                * 500 (cluster has no attributes)
         """
@@ -289,6 +297,7 @@ class ClusterAttributesHandler(JSONHandler):
         if not cluster.attributes:
             raise web.internalerror("No attributes found!")
 
+        self.check_etag(cluster.attributes.id, cluster.attributes.revision)
         return {
             "editable": cluster.attributes.editable
         }
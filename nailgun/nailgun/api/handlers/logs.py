@@ -18,6 +18,7 @@
 Handlers dealing with logs
 """
 
+import calendar
 from itertools import dropwhile
 import json
 import logging
@@ -31,43 +32,35 @@ from nailgun.api.handlers.base import content_json
 from nailgun.api.handlers.base import JSONHandler
 from nailgun.api.handlers.tasks import TaskHandler
 from nailgun.api.models import Node
-from nailgun.api.models import RedHatAccount
 from nailgun.db import db
+from nailgun.logs.index import log_indexes
+from nailgun.logs.parser import log_parsers
+from nailgun.logs.reader import read_backwards
+from nailgun.logs.search import decode_cursor
+from nailgun.logs.search import LogSearch
+from nailgun.logs.search import SearchedFile
+from nailgun.logs.sources import get_node_log_dir
+from nailgun.logs.sources import get_node_log_sources
 from nailgun.settings import settings
 from nailgun.task.manager import DumpTaskManager
 
 logger = logging.getLogger(__name__)
 
 
-def read_backwards(file, bufsize=4096):
-    buf = ""
+def get_date_param(user_data, name):
+    """:returns: date of request parameter in UI format as
+    seconds since epoch or None if it is not specified.
+    :raises: web.badrequest
+    """
+    value = user_data.get(name)
+    if not value:
+        return None
     try:
-        file.seek(-1, 1)
-    except IOError:
-        return
-    trailing_newline = False
-    if file.read(1) == "\n":
-        trailing_newline = True
-        file.seek(-1, 1)
-
-    while True:
-        newline_pos = buf.rfind("\n")
-        pos = file.tell()
-        if newline_pos != -1:
-            line = buf[newline_pos + 1:]
-            buf = buf[:newline_pos]
-            if pos or newline_pos or trailing_newline:
-                line += "\n"
-            yield line
-        elif pos:
-            toread = min(bufsize, pos)
-            file.seek(-toread, 1)
-            buf = file.read(toread) + buf
-            file.seek(-toread, 1)
-            if pos == toread:
-                buf = "\n" + buf
-        else:
-            return
+        return calendar.timegm(
+            time.strptime(value, settings.UI_LOG_DATE_FORMAT))
+    except ValueError:
+        logger.debug("Invalid '%s' value: %s", name, value)
+        raise web.badrequest("Invalid '{0}' value".format(name))
 
 
 class LogEntryCollectionHandler(JSONHandler):
@@ -103,37 +96,21 @@ class LogEntryCollectionHandler(JSONHandler):
                * 500 (invalid regular expression in config)
         """
         user_data = web.input()
-        date_before = user_data.get('date_before')
-        if date_before:
-            try:
-                date_before = time.strptime(date_before,
-                                            settings.UI_LOG_DATE_FORMAT)
-            except ValueError:
-                logger.debug("Invalid 'date_before' value: %s", date_before)
-                raise web.badrequest("Invalid 'date_before' value")
-        date_after = user_data.get('date_after')
-        if date_after:
-            try:
-                date_after = time.strptime(date_after,
-                                           settings.UI_LOG_DATE_FORMAT)
-            except ValueError:
-                logger.debug("Invalid 'date_after' value: %s", date_after)
-                raise web.badrequest("Invalid 'date_after' value")
+        date_before = get_date_param(user_data, 'date_before')
+        date_after = get_date_param(user_data, 'date_after')
         truncate_log = bool(user_data.get('truncate_log'))
 
         if not user_data.get('source'):
             logger.debug("'source' must be specified")
             raise web.badrequest("'source' must be specified")
 
-        log_config = filter(lambda lc: lc['id'] == user_data.source,
-                            settings.LOGS)
+        log_config = log_parsers.get_source(user_data.source)
         # If log source not found or it is fake source but we are run without
         # fake tasks.
-        if not log_config or (log_config[0].get('fake') and
+        if not log_config or (log_config.get('fake') and
                               not settings.FAKE_TASKS):
             logger.debug("Log source %r not found", user_data.source)
             return web.notfound("Log source not found")
-        log_config = log_config[0]
 
         # If it is 'remote' and not 'fake' log source then calculate log file
         # path by base dir, node IP and relative path to file.
@@ -149,13 +126,8 @@ class LogEntryCollectionHandler(JSONHandler):
                 logger.error('Node %r has no assigned ip', node.id)
                 raise web.internalerror("Node has no assigned ip")
 
-            if node.status == "discover":
-                ndir = node.ip
-            else:
-                ndir = node.fqdn
-
-            remote_log_dir = os.path.join(log_config['base'], ndir)
-            if not os.path.exists(remote_log_dir):
+            remote_log_dir = get_node_log_dir(log_config, node)
+            if not remote_log_dir or not os.path.exists(remote_log_dir):
                 logger.debug("Log files dir %r for node %s not found",
                              remote_log_dir, node.id)
                 return web.notfound("Log files dir for node not found")
@@ -171,6 +143,9 @@ class LogEntryCollectionHandler(JSONHandler):
             else:
                 logger.debug("Log file %r not found", log_file)
             return web.notfound("Log file not found")
+        if not os.access(log_file, os.R_OK):
+            logger.error("Log file %r isn't readable", log_file)
+            raise web.internalerror("Log file isn't readable")
 
         level = user_data.get('level')
         allowed_levels = log_config['levels']
@@ -180,7 +155,7 @@ class LogEntryCollectionHandler(JSONHandler):
             allowed_levels = [l for l in dropwhile(lambda l: l != level,
                                                    log_config['levels'])]
         try:
-            regexp = re.compile(log_config['regexp'])
+            parser = log_parsers.get(log_config)
         except re.error as e:
             logger.error('Invalid regular expression for file %r: %s',
                          log_config['id'], e)
@@ -209,25 +184,20 @@ class LogEntryCollectionHandler(JSONHandler):
             logger.debug("Invalid 'max_entries' value: %d", max_entries)
             raise web.badrequest("Invalid 'max_entries' value")
 
-        accs = db().query(RedHatAccount).all()
-        regs = []
-        if len(accs) > 0:
-            regs = [
-                (
-                    re.compile(r"|".join([a.username for a in accs])),
-                    "username"
-                ),
-                (
-                    re.compile(r"|".join([a.password for a in accs])),
-                    "password"
-                )
-            ]
+        scrub_patterns = log_parsers.get_scrub_patterns()
+
+        # date bounded requests read only the part of file
+        # which is found by sparse index of file
+        start, end = 0, log_file_size
+        if date_before or date_after:
+            index = log_indexes.get(log_file, parser.entry_time)
+            start, end = index.bounds(date_after, date_before)
 
         has_more = False
         with open(log_file, 'r') as f:
-            f.seek(0, 2)
+            f.seek(end)
             # we need to calculate current position manually instead of using
-            # tell() because read_backwards uses buffering
+            # tell() because file position doesn't follow read_backwards
             pos = f.tell()
             multilinebuf = []
             for line in read_backwards(f):
@@ -235,13 +205,14 @@ class LogEntryCollectionHandler(JSONHandler):
                 if not truncate_log and pos < to_byte:
                     has_more = pos > 0
                     break
+                if pos < start:
+                    break
                 entry = line.rstrip('\n')
                 if not len(entry):
                     continue
-                if 'skip_regexp' in log_config and \
-                        re.match(log_config['skip_regexp'], entry):
+                if parser.is_skipped(entry):
                     continue
-                m = regexp.match(entry)
+                m = parser.match(entry)
                 if m is None:
                     if log_config.get('multiline'):
                         #  Add next multiline part to last entry if it exist.
@@ -259,8 +230,7 @@ class LogEntryCollectionHandler(JSONHandler):
                 if level and not (entry_level in allowed_levels):
                     continue
                 try:
-                    entry_date = time.strptime(m.group('date'),
-                                               log_config['date_format'])
+                    entry_date = parser.parse_date(m.group('date'))
                 except ValueError:
                     logger.debug("Unable to parse date from log entry."
                                  " Date format: %r, date part of entry: %r",
@@ -268,11 +238,17 @@ class LogEntryCollectionHandler(JSONHandler):
                                  m.group('date'))
                     continue
 
-                for regex, replace in regs:
+                if date_before or date_after:
+                    entry_time = calendar.timegm(entry_date)
+                    if date_before and entry_time >= date_before or \
+                            date_after and entry_time <= date_after:
+                        continue
+
+                for regex, replace in scrub_patterns:
                     entry_text = regex.sub(replace, entry_text)
 
                 entries.append([
-                    time.strftime(settings.UI_LOG_DATE_FORMAT, entry_date),
+                    parser.format_date(entry_date),
                     entry_level,
                     entry_text
                 ])
@@ -287,6 +263,135 @@ class LogEntryCollectionHandler(JSONHandler):
         }
 
 
+class LogSearchHandler(JSONHandler):
+    """Log search handler
+    """
+
+    def GET(self):
+        """Receives following parameters:
+
+        - *source* - comma separated ids of log sources
+        - *node* - comma separated node ids (for searching node logs)
+        - *text* - substring which entries should contain
+        - *regexp* - regular expression which entries should match
+        - *levels* - comma separated log levels (all levels by default)
+        - *date_before* - search logs before this date
+        - *date_after* - search logs after this date
+        - *limit* - max number of entries, LOG_SEARCH_LIMIT at most
+        - *cursor* - cursor returned by previous search to continue it
+
+        :returns: Newline-delimited JSON: objects with node, source,
+            date, level and text of found entries in order of nodes,
+            sources and dates, and the last object with cursor to
+            continue search (null if nothing is left) and has_more.
+        :http: * 200 (OK)
+               * 400 (invalid *source* value)
+               * 400 (invalid *node* value)
+               * 400 (invalid *regexp* value)
+               * 400 (invalid *date_before* value)
+               * 400 (invalid *date_after* value)
+               * 400 (invalid *limit* value)
+               * 400 (invalid *cursor* value)
+               * 404 (log source not found)
+               * 404 (node not found)
+               * 500 (invalid regular expression in config)
+        """
+        user_data = web.input()
+        date_before = get_date_param(user_data, 'date_before')
+        date_after = get_date_param(user_data, 'date_after')
+
+        source_ids = filter(None, user_data.get('source', '').split(','))
+        if not source_ids:
+            raise web.badrequest("'source' must be specified")
+        log_configs = []
+        for source_id in source_ids:
+            log_config = log_parsers.get_source(source_id)
+            if not log_config or (log_config.get('fake') and
+                                  not settings.FAKE_TASKS):
+                logger.debug("Log source %r not found", source_id)
+                raise web.notfound("Log source not found")
+            log_configs.append(log_config)
+
+        nodes = []
+        if any(lc['remote'] and not lc.get('fake') for lc in log_configs):
+            try:
+                node_ids = set(
+                    int(node_id) for node_id in
+                    user_data.get('node', '').split(',') if node_id
+                )
+            except ValueError:
+                raise web.badrequest("Invalid 'node' value")
+            if not node_ids:
+                raise web.badrequest("'node' must be specified")
+            nodes = db().query(Node).filter(Node.id.in_(node_ids)).all()
+            if len(nodes) != len(node_ids):
+                raise web.notfound("Node not found")
+
+        files = []
+        for log_config in log_configs:
+            try:
+                parser = log_parsers.get(log_config)
+            except re.error as e:
+                logger.error('Invalid regular expression for file %r: %s',
+                             log_config['id'], e)
+                raise web.internalerror(
+                    "Invalid regular expression in config")
+            if not log_config['remote'] or log_config.get('fake'):
+                files.append(
+                    SearchedFile(log_config['path'], log_config, parser))
+                continue
+            for node in nodes:
+                node_log_dir = get_node_log_dir(log_config, node)
+                # nodes without ip have no logs yet
+                if node.ip and node_log_dir:
+                    files.append(SearchedFile(
+                        os.path.join(node_log_dir, log_config['path']),
+                        log_config, parser, node.id))
+
+        regexp = user_data.get('regexp')
+        if regexp:
+            try:
+                regexp = re.compile(regexp)
+            except re.error:
+                raise web.badrequest("Invalid 'regexp' value")
+        levels = None
+        if user_data.get('levels'):
+            levels = set(
+                level.upper() for level in user_data.levels.split(',')
+            )
+        limit = self.get_int_param(user_data, 'limit')
+        if not limit or limit > settings.LOG_SEARCH_LIMIT:
+            limit = settings.LOG_SEARCH_LIMIT
+        cursor = user_data.get('cursor') or None
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                raise web.badrequest("Invalid 'cursor' value")
+
+        search = LogSearch(
+            files,
+            text=user_data.get('text') or None,
+            regexp=regexp or None,
+            levels=levels,
+            date_after=date_after,
+            date_before=date_before,
+            scrub_patterns=log_parsers.get_scrub_patterns(),
+            limit=limit
+        )
+        web.header('Content-Type', 'application/x-ndjson')
+        return self._stream_results(search, cursor)
+
+    @classmethod
+    def _stream_results(cls, search, cursor):
+        for entry in search.entries(cursor):
+            yield json.dumps(entry) + '\n'
+        yield json.dumps({
+            'cursor': search.cursor,
+            'has_more': search.cursor is not None
+        }) + '\n'
+
+
 class LogPackageHandler(object):
     """Log package handler
     """
@@ -329,23 +434,37 @@ class LogSourceByNodeCollectionHandler(JSONHandler):
                * 404 (node not found in db)
         """
         node = self.get_object_or_404(Node, node_id)
+        return get_node_log_sources(node)
 
-        def getpath(x):
-            if x.get('fake'):
-                if settings.FAKE_TASKS:
-                    return x['path']
-                else:
-                    return ''
-            else:
-                if node.status == "discover":
-                    ndir = node.ip
-                else:
-                    ndir = node.fqdn
-                return os.path.join(x['base'], ndir, x['path'])
-
-        f = lambda x: (
-            x.get('remote') and x.get('path') and x.get('base') and
-            os.access(getpath(x), os.R_OK) and os.path.isfile(getpath(x))
+
+class LogSourceByNodesCollectionHandler(JSONHandler):
+    """Log sources of many nodes handler
+    """
+
+    @content_json
+    def GET(self):
+        """Receives following parameters:
+
+        - *nodes* - comma separated node ids
+
+        :returns: Ids of log sources by node ids.
+        :http: * 200 (OK)
+               * 400 (invalid *nodes* value)
+               * 404 (node not found in db)
+        """
+        try:
+            node_ids = set(
+                int(node_id) for node_id in
+                web.input(nodes='').nodes.split(',') if node_id
+            )
+        except ValueError:
+            raise web.badrequest("Invalid 'nodes' value")
+        if not node_ids:
+            raise web.badrequest("'nodes' must be specified")
+        nodes = db().query(Node).filter(Node.id.in_(node_ids)).all()
+        if len(nodes) != len(node_ids):
+            raise web.notfound("Node not found")
+        return dict(
+            (node.id, [lc['id'] for lc in get_node_log_sources(node)])
+            for node in nodes
         )
-        sources = filter(f, settings.LOGS)
-        return sources
@@ -22,6 +22,7 @@ from datetime import datetime
 import json
 import traceback
 
+from sqlalchemy.orm import defer
 from sqlalchemy.orm import joinedload
 
 import web
@@ -36,6 +37,7 @@ from nailgun.api.models import NodeNICInterface
 from nailgun.api.validators.network import NetAssignmentValidator
 from nailgun.api.validators.node import NodeValidator
 from nailgun.db import db
+from nailgun.keepalive.liveness import node_liveness
 from nailgun.logger import logger
 from nailgun.network.manager import NetworkManager
 from nailgun.network.topology import TopoChecker
@@ -152,6 +154,39 @@ class NodeCollectionHandler(JSONHandler):
 
     validator = NodeValidator
 
+    # how many nodes are loaded from db at once
+    # while collection is streamed to client
+    stream_chunk_size = 100
+
+    # relations which should be loaded to render field
+    fields_relations = {
+        'roles': ('role_list',),
+        'pending_roles': ('pending_role_list',),
+        'cluster': ('cluster',),
+        'network_data': (
+            'cluster',
+            'interfaces',
+            'interfaces.assigned_networks'
+        ),
+    }
+
+    # columns which should be loaded to render field
+    fields_columns = {
+        'cluster': ('cluster_id',),
+        'network_data': ('cluster_id',),
+    }
+
+    @classmethod
+    def _render_node(cls, node, network_manager, ips_mapped,
+                     networks_grouped, fields=None, with_network_data=True):
+        json_data = JSONHandler.render(node, fields=fields or cls.fields)
+        if with_network_data:
+            json_data['network_data'] = network_manager.\
+                get_node_networks_optimized(
+                    node, ips_mapped.get(node.id, []),
+                    networks_grouped.get(node.cluster_id, []))
+        return json_data
+
     @classmethod
     def render(cls, nodes, fields=None):
         json_list = []
@@ -160,43 +195,168 @@ class NodeCollectionHandler(JSONHandler):
         networks_grouped = network_manager.get_networks_grouped_by_cluster()
 
         for node in nodes:
-            json_data = None
             try:
-                json_data = JSONHandler.render(node, fields=cls.fields)
-
-                json_data['network_data'] = network_manager.\
-                    get_node_networks_optimized(
-                        node, ips_mapped.get(node.id, []),
-                        networks_grouped.get(node.cluster_id, []))
-                json_list.append(json_data)
+                json_list.append(cls._render_node(
+                    node, network_manager, ips_mapped, networks_grouped))
             except Exception:
                 logger.error(traceback.format_exc())
         return json_list
 
+    @classmethod
+    def render_stream(cls, nodes_query, fields=None, with_network_data=True,
+                      limit=None, offset=None):
+        """Renders JSON array of nodes chunk by chunk, so only
+        stream_chunk_size nodes are kept in memory at a time.
+
+        :param nodes_query: Query for nodes with all needed joins.
+        :param fields: Node fields to render.
+        :param with_network_data: Render network_data of nodes or not.
+        :param limit: Max number of nodes to render.
+        :param offset: Number of nodes to skip.
+        :yields: parts of JSON document.
+        """
+        network_manager = NetworkManager()
+        networks_grouped = {}
+        if with_network_data:
+            networks_grouped = \
+                network_manager.get_networks_grouped_by_cluster()
+
+        yield '['
+        separator = ''
+        last_id = None
+        while limit is None or limit > 0:
+            chunk_size = cls.stream_chunk_size
+            if limit is not None:
+                chunk_size = min(chunk_size, limit)
+            chunk = nodes_query.order_by(Node.id)
+            if last_id is not None:
+                chunk = chunk.filter(Node.id > last_id)
+            elif offset:
+                chunk = chunk.offset(offset)
+            nodes = chunk.limit(chunk_size).all()
+            if not nodes:
+                break
+            last_id = nodes[-1].id
+            if limit is not None:
+                limit -= len(nodes)
+            ips_mapped = {}
+            if with_network_data:
+                ips_mapped = network_manager.get_grouped_ips_by_node(
+                    [n.id for n in nodes])
+            for node in nodes:
+                try:
+                    json_data = cls._render_node(
+                        node, network_manager, ips_mapped, networks_grouped,
+                        fields=fields, with_network_data=with_network_data)
+                except Exception:
+                    logger.error(traceback.format_exc())
+                    continue
+                yield separator + json.dumps(json_data)
+                separator = ', '
+        yield ']'
+
+    def _get_projection(self, fields_param):
+        """Parses comma separated list of requested fields.
+
+        :returns: tuple of node fields to render and
+            flag if network_data is requested.
+        """
+        if not fields_param:
+            return self.fields, True
+        requested = set(f.strip() for f in fields_param.split(',')) - \
+            set([''])
+        invalid = requested - set(self.fields) - set(['network_data'])
+        if invalid:
+            raise web.badrequest(
+                "Invalid fields: {0}".format(', '.join(sorted(invalid))))
+        fields = tuple(
+            f for f in self.fields if f in requested or f == 'id')
+        return fields, 'network_data' in requested
+
+    def _nodes_query(self, fields, with_network_data):
+        """Query for nodes which loads only columns and relations
+        needed to render given fields.
+        """
+        all_fields = list(fields)
+        if with_network_data:
+            all_fields.append('network_data')
+        relations = set()
+        columns = set(['id'])
+        for field in all_fields:
+            relations.update(self.fields_relations.get(field, ()))
+            columns.update(self.fields_columns.get(field, (field,)))
+
+        options = [joinedload(r) for r in sorted(relations)]
+        options.extend(
+            defer(column.name) for column in Node.__table__.columns
+            if column.name not in columns
+        )
+        return db().query(Node).options(*options)
+
     @content_json
     def GET(self):
         """May receive cluster_id parameter to filter list
-        of nodes
+        of nodes. Nodes are streamed to client one by one
+        ordered by id.
+
+        Optional parameters:
+        fields - comma separated list of fields to render
+        (node fields and 'network_data'), 'id' is always rendered;
+        limit, offset - return only part of collection;
+        after_id - return only nodes with greater id;
+        since - return only nodes changed since this revision
+        wrapped into {"revision": ..., "ids": [...], "items": [...]},
+        where ids are ids of all nodes matching cluster_id; all
+        changed nodes are returned at once, so since can't be used
+        with limit, offset and after_id.
 
         :returns: Collection of JSONized Node objects.
         :http: * 200 (OK)
+               * 400 (invalid fields, pagination or revision values)
         """
-        user_data = web.input(cluster_id=None)
-        nodes = db().query(Node).options(
-            joinedload('cluster'),
-            joinedload('interfaces'),
-            joinedload('interfaces.assigned_networks'),
-            joinedload('role_list'),
-            joinedload('pending_role_list'))
-        if user_data.cluster_id == '':
-            nodes = nodes.filter_by(
-                cluster_id=None).all()
-        elif user_data.cluster_id:
-            nodes = nodes.filter_by(
-                cluster_id=user_data.cluster_id).all()
-        else:
-            nodes = nodes.all()
-        return self.render(nodes)
+        user_data = web.input(cluster_id=None, fields=None)
+        fields, with_network_data = self._get_projection(user_data.fields)
+        limit = self.get_int_param(user_data, 'limit')
+        offset = self.get_int_param(user_data, 'offset')
+        after_id = self.get_int_param(user_data, 'after_id')
+        since = self.get_int_param(user_data, 'since')
+
+        def filter_nodes(query):
+            if user_data.cluster_id == '':
+                query = query.filter_by(cluster_id=None)
+            elif user_data.cluster_id:
+                query = query.filter_by(cluster_id=user_data.cluster_id)
+            return query
+
+        if since is not None:
+            # the next poll starts from revision of this one, so
+            # changes which didn't fit into a page would be lost
+            if limit is not None or offset is not None \
+                    or after_id is not None:
+                raise web.badrequest(
+                    "'limit', 'offset' and 'after_id' "
+                    "can't be used with 'since'")
+            revision = self.get_revision()
+
+        nodes = filter_nodes(self._nodes_query(fields, with_network_data))
+        if after_id is not None:
+            nodes = nodes.filter(Node.id > after_id)
+        if since is not None:
+            nodes = nodes.filter(Node.revision >= since)
+
+        items = self.render_stream(
+            nodes,
+            fields=fields,
+            with_network_data=with_network_data,
+            limit=limit,
+            offset=offset
+        )
+        if since is None:
+            return items
+
+        ids = [node_id for (node_id,) in filter_nodes(
+            db().query(Node.id)).order_by(Node.id)]
+        return self.render_changes(revision, ids, items)
 
     @content_json
     def POST(self):
@@ -230,7 +390,7 @@ class NodeCollectionHandler(JSONHandler):
             if key == "id":
                 continue
             elif key == "meta":
-                node.create_meta(value)
+                node.create_meta(value, digest=Node.get_meta_digest(value))
             else:
                 setattr(node, key, value)
 
@@ -321,6 +481,7 @@ class NodeCollectionHandler(JSONHandler):
         nodes_updated = []
         for nd in data:
             is_agent = nd.pop("is_agent") if "is_agent" in nd else False
+            meta_digest = nd.pop("meta_digest", None)
             node = None
             if "mac" in nd:
                 node = q.filter_by(mac=nd["mac"]).first() \
@@ -328,14 +489,18 @@ class NodeCollectionHandler(JSONHandler):
             else:
                 node = q.get(nd["id"])
             if is_agent:
-                node.timestamp = datetime.now()
-                if not node.online:
-                    node.online = True
-                    msg = u"Node '{0}' is back online".format(
-                        node.human_readable_name)
-                    logger.info(msg)
-                    notifier.notify("discover", msg, node_id=node.id)
-                db().commit()
+                # check-in time is written to database lazily, node
+                # is switched back online by the flush below
+                node_liveness.touch(node.id, online=node.online)
+            if "meta" in nd and not meta_digest:
+                meta_digest = Node.get_meta_digest(nd["meta"])
+            # agent reports the same meta every run, volumes and NICs
+            # are already built from it, so only liveness is updated
+            meta_unchanged = is_agent and meta_digest is not None \
+                and meta_digest == node.meta_digest \
+                and not ("roles" in nd or "cluster_id" in nd)
+            if meta_unchanged:
+                nd.pop("meta", None)
             old_cluster_id = node.cluster_id
 
             if nd.get("pending_roles") == [] and node.cluster:
@@ -356,51 +521,17 @@ class NodeCollectionHandler(JSONHandler):
                     )
                     continue
                 if key == "meta":
-                    node.update_meta(value)
+                    node.update_meta(value, digest=meta_digest)
                 else:
                     setattr(node, key, value)
+            if node.status in ('provisioning', 'deploying'):
+                # volumes aren't regenerated during deployment,
+                # so the same meta should be processed again later
+                node.meta_digest = None
             db().commit()
-            if not node.attributes:
-                node.attributes = NodeAttributes()
-                db().commit()
-            if not node.attributes.volumes:
-                node.attributes.volumes = \
-                    node.volume_manager.gen_volumes_info()
-                db().commit()
-            if not node.status in ('provisioning', 'deploying'):
-                variants = (
-                    "disks" in node.meta and
-                    len(node.meta["disks"]) != len(
-                        filter(
-                            lambda d: d["type"] == "disk",
-                            node.attributes.volumes
-                        )
-                    ),
-                    "roles" in nd,
-                    "cluster_id" in nd
-                )
-                if any(variants):
-                    try:
-                        node.attributes.volumes = \
-                            node.volume_manager.gen_volumes_info()
-                        if node.cluster:
-                            node.cluster.add_pending_changes(
-                                "disks",
-                                node_id=node.id
-                            )
-                    except Exception as exc:
-                        msg = (
-                            "Failed to generate volumes "
-                            "info for node '{0}': '{1}'"
-                        ).format(
-                            node.name or data.get("mac") or data.get("id"),
-                            str(exc) or "see logs for details"
-                        )
-                        logger.warning(traceback.format_exc())
-                        notifier.notify("error", msg, node_id=node.id)
-
-                db().commit()
-            if is_agent:
+            if not meta_unchanged:
+                self._update_volumes(node, nd)
+            if is_agent and not meta_unchanged:
                 # Update node's NICs.
                 if node.meta and 'interfaces' in node.meta:
                     # we won't update interfaces if data is invalid
@@ -417,6 +548,8 @@ class NodeCollectionHandler(JSONHandler):
                         node)
                     network_manager.assign_networks_to_main_interface(node)
 
+        node_liveness.flush()
+
         # we need eagerload everything that is used in render
         nodes = db().query(Node).options(
             joinedload('cluster'),
@@ -425,6 +558,48 @@ class NodeCollectionHandler(JSONHandler):
             filter(Node.id.in_([n.id for n in nodes_updated])).all()
         return self.render(nodes)
 
+    def _update_volumes(self, node, nd):
+        if not node.attributes:
+            node.attributes = NodeAttributes()
+            db().commit()
+        if not node.attributes.volumes:
+            node.attributes.volumes = \
+                node.volume_manager.gen_volumes_info()
+            db().commit()
+        if not node.status in ('provisioning', 'deploying'):
+            variants = (
+                "disks" in node.meta and
+                len(node.meta["disks"]) != len(
+                    filter(
+                        lambda d: d["type"] == "disk",
+                        node.attributes.volumes
+                    )
+                ),
+                "roles" in nd,
+                "cluster_id" in nd
+            )
+            if any(variants):
+                try:
+                    node.attributes.volumes = \
+                        node.volume_manager.gen_volumes_info()
+                    if node.cluster:
+                        node.cluster.add_pending_changes(
+                            "disks",
+                            node_id=node.id
+                        )
+                except Exception as exc:
+                    msg = (
+                        "Failed to generate volumes "
+                        "info for node '{0}': '{1}'"
+                    ).format(
+                        node.name or nd.get("mac") or nd.get("id"),
+                        str(exc) or "see logs for details"
+                    )
+                    logger.warning(traceback.format_exc())
+                    notifier.notify("error", msg, node_id=node.id)
+
+            db().commit()
+
 
 class NodeNICsHandler(JSONHandler):
     """Node network interfaces handler
@@ -18,6 +18,7 @@
 Handlers dealing with notifications
 """
 
+from sqlalchemy import func
 import web
 
 from nailgun.api.handlers.base import content_json
@@ -88,37 +89,135 @@ class NotificationCollectionHandler(JSONHandler):
 
     validator = NotificationValidator
 
+    def _filtered_query(self, user_data):
+        """Query for notifications matching topic, status,
+        cluster_id and node_id parameters of request.
+
+        :raises: web.badrequest
+        """
+        query = db().query(Notification)
+        for name, values in (
+            ('topic', Notification.NOTIFICATION_TOPICS),
+            ('status', Notification.NOTIFICATION_STATUSES)
+        ):
+            value = user_data.get(name)
+            if not value:
+                continue
+            requested = set(v.strip() for v in value.split(','))
+            if requested - set(values):
+                raise web.badrequest("Invalid '{0}' value".format(name))
+            query = query.filter(
+                getattr(Notification, name).in_(requested))
+        for name in ('cluster_id', 'node_id'):
+            value = self.get_int_param(user_data, name)
+            if value is not None:
+                query = query.filter(
+                    getattr(Notification, name) == value)
+        return query
+
     @content_json
     def GET(self):
-        """:returns: Collection of JSONized Notification objects.
+        """Notifications are returned from the newest to the oldest.
+        They may be filtered by topic, status, cluster_id and node_id
+        parameters, topic and status may be comma separated lists.
+        To get the next page pass id of the last received notification
+        as before parameter.
+
+        If since parameter is specified, only notifications
+        changed since this revision are returned wrapped into
+        {"revision": ..., "ids": [...], "items": [...]}, the same
+        filters are applied to both items and ids. All changes are
+        returned at once, so limit and before can't be used with since.
+
+        :returns: Collection of JSONized Notification objects.
         :http: * 200 (OK)
+               * 400 (invalid parameter value)
         """
-        user_data = web.input(limit=settings.MAX_ITEMS_PER_PAGE)
-        limit = user_data.limit
-        query = db().query(Notification).limit(limit)
-        notifications = query.all()
-        return map(
-            NotificationHandler.render,
-            notifications
+        user_data = web.input()
+        limit = self.get_int_param(user_data, 'limit')
+        before = self.get_int_param(user_data, 'before')
+        since = self.get_int_param(user_data, 'since')
+        query = self._filtered_query(user_data)
+        if since is None:
+            if limit is None:
+                limit = settings.MAX_ITEMS_PER_PAGE
+            if before is not None:
+                query = query.filter(Notification.id < before)
+            notifications = query.order_by(
+                Notification.id.desc()
+            ).limit(limit).all()
+            return map(
+                NotificationHandler.render,
+                notifications
+            )
+
+        # the next poll starts from revision of this one, so changes
+        # which didn't fit into a page would be lost
+        if limit is not None or before is not None:
+            raise web.badrequest(
+                "'limit' and 'before' can't be used with 'since'")
+        revision = self.get_revision()
+        notifications = query.filter(
+            Notification.revision >= since
+        ).order_by(Notification.id).all()
+        ids = [n_id for (n_id,) in query.with_entities(
+            Notification.id).order_by(Notification.id)]
+        return self.render_changes(
+            revision,
+            ids,
+            map(NotificationHandler.render, notifications)
         )
 
     @content_json
     def PUT(self):
-        """:returns: Collection of JSONized Notification objects.
+        """Notifications are updated with one UPDATE statement
+        per requested status.
+
+        :returns: Collection of JSONized Notification objects.
         :http: * 200 (OK)
                * 400 (invalid data specified for collection update)
         """
-        data = self.validator.validate_collection_update(web.data())
-        q = db().query(Notification)
-        notifications_updated = []
+        data = self.checked_data(
+            self.validator.validate_collection_update
+        )
+        ids_by_status = {}
         for nd in data:
-            notification = q.get(nd["id"])
-            for key, value in nd.iteritems():
-                setattr(notification, key, value)
-            notifications_updated.append(notification)
-            db().add(notification)
+            ids_by_status.setdefault(nd["status"], set()).add(nd["id"])
+        for status, ids in ids_by_status.iteritems():
+            db().query(Notification).filter(
+                Notification.id.in_(ids)
+            ).filter(
+                Notification.status != status
+            ).update({"status": status}, synchronize_session=False)
         db().commit()
-        return map(
-            NotificationHandler.render,
-            notifications_updated
-        )
+
+        ids = [nd["id"] for nd in data]
+        notifications = {}
+        if ids:
+            notifications = dict(
+                (n.id, n) for n in db().query(Notification).filter(
+                    Notification.id.in_(ids)
+                )
+            )
+        return [
+            NotificationHandler.render(notifications[n_id])
+            for n_id in ids
+        ]
+
+
+class NotificationUnreadCountHandler(JSONHandler):
+    """Number of unread notifications, e.g. for UI badge
+    which doesn't need notifications themselves.
+    """
+
+    @content_json
+    def GET(self):
+        """:returns: {"unread": <number of unread notifications>}
+        :http: * 200 (OK)
+        """
+        # served by partial index on unread notifications
+        return {
+            "unread": db().query(func.count(Notification.id)).filter(
+                Notification.status == 'unread'
+            ).scalar()
+        }
@@ -25,6 +25,7 @@ import web
 from nailgun.api.handlers.base import content_json
 from nailgun.api.handlers.base import JSONHandler
 from nailgun.api.models import Release
+from nailgun.api.models import Role
 from nailgun.api.validators.release import ReleaseValidator
 from nailgun.db import db
 
@@ -96,7 +97,16 @@ class ReleaseCollectionHandler(JSONHandler):
     def GET(self):
         """:returns: Collection of JSONized Release objects.
         :http: * 200 (OK)
+               * 304 (releases weren't changed since ETag of client)
         """
+        # roles are rows of their own table, so changing them
+        # doesn't bump revision of release
+        self.check_etag(
+            db().query(
+                Release.id, Release.revision).order_by(Release.id).all(),
+            db().query(
+                Role.id, Role.release_id, Role.name).order_by(Role.id).all()
+        )
         return map(
             ReleaseHandler.render,
             db().query(Release).all()
@@ -77,22 +77,38 @@ class TaskCollectionHandler(JSONHandler):
     @content_json
     def GET(self):
         """May receive cluster_id parameter to filter list
-        of tasks
+        of tasks. If since parameter is specified, only tasks
+        changed since this revision are returned wrapped into
+        {"revision": ..., "ids": [...], "items": [...]}.
 
         :returns: Collection of JSONized Task objects.
         :http: * 200 (OK)
+               * 400 (invalid since value)
                * 404 (task not found in db)
         """
         user_data = web.input(cluster_id=None)
-        if user_data.cluster_id == '':
-            tasks = db().query(Task).filter_by(
-                cluster_id=None).all()
-        elif user_data.cluster_id:
-            tasks = db().query(Task).filter_by(
-                cluster_id=user_data.cluster_id).all()
-        else:
-            tasks = db().query(Task).all()
-        return map(
-            TaskHandler.render,
-            tasks
+        since = self.get_int_param(user_data, 'since')
+
+        def filter_tasks(query):
+            if user_data.cluster_id == '':
+                query = query.filter_by(cluster_id=None)
+            elif user_data.cluster_id:
+                query = query.filter_by(cluster_id=user_data.cluster_id)
+            return query
+
+        if since is None:
+            return map(
+                TaskHandler.render,
+                filter_tasks(db().query(Task)).all()
+            )
+
+        revision = self.get_revision()
+        tasks = filter_tasks(db().query(Task)).filter(
+            Task.revision >= since).order_by(Task.id).all()
+        ids = [task_id for (task_id,) in filter_tasks(
+            db().query(Task.id)).order_by(Task.id)]
+        return self.render_changes(
+            revision,
+            ids,
+            map(TaskHandler.render, tasks)
         )
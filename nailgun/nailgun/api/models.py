@@ -14,7 +14,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from bisect import bisect_right
 from copy import deepcopy
+import hashlib
+import json
 from random import choice
 import string
 import uuid
@@ -22,21 +25,29 @@ import uuid
 from netaddr import IPAddress
 from netaddr import IPNetwork
 
+from sqlalchemy import BigInteger
 from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import Float
+from sqlalchemy import func
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy import Text
 from sqlalchemy import Unicode
 from sqlalchemy import UniqueConstraint
+from sqlalchemy import event
 from sqlalchemy import ForeignKey, Enum, DateTime
+from sqlalchemy.orm import object_session
 from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm import Session
 from sqlalchemy.ext.declarative import declarative_base
 import web
 
 from nailgun.api.fields import JSON
 from nailgun.db import db
+from nailgun.db import has_pending_invalidation
+from nailgun.db import register_cache_invalidation
 from nailgun.logger import logger
 from nailgun.settings import settings
 from nailgun.volumes.manager import VolumeManager
@@ -45,6 +56,21 @@ from nailgun.volumes.manager import VolumeManager
 Base = declarative_base()
 
 
+class RevisionMixin(object):
+    """Every insert and update of object sets its revision to id
+    of transaction which changes it, so clients can ask only for
+    objects changed since known revision. Unlike values drawn from
+    a sequence, ids of transactions which are still in progress
+    are known to other transactions, see JSONHandler.get_revision.
+    """
+    revision = Column(
+        BigInteger,
+        default=func.txid_current(),
+        onupdate=func.txid_current(),
+        index=True
+    )
+
+
 class NodeRoles(Base):
     __tablename__ = 'node_roles'
     id = Column(Integer, primary_key=True)
@@ -72,7 +98,7 @@ class GlobalParameters(Base):
     parameters = Column(JSON, default={})
 
 
-class Release(Base):
+class Release(RevisionMixin, Base):
     __tablename__ = 'releases'
     __table_args__ = (
         UniqueConstraint('name', 'version'),
@@ -126,7 +152,7 @@ class ClusterChanges(Base):
     )
 
 
-class Cluster(Base):
+class Cluster(RevisionMixin, Base):
     __tablename__ = 'clusters'
     MODES = ('multinode', 'ha_full', 'ha_compact')
     STATUSES = ('new', 'deployment', 'operational', 'error', 'remove')
@@ -255,7 +281,7 @@ class Cluster(Base):
                 node.id, len(node.meta.get('interfaces', [])))
 
 
-class Node(Base):
+class Node(RevisionMixin, Base):
     __tablename__ = 'nodes'
     NODE_STATUSES = (
         'ready',
@@ -279,6 +305,8 @@ class Node(Base):
         default='discover'
     )
     meta = Column(JSON, default={})
+    # digest of the last meta accepted from agent
+    meta_digest = Column(String(32))
     mac = Column(String(17), nullable=False, unique=True)
     ip = Column(String(15))
     fqdn = Column(String(255))
@@ -392,7 +420,13 @@ class Node(Base):
             iface[param] = val
         return iface
 
-    def update_meta(self, data):
+    @classmethod
+    def get_meta_digest(cls, data):
+        """Returns digest of meta as it is received from agent.
+        """
+        return hashlib.md5(json.dumps(data, sort_keys=True)).hexdigest()
+
+    def update_meta(self, data, digest=None):
         # helper for basic checking meta before updation
         result = []
         for iface in data["interfaces"]:
@@ -403,13 +437,15 @@ class Node(Base):
                 )
                 data["interfaces"] = self.meta.get("interfaces")
                 self.meta = data
+                self.meta_digest = digest
                 return
             result.append(self._clean_iface(iface))
 
         data["interfaces"] = result
         self.meta = data
+        self.meta_digest = digest
 
-    def create_meta(self, data):
+    def create_meta(self, data, digest=None):
         # helper for basic checking meta before creation
         result = []
         for iface in data["interfaces"]:
@@ -423,6 +459,7 @@ class Node(Base):
 
         data["interfaces"] = result
         self.meta = data
+        self.meta_digest = digest
 
 
 class NodeAttributes(Base):
@@ -511,6 +548,65 @@ class NetworkGroup(Base):
         backref="network_group"
     )
 
+    # {network_group_id: ([first, ...], [last, ...])}
+    _ip_ranges_bounds = {}
+    # bumped on reset, so bounds which were being built
+    # from already changed ranges aren't cached
+    _ip_ranges_generation = 0
+
+    @property
+    def ip_ranges_bounds(self):
+        """Integer bounds of ip_ranges sorted by first address,
+        overlapping ranges are merged. Bounds are cached per
+        network group until changes of ranges are committed.
+        Session which changed ranges and didn't commit them yet
+        doesn't use cache.
+
+        :returns: tuple of two lists: first and last addresses.
+        """
+        session = object_session(self)
+        changed = session is not None and \
+            has_pending_invalidation(session, IPAddrRange)
+        generation = self._ip_ranges_generation
+        bounds = None if changed else self._ip_ranges_bounds.get(self.id)
+        if bounds is None:
+            firsts, lasts = [], []
+            for first, last in sorted(
+                (int(IPAddress(ir.first)), int(IPAddress(ir.last)))
+                for ir in self.ip_ranges
+            ):
+                if lasts and first <= lasts[-1] + 1:
+                    lasts[-1] = max(lasts[-1], last)
+                else:
+                    firsts.append(first)
+                    lasts.append(last)
+            bounds = (firsts, lasts)
+            if not changed and generation == self._ip_ranges_generation:
+                self._ip_ranges_bounds[self.id] = bounds
+        return bounds
+
+    @classmethod
+    def reset_ip_ranges_bounds(cls):
+        cls._ip_ranges_generation += 1
+        cls._ip_ranges_bounds.clear()
+
+    def ips_in_ranges(self, ips):
+        """Checks if IP addresses belong to any of ip_ranges.
+
+        :param ips: iterable of IP addresses (strings or ints).
+        :returns: list of booleans in the same order.
+        """
+        firsts, lasts = self.ip_ranges_bounds
+        result = []
+        for ip in ips:
+            ip = int(IPAddress(ip))
+            i = bisect_right(firsts, ip) - 1
+            result.append(i >= 0 and ip <= lasts[i])
+        return result
+
+    def ip_in_ranges(self, ip):
+        return self.ips_in_ranges([ip])[0]
+
     @classmethod
     def generate_vlan_ids_list(cls, ng):
         if ng["vlan_start"] is None:
@@ -524,6 +620,34 @@ class NetworkGroup(Base):
         return vlans
 
 
+# range could be moved from one group to another,
+# so bounds of all groups are reset
+register_cache_invalidation(
+    IPAddrRange,
+    lambda keys: NetworkGroup.reset_ip_ranges_bounds()
+)
+
+
+def _reset_meta_digest(node, value, oldvalue, initiator):
+    # meta changed not by update_meta() doesn't match digest anymore
+    node.meta_digest = None
+
+
+event.listen(Node.meta, 'set', _reset_meta_digest)
+
+
+def _bump_revisions(session, flush_context, instances):
+    # onupdate fires only when columns of object's own table
+    # are changed, but e.g. changing node roles affects only
+    # association table, so such objects are bumped here
+    for obj in session.dirty:
+        if isinstance(obj, RevisionMixin) and session.is_modified(obj):
+            obj.revision = func.txid_current()
+
+
+event.listen(Session, 'before_flush', _bump_revisions)
+
+
 class NetworkConfiguration(object):
     @classmethod
     def update(cls, cluster, network_configuration):
@@ -589,7 +713,7 @@ class AttributesGenerators(object):
         return str(arg)
 
 
-class Attributes(Base):
+class Attributes(RevisionMixin, Base):
     __tablename__ = 'attributes'
     id = Column(Integer, primary_key=True)
     cluster_id = Column(Integer, ForeignKey('clusters.id'))
@@ -658,7 +782,7 @@ class Attributes(Base):
         return result
 
 
-class Task(Base):
+class Task(RevisionMixin, Base):
     __tablename__ = 'tasks'
     TASK_STATUSES = (
         'ready',
@@ -748,8 +872,15 @@ class Task(Base):
         return task
 
 
-class Notification(Base):
+class Notification(RevisionMixin, Base):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        Index(
+            'notifications_node_task_message_idx',
+            'node_id', 'task_id', 'message_hash'
+        ),
+        Index('notifications_cluster_id_idx', 'cluster_id'),
+    )
 
     NOTIFICATION_STATUSES = (
         'read',
@@ -775,6 +906,9 @@ class Notification(Base):
         nullable=False
     )
     message = Column(Text)
+    # md5 of message, so duplicates are looked up by index
+    # instead of comparison of unbounded texts
+    message_hash = Column(String(32))
     status = Column(
         Enum(*NOTIFICATION_STATUSES, name='notif_status'),
         nullable=False,
@@ -782,6 +916,29 @@ class Notification(Base):
     )
     datetime = Column(DateTime, nullable=False)
 
+    @classmethod
+    def get_message_hash(cls, message):
+        if message is None:
+            return None
+        if isinstance(message, unicode):
+            message = message.encode('utf-8')
+        return hashlib.md5(message).hexdigest()
+
+
+def _set_message_hash(notification, value, oldvalue, initiator):
+    notification.message_hash = Notification.get_message_hash(value)
+
+
+event.listen(Notification.message, 'set', _set_message_hash)
+
+
+# unread notifications are counted on every poll of UI
+Index(
+    'notifications_unread_idx',
+    Notification.id,
+    postgresql_where=(Notification.status == 'unread')
+)
+
 
 class L2Topology(Base):
     __tablename__ = 'l2_topologies'
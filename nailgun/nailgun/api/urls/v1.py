@@ -28,7 +28,9 @@ from nailgun.api.handlers.disks import NodeVolumesInformationHandler
 
 from nailgun.api.handlers.logs import LogEntryCollectionHandler
 from nailgun.api.handlers.logs import LogPackageHandler
+from nailgun.api.handlers.logs import LogSearchHandler
 from nailgun.api.handlers.logs import LogSourceByNodeCollectionHandler
+from nailgun.api.handlers.logs import LogSourceByNodesCollectionHandler
 from nailgun.api.handlers.logs import LogSourceCollectionHandler
 
 from nailgun.api.handlers.network_configuration \
@@ -48,6 +50,7 @@ from nailgun.api.handlers.node import NodeNICsVerifyHandler
 
 from nailgun.api.handlers.notifications import NotificationCollectionHandler
 from nailgun.api.handlers.notifications import NotificationHandler
+from nailgun.api.handlers.notifications import NotificationUnreadCountHandler
 
 from nailgun.api.handlers.orchestrator import DefaultDeploymentInfo
 from nailgun.api.handlers.orchestrator import DefaultProvisioningInfo
@@ -130,6 +133,8 @@ urls = (
 
     r'/notifications/?$',
     NotificationCollectionHandler,
+    r'/notifications/unread/?$',
+    NotificationUnreadCountHandler,
     r'/notifications/(?P<notification_id>\d+)/?$',
     NotificationHandler,
 
@@ -137,8 +142,12 @@ urls = (
     LogEntryCollectionHandler,
     r'/logs/package/?$',
     LogPackageHandler,
+    r'/logs/search/?$',
+    LogSearchHandler,
     r'/logs/sources/?$',
     LogSourceCollectionHandler,
+    r'/logs/sources/nodes/?$',
+    LogSourceByNodesCollectionHandler,
     r'/logs/sources/nodes/(?P<node_id>\d+)/?$',
     LogSourceByNodeCollectionHandler,
 
@@ -46,7 +46,6 @@ class NotificationValidator(BasicValidator):
                 log_message=True
             )
 
-        q = db().query(Notification)
         valid_d = []
         for nd in d:
             valid_nd = {}
@@ -62,13 +61,26 @@ class NotificationValidator(BasicValidator):
                     log_message=True
                 )
 
-            if not q.get(nd["id"]):
+            if nd["status"] not in Notification.NOTIFICATION_STATUSES:
                 raise errors.InvalidData(
-                    "Invalid ID specified",
+                    "Bad status",
                     log_message=True
                 )
 
             valid_nd["id"] = nd["id"]
             valid_nd["status"] = nd["status"]
             valid_d.append(valid_nd)
+
+        ids = set(nd["id"] for nd in valid_d)
+        if ids:
+            existent = set(
+                n_id for (n_id,) in db().query(Notification.id).filter(
+                    Notification.id.in_(ids)
+                )
+            )
+            if ids - existent:
+                raise errors.InvalidData(
+                    "Invalid ID specified",
+                    log_message=True
+                )
         return valid_d
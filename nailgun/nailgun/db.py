@@ -15,9 +15,12 @@
 #    under the License.
 
 import contextlib
+from itertools import chain
 import web
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from sqlalchemy.orm.query import Query
 
 from nailgun.settings import settings
@@ -34,11 +37,14 @@ class NoCacheQuery(Query):
     """Override for common Query class.
     Needed for automatic refreshing objects
     from database during every query for evading
-    problems with multiple sessions
+    problems with multiple sessions.
+
+    Objects aren't refreshed in session scope (see session_scope()),
+    where identity map of session is trusted.
     """
     def __init__(self, *args, **kwargs):
-        self._populate_existing = True
         super(NoCacheQuery, self).__init__(*args, **kwargs)
+        self._populate_existing = not getattr(self.session, 'in_scope', False)
 
 
 db = scoped_session(
@@ -51,18 +57,161 @@ db = scoped_session(
 )
 
 
-def load_db_driver(handler):
+@contextlib.contextmanager
+def session_scope():
+    """Inside of the block objects already loaded by session aren't
+    reloaded by every query and values cached by cached_in_scope()
+    are reused. The block should be short and finished by commit or
+    rollback, e.g. a web request, so changes made by other sessions
+    are seen in the next block.
+    """
+    session = db()
+    if getattr(session, 'in_scope', False):
+        yield
+        return
+    # scope starts with the state of database, as objects which are
+    # already in identity map would be reloaded by every query
+    session.flush()
+    session.expire_all()
+    session.in_scope = True
+    session.scope_cache = {}
     try:
-        return handler()
-    except web.HTTPError:
-        db().commit()
-        raise
-    except Exception:
-        db().rollback()
-        raise
+        yield
     finally:
-        db().commit()
-        db().expire_all()
+        session.in_scope = False
+        session.scope_cache = {}
+
+
+def cached_in_scope(key, func):
+    """Returns result of func() computed once per session scope.
+    Outside of scope func() is called every time.
+
+    :param key: hashable key of cached value.
+    :param func: callable without arguments.
+    """
+    session = db()
+    if not getattr(session, 'in_scope', False):
+        return func()
+    if key not in session.scope_cache:
+        session.scope_cache[key] = func()
+    return session.scope_cache[key]
+
+
+# (model, on_commit, key, predicate) registered for invalidation
+_cache_invalidations = []
+
+
+def register_cache_invalidation(model, on_commit, key=None, predicate=None):
+    """Calls on_commit after commit of any session which changed
+    objects of model. Process wide caches are shared by all sessions,
+    so they are invalidated only when changes are visible to others,
+    not on flush, and changes of rolled back sessions are forgotten.
+
+    :param model: class of objects which are watched.
+    :param on_commit: callable which gets set of keys of committed
+        changed objects or None if unknown objects were changed by
+        bulk update or delete.
+    :param key: callable which returns key of changed object,
+        keys aren't collected by default.
+    :param predicate: callable(session, obj) which tells whether
+        change of flushed object matters, any change by default.
+    """
+    _cache_invalidations.append((model, on_commit, key, predicate))
+
+
+def has_pending_invalidation(session, model):
+    """:returns: True if session changed objects of model watched by
+    register_cache_invalidation() and didn't commit them yet.
+    """
+    pending = getattr(session, '_pending_invalidations', None)
+    return bool(pending) and any(
+        i in pending and issubclass(watched, model)
+        for i, (watched, _, _, _) in enumerate(_cache_invalidations)
+    )
+
+
+def _pending_invalidations(session):
+    if not hasattr(session, '_pending_invalidations'):
+        session._pending_invalidations = {}
+    return session._pending_invalidations
+
+
+def _collect_invalidations(session, flush_context):
+    changed = list(chain(session.new, session.dirty, session.deleted))
+    for i, (model, on_commit, key, predicate) in \
+            enumerate(_cache_invalidations):
+        for obj in changed:
+            if not isinstance(obj, model) or predicate is not None \
+                    and not predicate(session, obj):
+                continue
+            pending = _pending_invalidations(session)
+            keys = pending.setdefault(i, set())
+            if keys is not None and key is not None:
+                keys.add(key(obj))
+
+
+def _collect_bulk_invalidations(session, query, query_context, result):
+    for i, (model, on_commit, key, predicate) in \
+            enumerate(_cache_invalidations):
+        if any(isinstance(d.get('type'), type) and
+               issubclass(d['type'], model)
+               for d in query.column_descriptions):
+            _pending_invalidations(session)[i] = None
+
+
+def _commit_invalidations(session):
+    pending = getattr(session, '_pending_invalidations', None)
+    if not pending:
+        return
+    session._pending_invalidations = {}
+    for i, keys in sorted(pending.iteritems()):
+        _cache_invalidations[i][1](keys)
+
+
+def _forget_invalidations(session):
+    session._pending_invalidations = {}
+
+
+event.listen(Session, 'after_flush', _collect_invalidations)
+event.listen(Session, 'after_bulk_update', _collect_bulk_invalidations)
+event.listen(Session, 'after_bulk_delete', _collect_bulk_invalidations)
+event.listen(Session, 'after_commit', _commit_invalidations)
+event.listen(Session, 'after_rollback', _forget_invalidations)
+
+
+def load_db_driver(handler):
+    with session_scope():
+        try:
+            result = handler()
+        except web.HTTPError:
+            db().commit()
+            raise
+        except Exception:
+            db().rollback()
+            raise
+        finally:
+            db().commit()
+            db().expire_all()
+    if hasattr(result, 'next'):
+        return _close_after_iteration(result)
+    return result
+
+
+def _close_after_iteration(result):
+    """Streamed response uses db session while it is being
+    iterated by WSGI server, so session is finalized only
+    after the last chunk is sent
+    """
+    with session_scope():
+        try:
+            for chunk in result:
+                yield chunk
+        except Exception:
+            db().rollback()
+            raise
+        finally:
+            db().commit()
+            db().expire_all()
 
 
 def syncdb():
@@ -92,6 +241,13 @@ def dropdb():
         """)]
     for type_ in types:
         db().execute("DROP TYPE IF EXISTS %s CASCADE" % type_)
+
+    # sequences which aren't owned by table columns
+    sequences = [name for (name,) in db().execute(
+        "SELECT sequence_name FROM information_schema.sequences "
+        "WHERE sequence_schema = 'public'")]
+    for sequence in sequences:
+        db().execute("DROP SEQUENCE IF EXISTS %s CASCADE" % sequence)
     db().commit()
 
 
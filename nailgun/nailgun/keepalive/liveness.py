@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from datetime import datetime
+from datetime import timedelta
+import threading
+import time
+
+from sqlalchemy import bindparam
+
+from nailgun.api.models import Node
+from nailgun.db import db
+from nailgun.logger import logger
+from nailgun import notifier
+from nailgun.settings import settings
+
+
+class NodeLiveness(object):
+    """In-memory table of the last agent check-in time of nodes.
+
+    Agents report every minute, so writing node timestamp on every
+    report makes a steady write load only to record liveness. Check-ins
+    are kept here instead and written to nodes table lazily: in batches
+    when enough of them are collected or when flush interval elapsed.
+    Online state is written only on transitions: nodes which went
+    away are switched offline by KeepAliveThread, and offline nodes
+    which checked in are switched back online by flush, which is due
+    right away then.
+    """
+
+    def __init__(self, flush_interval=None, flush_batch=None):
+        self._lock = threading.Lock()
+        # node id -> datetime of the last check-in
+        self._last_seen = {}
+        # ids of nodes which check-ins are not written to database yet
+        self._dirty = set()
+        # ids of nodes which checked in while being offline in database
+        self._returned = set()
+        self._flushed_at = time.time()
+        self.flush_interval = flush_interval \
+            or settings.KEEPALIVE['flush_interval']
+        self.flush_batch = flush_batch or settings.KEEPALIVE['flush_batch']
+
+    def touch(self, node_id, online=True, when=None):
+        """Records check-in of node.
+
+        :param node_id: id of node.
+        :param online: online state of node in database.
+        :param when: datetime of check-in, now by default.
+        """
+        with self._lock:
+            self._last_seen[node_id] = when or datetime.now()
+            self._dirty.add(node_id)
+            if not online:
+                self._returned.add(node_id)
+
+    def last_seen(self, node_id):
+        with self._lock:
+            return self._last_seen.get(node_id)
+
+    def forget(self, node_ids):
+        with self._lock:
+            for node_id in node_ids:
+                self._last_seen.pop(node_id, None)
+                self._dirty.discard(node_id)
+                self._returned.discard(node_id)
+
+    def clear(self):
+        with self._lock:
+            self._last_seen.clear()
+            self._dirty.clear()
+            self._returned.clear()
+            self._flushed_at = time.time()
+
+    def expired(self, node_ids, timeout):
+        """Returns ids of nodes which haven't checked in for timeout
+        seconds. Nodes which were never seen by this process (e.g. it
+        was just started) are considered seen right now, so they have
+        the whole timeout to check in.
+
+        :param node_ids: ids of nodes which should be checked.
+        :param timeout: timeout in seconds.
+        """
+        now = datetime.now()
+        deadline = now - timedelta(seconds=timeout)
+        gone = []
+        with self._lock:
+            for node_id in node_ids:
+                seen = self._last_seen.setdefault(node_id, now)
+                if seen < deadline:
+                    gone.append(node_id)
+        return gone
+
+    def is_flush_due(self):
+        with self._lock:
+            return bool(self._returned) or \
+                len(self._dirty) >= self.flush_batch or \
+                time.time() - self._flushed_at >= self.flush_interval
+
+    def flush(self, force=False):
+        """Writes collected check-in times to nodes table with
+        one batched UPDATE statement and switches nodes which
+        checked in while being offline back online.
+
+        :param force: write even if flush is not due yet.
+        :returns: number of written timestamps.
+        """
+        if not force and not self.is_flush_due():
+            return 0
+        with self._lock:
+            params = [
+                {'node_id': node_id, 'last_seen': self._last_seen[node_id]}
+                for node_id in self._dirty
+            ]
+            returned = list(self._returned)
+            self._dirty.clear()
+            self._returned.clear()
+            self._flushed_at = time.time()
+        if not params:
+            return 0
+
+        if returned:
+            self._switch_online(returned)
+
+        nodes = Node.__table__
+        # timestamp isn't rendered to clients, so explicit revision
+        # value prevents check-ins from bumping it and from making
+        # clients polling for changes reload all nodes every minute
+        db().execute(
+            nodes.update().where(
+                nodes.c.id == bindparam('node_id')
+            ).values(
+                timestamp=bindparam('last_seen'),
+                revision=nodes.c.revision
+            ),
+            params
+        )
+        db().commit()
+        logger.debug("Written check-in times of %d nodes", len(params))
+        return len(params)
+
+    def _switch_online(self, node_ids):
+        to_update = db().query(Node).filter(
+            Node.id.in_(node_ids)
+        ).filter_by(online=False)
+        messages = []
+        for node_db in to_update:
+            msg = u"Node '{0}' is back online".format(
+                node_db.human_readable_name)
+            logger.info(msg)
+            messages.append(
+                {'topic': 'discover', 'message': msg, 'node_id': node_db.id})
+        to_update.update({"online": True}, synchronize_session=False)
+        with notifier.buffered():
+            notifier.notify_many(messages)
+
+
+node_liveness = NodeLiveness()
@@ -14,8 +14,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from datetime import datetime
-from datetime import timedelta
 from itertools import repeat
 from sqlalchemy.sql import not_
 import threading
@@ -24,6 +22,7 @@ import traceback
 
 from nailgun.api.models import Node
 from nailgun.db import db
+from nailgun.keepalive.liveness import node_liveness
 from nailgun.logger import logger
 from nailgun import notifier
 from nailgun.settings import settings
@@ -38,8 +37,8 @@ class KeepAliveThread(threading.Thread):
         self.timeout = timeout or settings.KEEPALIVE['timeout']
 
     def reset_nodes_timestamp(self):
-        db().query(Node).update({'timestamp': datetime.now()})
-        db().commit()
+        # nodes get the whole timeout to check in after start
+        node_liveness.clear()
 
     def join(self, timeout=None):
         self.stop_status_checking.set()
@@ -57,6 +56,7 @@ class KeepAliveThread(threading.Thread):
                 self.reset_nodes_timestamp()
                 while not self.stop_status_checking.isSet():
                     self.update_status_nodes()
+                    node_liveness.flush()
                     self.sleep()
             except Exception:
                 logger.error(traceback.format_exc())
@@ -66,19 +66,28 @@ class KeepAliveThread(threading.Thread):
                 break
 
     def update_status_nodes(self):
-        to_update = db().query(Node).filter(
-            not_(Node.status == 'provisioning')
-        ).filter(
-            datetime.now() > (Node.timestamp + timedelta(seconds=self.timeout))
-        ).filter_by(
-            online=True
-        )
-        for node_db in to_update:
-            notifier.notify(
-                "error",
-                u"Node '{0}' has gone away".format(
-                    node_db.human_readable_name),
-                node_id=node_db.id
+        online_ids = [
+            node_id for (node_id,) in db().query(Node.id).filter(
+                not_(Node.status == 'provisioning')
+            ).filter_by(
+                online=True
             )
-        to_update.update({"online": False})
+        ]
+        gone_ids = node_liveness.expired(online_ids, self.timeout)
+        if not gone_ids:
+            return
+
+        to_update = db().query(Node).filter(Node.id.in_(gone_ids))
+        notifier.notify_many([
+            {
+                'topic': 'error',
+                'message': u"Node '{0}' has gone away".format(
+                    node_db.human_readable_name),
+                'node_id': node_db.id
+            }
+            for node_db in to_update
+        ])
+        to_update.filter_by(
+            online=True
+        ).update({"online": False}, synchronize_session=False)
         db().commit()
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from bisect import bisect_left
+from bisect import bisect_right
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from nailgun.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LogIndex(object):
+    """Sparse index of log file: for every `step` bytes of file
+    it keeps offset and date of the first entry which starts there.
+
+    Index is built by seeking to checkpoints, so only a few lines
+    around every checkpoint are parsed. When file grows index is
+    extended from the last checkpoint, when file is rotated or
+    truncated it's built from scratch.
+    """
+
+    # lines which are read after checkpoint to find entry with date,
+    # e.g. when checkpoint is in the middle of multiline entry
+    max_lines_per_checkpoint = 100
+
+    def __init__(self, path, parse_date, step):
+        """:param path: path to log file.
+        :param parse_date: callable which returns date of line
+            as seconds since epoch or None if line has no date.
+        :param step: distance between checkpoints in bytes.
+        """
+        self.path = path
+        self.parse_date = parse_date
+        self.step = step
+        self.inode = None
+        self.head = None
+        self.size = 0
+        self.offsets = []
+        self.dates = []
+
+    @classmethod
+    def _get_head(cls, f):
+        f.seek(0)
+        return hashlib.md5(f.read(256)).hexdigest()
+
+    def is_valid_for(self, stat, head):
+        """Checks that index describes beginning of current file,
+        i.e. file wasn't rotated or truncated since index was built.
+        """
+        return self.inode == stat.st_ino and self.size <= stat.st_size \
+            and (self.head == head or self.size == 0)
+
+    def update(self):
+        """Builds index or extends it up to the end of file.
+
+        :returns: True if checkpoints of index were changed, growth
+            of file without new checkpoints isn't worth saving.
+        """
+        stat = os.stat(self.path)
+        rebuilt = False
+        with open(self.path, 'rb') as f:
+            head = self._get_head(f)
+            if not self.is_valid_for(stat, head):
+                self.offsets, self.dates = [], []
+                self.size = 0
+                rebuilt = True
+            if self.size == stat.st_size and self.head == head:
+                return rebuilt
+            checkpoints = len(self.offsets)
+            self.inode = stat.st_ino
+            self.head = head
+            self._extend(f, stat.st_size)
+            self.size = stat.st_size
+        return rebuilt or len(self.offsets) != checkpoints
+
+    def _extend(self, f, size):
+        checkpoint = self.offsets[-1] + self.step if self.offsets else 0
+        while checkpoint < size:
+            f.seek(checkpoint)
+            if checkpoint:
+                # skip the rest of line which checkpoint is in
+                f.readline()
+            found = None
+            for i in xrange(self.max_lines_per_checkpoint):
+                offset = f.tell()
+                line = f.readline()
+                if not line.endswith('\n'):
+                    # end of file or line which is being written
+                    break
+                date = self.parse_date(line.rstrip('\n'))
+                if date is not None:
+                    found = (offset, date)
+                    break
+            if found is None:
+                if not line.endswith('\n'):
+                    return
+                checkpoint += self.step
+                continue
+            self.offsets.append(found[0])
+            self.dates.append(found[1])
+            checkpoint = max(found[0] + 1, checkpoint + self.step)
+
+    def bounds(self, date_after=None, date_before=None):
+        """Returns range of bytes (start, end) of file which contains
+        all entries with date_after < date < date_before, assuming
+        dates of entries don't decrease.
+
+        :param date_after: seconds since epoch or None.
+        :param date_before: seconds since epoch or None.
+        """
+        start, end = 0, self.size
+        if date_after is not None:
+            i = bisect_right(self.dates, date_after) - 1
+            if i >= 0:
+                start = self.offsets[i]
+        if date_before is not None:
+            i = bisect_left(self.dates, date_before)
+            if i < len(self.dates):
+                end = self.offsets[i]
+        return start, end
+
+    def dump(self):
+        return {
+            'path': self.path,
+            'step': self.step,
+            'inode': self.inode,
+            'head': self.head,
+            'size': self.size,
+            'offsets': self.offsets,
+            'dates': self.dates
+        }
+
+    def load(self, data):
+        if data.get('path') != self.path or data.get('step') != self.step:
+            return
+        self.inode = data['inode']
+        self.head = data['head']
+        self.size = data['size']
+        self.offsets = data['offsets']
+        self.dates = data['dates']
+
+
+class LogIndexStorage(object):
+    """Indexes of log files kept in memory and saved as sidecar
+    files into index directory, so they survive restarts. If the
+    directory isn't writable indexes are kept only in memory.
+
+    Every index is updated under its own lock, so building index
+    of a big file doesn't block requests for other files.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+        # path -> lock which is held while index of path is updated
+        self._locks = {}
+
+    @classmethod
+    def _sidecar_path(cls, path):
+        return os.path.join(
+            settings.LOG_INDEX_DIR,
+            hashlib.md5(path).hexdigest() + '.json'
+        )
+
+    def _read_sidecar(self, index):
+        try:
+            with open(self._sidecar_path(index.path)) as f:
+                index.load(json.load(f))
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def _write_sidecar(self, index):
+        sidecar = self._sidecar_path(index.path)
+        try:
+            if not os.path.isdir(settings.LOG_INDEX_DIR):
+                os.makedirs(settings.LOG_INDEX_DIR)
+            tmp = sidecar + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(index.dump(), f)
+            os.rename(tmp, sidecar)
+        except (IOError, OSError) as exc:
+            logger.debug("Unable to save index of %s: %s", index.path, exc)
+
+    def get(self, path, parse_date, step=None):
+        """Returns index of log file updated up to the end of file.
+
+        :param path: path to log file.
+        :param parse_date: callable which returns date of line as
+            seconds since epoch or None.
+        :param step: distance between checkpoints in bytes.
+        """
+        step = step or settings.LOG_INDEX_STEP
+        with self._lock:
+            path_lock = self._locks.setdefault(path, threading.Lock())
+        with path_lock:
+            with self._lock:
+                index = self._indexes.get(path)
+            if index is None or index.step != step:
+                index = LogIndex(path, parse_date, step)
+                self._read_sidecar(index)
+                with self._lock:
+                    self._indexes[path] = index
+            index.parse_date = parse_date
+            if index.update():
+                self._write_sidecar(index)
+            return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+log_indexes = LogIndexStorage()
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import calendar
+import copy
+from datetime import datetime
+import re
+import threading
+import time
+
+from nailgun.api.models import RedHatAccount
+from nailgun.db import db
+from nailgun.db import register_cache_invalidation
+from nailgun.settings import settings
+
+
+class DateFormat(object):
+    """Parses and formats dates in strptime format. Formats which
+    consist only of numeric year, month, day, hour, minute and second
+    fields are handled by precompiled regular expression and string
+    formatting, others by time.strptime and time.strftime.
+
+    Dates are represented as (year, month, day, hour, minute, second).
+    """
+
+    # directive -> (width, index in date tuple)
+    fields = {
+        'Y': (4, 0),
+        'm': (2, 1),
+        'd': (2, 2),
+        'H': (2, 3),
+        'M': (2, 4),
+        'S': (2, 5)
+    }
+
+    def __init__(self, date_format):
+        self.date_format = date_format
+        self.regexp = None
+        self.template = None
+        self.order = None
+        # neighbouring entries of log usually have the same date,
+        # so the last parsed and formatted dates are remembered
+        self._last_parsed = (None, None)
+        self._last_formatted = (None, None)
+        self._compile()
+
+    def _compile(self):
+        pattern, template, order = [], [], []
+        chars = iter(self.date_format)
+        for char in chars:
+            if char != '%':
+                pattern.append(re.escape(char))
+                template.append(char)
+                continue
+            directive = next(chars, None)
+            if directive not in self.fields:
+                return
+            width, index = self.fields[directive]
+            pattern.append(r'(\d{%d})' % width)
+            template.append('%%0%dd' % width)
+            order.append(index)
+        if sorted(order) != range(len(self.fields)):
+            return
+        self.regexp = re.compile(''.join(pattern) + r'\Z')
+        self.template = ''.join(template)
+        if order != sorted(order):
+            self.order = order
+
+    @classmethod
+    def _is_valid(cls, date):
+        year, month, day, hour, minute, second = date
+        if not 1 <= month <= 12 or hour > 23 or minute > 59 or second > 61:
+            return False
+        days = calendar.mdays[month]
+        if month == 2 and calendar.isleap(year):
+            days += 1
+        return 1 <= day <= days
+
+    def parse(self, value):
+        """:returns: date tuple.
+        :raises: ValueError if value doesn't match format.
+        """
+        last_value, last_date = self._last_parsed
+        if value == last_value:
+            return last_date
+        date = None
+        if self.regexp is not None:
+            m = self.regexp.match(value)
+            if m is not None:
+                fields = map(int, m.groups())
+                if self.order is not None:
+                    fields = [fields[self.order.index(i)]
+                              for i in xrange(len(fields))]
+                date = tuple(fields)
+                if not self._is_valid(date):
+                    date = None
+        if date is None:
+            date = time.strptime(value, self.date_format)[:6]
+        self._last_parsed = (value, date)
+        return date
+
+    def format(self, date):
+        last_date, last_value = self._last_formatted
+        if date == last_date:
+            return last_value
+        if self.template is None:
+            value = time.strftime(self.date_format,
+                                  datetime(*date).timetuple())
+        elif self.order is None:
+            value = self.template % date
+        else:
+            value = self.template % tuple(date[i] for i in self.order)
+        self._last_formatted = (date, value)
+        return value
+
+
+class LogParser(object):
+    """Parsing rules of one log source: its regular expressions
+    compiled once and date format of its entries.
+
+    :raises: re.error if regular expression of source is invalid.
+    """
+
+    def __init__(self, log_config):
+        # copy is kept to find out that config was changed
+        self.log_config = copy.deepcopy(log_config)
+        self.regexp = re.compile(log_config['regexp'])
+        self.skip_regexp = None
+        if 'skip_regexp' in log_config:
+            self.skip_regexp = re.compile(log_config['skip_regexp'])
+        self.date_format = DateFormat(log_config['date_format'])
+        self.ui_date_format = DateFormat(settings.UI_LOG_DATE_FORMAT)
+
+    def is_skipped(self, entry):
+        return self.skip_regexp is not None and \
+            self.skip_regexp.match(entry) is not None
+
+    def match(self, entry):
+        return self.regexp.match(entry)
+
+    def parse_date(self, value):
+        """:returns: date tuple.
+        :raises: ValueError
+        """
+        return self.date_format.parse(value)
+
+    def format_date(self, date):
+        """:returns: date formatted for UI.
+        """
+        return self.ui_date_format.format(date)
+
+    def entry_time(self, entry):
+        """:returns: date of entry as seconds since epoch
+        or None if entry has no date.
+        """
+        m = self.regexp.match(entry)
+        if m is None:
+            return None
+        try:
+            return calendar.timegm(self.parse_date(m.group('date')))
+        except ValueError:
+            return None
+
+
+class LogParsers(object):
+    """Parsers of log sources cached by source id and patterns which
+    hide Red Hat credentials in log entries.
+
+    Parser is rebuilt when config of its source is changed, patterns
+    are rebuilt after Red Hat accounts are changed by any session of
+    this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._parsers = {}
+        self._sources = None
+        self._sources_by_id = {}
+        self._scrub_patterns = None
+        # bumped on reset, so patterns which were being built
+        # from already changed accounts aren't saved
+        self._scrub_generation = 0
+
+    def get_source(self, source_id):
+        """:returns: config of log source from settings.LOGS or None.
+        """
+        with self._lock:
+            if self._sources is not settings.LOGS or \
+                    len(self._sources_by_id) != len(settings.LOGS):
+                self._sources = settings.LOGS
+                self._sources_by_id = dict(
+                    (lc['id'], lc) for lc in settings.LOGS
+                )
+            return self._sources_by_id.get(source_id)
+
+    def get(self, log_config):
+        """:returns: LogParser of log source.
+        :raises: re.error
+        """
+        with self._lock:
+            parser = self._parsers.get(log_config['id'])
+            if parser is None or parser.log_config != log_config or \
+                    parser.ui_date_format.date_format != \
+                    settings.UI_LOG_DATE_FORMAT:
+                parser = LogParser(log_config)
+                self._parsers[log_config['id']] = parser
+            return parser
+
+    def get_scrub_patterns(self):
+        """:returns: list of (compiled pattern, replacement) pairs
+        for Red Hat usernames and passwords.
+        """
+        patterns = self._scrub_patterns
+        if patterns is not None:
+            return patterns
+        generation = self._scrub_generation
+        accs = db().query(RedHatAccount).all()
+        patterns = []
+        if len(accs) > 0:
+            patterns = [
+                (
+                    re.compile(r"|".join([a.username for a in accs])),
+                    "username"
+                ),
+                (
+                    re.compile(r"|".join([a.password for a in accs])),
+                    "password"
+                )
+            ]
+        with self._lock:
+            if generation == self._scrub_generation:
+                self._scrub_patterns = patterns
+        return patterns
+
+    def reset_scrub_patterns(self):
+        with self._lock:
+            self._scrub_patterns = None
+            self._scrub_generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._parsers.clear()
+            self._sources = None
+            self._sources_by_id = {}
+            self._scrub_patterns = None
+            self._scrub_generation += 1
+
+
+log_parsers = LogParsers()
+
+
+register_cache_invalidation(
+    RedHatAccount,
+    lambda keys: log_parsers.reset_scrub_patterns()
+)
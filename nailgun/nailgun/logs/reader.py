@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mmap
+
+
+def read_backwards(file, bufsize=4096):
+    """Yields lines of file from current position to the beginning
+    of file in reverse order. Lines keep their newline characters.
+    When all lines are read file is positioned at its beginning.
+
+    File is memory-mapped, so lines are found by mmap.rfind without
+    copying file contents; files which can't be mapped are read by
+    chunks of bufsize bytes.
+    """
+    end = file.tell()
+    if not end:
+        return
+    try:
+        mapped = mmap.mmap(file.fileno(), end, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError):
+        lines = _read_backwards_by_chunks(file, end, bufsize)
+    else:
+        lines = _read_backwards_mapped(mapped, end)
+    for line in lines:
+        yield line
+    file.seek(0)
+
+
+def _read_backwards_mapped(mapped, end):
+    try:
+        line_end = end
+        while line_end:
+            # newline at the end of line belongs to this line
+            line_start = mapped.rfind('\n', 0, line_end - 1) + 1
+            yield mapped[line_start:line_end]
+            line_end = line_start
+    finally:
+        mapped.close()
+
+
+def _read_backwards_by_chunks(file, end, bufsize):
+    # parts of current line in reverse order, they are joined only
+    # once when line is complete, so long lines cost linear time
+    parts = []
+    line_end = end
+    pos = end
+    while pos:
+        toread = min(bufsize, pos)
+        pos -= toread
+        file.seek(pos)
+        chunk = file.read(toread)
+        high = len(chunk)
+        while True:
+            limit = min(high, line_end - 1 - pos)
+            newline_pos = chunk.rfind('\n', 0, limit) if limit > 0 else -1
+            if newline_pos == -1:
+                parts.append(chunk[:high])
+                break
+            parts.append(chunk[newline_pos + 1:high])
+            parts.reverse()
+            yield ''.join(parts)
+            parts = []
+            line_end = pos + newline_pos + 1
+            high = newline_pos + 1
+    if parts:
+        parts.reverse()
+        yield ''.join(parts)
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+import calendar
+from collections import deque
+import json
+from multiprocessing.pool import ThreadPool
+import os
+import threading
+
+from nailgun.logs.index import log_indexes
+from nailgun.settings import settings
+
+
+def encode_cursor(key, offset):
+    """:returns: opaque string which points to offset of log file.
+    """
+    return base64.urlsafe_b64encode(json.dumps(list(key) + [offset]))
+
+
+def decode_cursor(cursor):
+    """:returns: (key of log file, offset).
+    :raises: ValueError
+    """
+    try:
+        node_id, source_id, offset = json.loads(
+            base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(node_id, int) or not isinstance(offset, int) \
+            or not isinstance(source_id, basestring) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return (node_id, source_id), offset
+
+
+class SearchedFile(object):
+    """Log file of some source on some node.
+    """
+
+    def __init__(self, path, log_config, parser, node_id=None):
+        self.path = path
+        self.log_config = log_config
+        self.parser = parser
+        self.node_id = node_id
+
+    @property
+    def key(self):
+        # files are searched in order of keys, so cursor
+        # is able to point to the place to resume search
+        return (self.node_id or 0, self.log_config['id'])
+
+
+class SearchResult(object):
+    """Result of file searched without pool, it's got
+    the same way as result of pool.
+    """
+
+    def __init__(self, found):
+        self.found = found
+
+    def get(self):
+        return self.found
+
+
+class LogSearch(object):
+    """Search of log entries by text, levels and dates in one or more
+    log files. Files are searched in order of their keys, several files
+    at once by thread pool, and entries of a file are returned in order
+    they are written.
+
+    Entries are matched after credentials are hidden in them, so search
+    doesn't disclose them either.
+    """
+
+    _pool = None
+    _pool_size = None
+    _pool_lock = threading.Lock()
+
+    def __init__(self, files, text=None, regexp=None, levels=None,
+                 date_after=None, date_before=None, scrub_patterns=(),
+                 limit=None, workers=None):
+        """:param files: list of SearchedFile.
+        :param text: substring which entries should contain.
+        :param regexp: compiled regexp which entries should match.
+        :param levels: set of levels of entries or None for any level.
+        :param date_after: seconds since epoch or None.
+        :param date_before: seconds since epoch or None.
+        :param scrub_patterns: (pattern, replacement) pairs applied
+            to entries.
+        :param limit: max number of entries to return.
+        :param workers: number of files searched at once.
+        """
+        self.files = sorted(files, key=lambda f: f.key)
+        self.text = text
+        self.regexp = regexp
+        self.levels = levels
+        self.date_after = date_after
+        self.date_before = date_before
+        self.scrub_patterns = scrub_patterns
+        self.limit = limit or settings.LOG_SEARCH_LIMIT
+        self.workers = workers or settings.LOG_SEARCH_WORKERS
+        # cursor to resume search after the last returned entry
+        # or None if there are no more entries
+        self.cursor = None
+
+    @classmethod
+    def get_pool(cls, workers):
+        """:returns: process wide pool with given number of threads.
+        Pool of other size is replaced, its threads are stopped after
+        they search files which were already given to them.
+        """
+        old_pool = None
+        with cls._pool_lock:
+            if cls._pool_size != workers:
+                old_pool = cls._pool
+                cls._pool = ThreadPool(workers)
+                cls._pool_size = workers
+                if old_pool is not None:
+                    old_pool.close()
+            pool = cls._pool
+        if old_pool is not None:
+            old_pool.join()
+        return pool
+
+    def _apply_async(self, pool, searched, offset):
+        """Searches file by pool or right away if pool is replaced
+        since search was started.
+        """
+        with self._pool_lock:
+            if pool is LogSearch._pool:
+                return pool.apply_async(
+                    self.search_file, (searched, offset, self.limit))
+        return SearchResult(self.search_file(searched, offset, self.limit))
+
+    def entries(self, cursor=None):
+        """Searches entries starting from cursor. When all entries
+        are iterated self.cursor is set for the next search.
+
+        :param cursor: value of self.cursor of previous search.
+        :yields: dicts with node, source, date, level and text of entry.
+        :raises: ValueError if cursor is invalid.
+        """
+        tasks = []
+        if cursor is not None:
+            cursor_key, cursor_offset = decode_cursor(cursor)
+        for searched in self.files:
+            if cursor is None or searched.key > cursor_key:
+                tasks.append((searched, 0))
+            elif searched.key == cursor_key:
+                tasks.append((searched, cursor_offset))
+
+        self.cursor = None
+        left = self.limit
+        for searched, found in self._search(tasks):
+            for entry, end in found:
+                yield entry
+                left -= 1
+                if not left:
+                    self.cursor = encode_cursor(searched.key, end)
+                    return
+
+    def _search(self, tasks):
+        """Searches files by pool keeping only a few files searched
+        in advance, so files are not read after limit is reached.
+
+        :yields: (SearchedFile, list of found entries).
+        """
+        if self.workers < 2 or len(tasks) < 2:
+            for searched, offset in tasks:
+                yield searched, self.search_file(searched, offset,
+                                                 self.limit)
+            return
+        pool = self.get_pool(self.workers)
+        pending = deque()
+        tasks = deque(tasks)
+        while tasks or pending:
+            while tasks and len(pending) < self.workers:
+                searched, offset = tasks.popleft()
+                pending.append((searched, self._apply_async(
+                    pool, searched, offset)))
+            searched, result = pending.popleft()
+            yield searched, result.get()
+
+    def _matches(self, entry):
+        if self.text is not None and self.text not in entry['text']:
+            return False
+        if self.regexp is not None and \
+                self.regexp.search(entry['text']) is None:
+            return False
+        return True
+
+    def _build_entry(self, searched, m, continuation):
+        parser = searched.parser
+        level = m.group('level').upper() or 'INFO'
+        if self.levels is not None and level not in self.levels:
+            return None
+        try:
+            date = parser.parse_date(m.group('date'))
+        except ValueError:
+            return None
+        if self.date_after or self.date_before:
+            entry_time = calendar.timegm(date)
+            if self.date_before and entry_time >= self.date_before or \
+                    self.date_after and entry_time <= self.date_after:
+                return None
+        text = m.group('text')
+        if continuation:
+            text += '\n' + '\n'.join(continuation)
+        for regex, replace in self.scrub_patterns:
+            text = regex.sub(replace, text)
+        entry = {
+            'node': searched.node_id,
+            'source': searched.log_config['id'],
+            'date': parser.format_date(date),
+            'level': level,
+            'text': text
+        }
+        return entry if self._matches(entry) else None
+
+    def search_file(self, searched, offset, limit):
+        """Searches entries of file. Lines which don't start entries
+        are parts of previous entries of multiline sources.
+
+        :param searched: SearchedFile.
+        :param offset: position of file to start from.
+        :param limit: max number of entries to find.
+        :returns: list of (entry, offset of the end of entry).
+        """
+        found = []
+        parser = searched.parser
+        multiline = searched.log_config.get('multiline')
+        try:
+            size = os.path.getsize(searched.path)
+        except OSError:
+            return found
+        if offset > size:
+            # file is rotated since cursor was returned
+            offset = 0
+        end = size
+        if self.date_after or self.date_before:
+            index = log_indexes.get(searched.path, parser.entry_time)
+            start, end = index.bounds(self.date_after, self.date_before)
+            offset = max(offset, start)
+
+        try:
+            f = open(searched.path, 'r')
+        except IOError:
+            return found
+        with f:
+            f.seek(offset)
+            pos = offset
+            current, continuation = None, []
+            while True:
+                line = f.readline() if pos < end else ''
+                if line and not line.endswith('\n'):
+                    # entry which is being written
+                    line = ''
+                entry_line = line.rstrip('\n')
+                if line and (not entry_line or
+                             parser.is_skipped(entry_line)):
+                    pos += len(line)
+                    continue
+                m = parser.match(entry_line)
+                if m is not None or not line:
+                    if current is not None:
+                        entry = self._build_entry(searched, current,
+                                                  continuation)
+                        if entry is not None:
+                            found.append((entry, pos))
+                            if len(found) >= limit:
+                                break
+                    current, continuation = m, []
+                    if not line:
+                        break
+                elif current is not None and multiline:
+                    continuation.append(entry_line)
+                pos += len(line)
+        return found
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import threading
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
+from nailgun.settings import settings
+
+
+def get_node_log_dir(log_config, node):
+    """:returns: directory of remote log source with logs of node
+    or None if node has no name for it yet. Logs of nodes which
+    are not provisioned yet are kept by ip.
+    """
+    if node.status == "discover":
+        ndir = node.ip
+    else:
+        ndir = node.fqdn
+    if not ndir:
+        return None
+    return os.path.join(log_config['base'], ndir)
+
+
+class LogDirCache(object):
+    """Names of log files in log directories. Directory is listed
+    once and listing is reused while mtime of directory is the same,
+    i.e. until files are added, removed or renamed in it. Type of
+    entries is mostly known from listing itself, so files aren't
+    stat'ed one by one; readability is checked when file is opened.
+    """
+
+    # directories changed so recently are listed every time, as
+    # the next change in the same second wouldn't change mtime
+    min_age = 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # directory -> (mtime, frozenset of names of files)
+        self._listings = {}
+
+    @classmethod
+    def _list(cls, directory):
+        return frozenset(
+            entry.name for entry in scandir(directory) if entry.is_file())
+
+    def files(self, directory):
+        """:returns: set of names of files in directory,
+        empty if directory doesn't exist.
+        """
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            with self._lock:
+                self._listings.pop(directory, None)
+            return frozenset()
+        with self._lock:
+            cached = self._listings.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            files = self._list(directory)
+        except OSError:
+            return frozenset()
+        if time.time() - mtime > self.min_age:
+            with self._lock:
+                self._listings[directory] = (mtime, files)
+        return files
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+
+
+log_dirs = LogDirCache()
+
+
+def get_node_log_sources(node):
+    """:returns: remote log sources from settings.LOGS which have
+    log files of node.
+    """
+    sources = []
+    for log_config in settings.LOGS:
+        if not log_config.get('remote') or not log_config.get('path') \
+                or not log_config.get('base'):
+            continue
+        if log_config.get('fake'):
+            if not settings.FAKE_TASKS:
+                continue
+            path = log_config['path']
+        else:
+            node_log_dir = get_node_log_dir(log_config, node)
+            if node_log_dir is None:
+                continue
+            path = os.path.join(node_log_dir, log_config['path'])
+        directory, name = os.path.split(path)
+        if name in log_dirs.files(directory):
+            sources.append(log_config)
+    return sources
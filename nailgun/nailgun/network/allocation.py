@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from bisect import bisect_right
+import threading
+
+from netaddr import AddrFormatError
+from netaddr import IPAddress
+
+
+class IPAllocationIndex(object):
+    """Allocation map over IP ranges of a single network group.
+
+    Used addresses are kept as a sorted set of disjoint intervals,
+    so a range with thousands of sequentially allocated addresses
+    costs a couple of list items, and looking for N free addresses
+    is O(N + number of ranges) instead of a query per candidate.
+    """
+
+    def __init__(self, ranges, reserved=None):
+        """:param ranges: list of (first, last) IP address pairs.
+        :param reserved: addresses which should never be allocated
+        (e.g. network gateway).
+        """
+        # overlapping ranges are merged, so every address
+        # is met once when free addresses are looked for
+        self.ranges = []
+        for first, last in sorted(
+            (int(IPAddress(first)), int(IPAddress(last)))
+            for first, last in ranges
+        ):
+            if last < first:
+                continue
+            if self.ranges and first <= self.ranges[-1][1] + 1:
+                self.ranges[-1] = (self.ranges[-1][0],
+                                   max(self.ranges[-1][1], last))
+            else:
+                self.ranges.append((first, last))
+        # starts[i] - ends[i] is the i-th interval of used addresses
+        self._starts = []
+        self._ends = []
+        self.load(reserved or [])
+
+    @classmethod
+    def _to_int(cls, ip):
+        if isinstance(ip, (int, long)):
+            return ip
+        try:
+            return int(IPAddress(ip))
+        except (AddrFormatError, ValueError, TypeError):
+            return None
+
+    def _in_ranges(self, ip):
+        return any(first <= ip <= last for first, last in self.ranges)
+
+    def mark_used(self, ip):
+        ip = self._to_int(ip)
+        if ip is None or not self._in_ranges(ip):
+            return
+        starts, ends = self._starts, self._ends
+        i = bisect_right(starts, ip) - 1
+        if i >= 0 and ends[i] >= ip:
+            return
+        join_left = i >= 0 and ends[i] == ip - 1
+        join_right = i + 1 < len(starts) and starts[i + 1] == ip + 1
+        if join_left and join_right:
+            ends[i] = ends[i + 1]
+            del starts[i + 1]
+            del ends[i + 1]
+        elif join_left:
+            ends[i] = ip
+        elif join_right:
+            starts[i + 1] = ip
+        else:
+            starts.insert(i + 1, ip)
+            ends.insert(i + 1, ip)
+
+    def load(self, ips):
+        """Marks all addresses from iterable as used. Addresses
+        outside of ranges are ignored.
+        """
+        ips = filter(
+            lambda ip: ip is not None,
+            (self._to_int(ip) for ip in ips)
+        )
+        # sorted input is appended to the end of intervals list
+        for ip in sorted(ips):
+            self.mark_used(ip)
+
+    def get_free(self, num=1):
+        """Returns up to num lowest free addresses as strings.
+        """
+        found = []
+        starts, ends = self._starts, self._ends
+        for first, last in self.ranges:
+            cur = first
+            i = bisect_right(starts, cur) - 1
+            if i >= 0 and ends[i] >= cur:
+                cur = ends[i] + 1
+            i += 1
+            # starts[i] is always beyond cur here
+            while cur <= last and len(found) < num:
+                block_end = last if i >= len(starts) \
+                    else min(last, starts[i] - 1)
+                while cur <= block_end and len(found) < num:
+                    found.append(str(IPAddress(cur)))
+                    cur += 1
+                if i < len(starts):
+                    cur = max(cur, ends[i] + 1)
+                    i += 1
+                else:
+                    break
+            if len(found) == num:
+                break
+        return found
+
+
+class IPAllocationCache(object):
+    """Process wide storage of IPAllocationIndex objects.
+
+    Every index is stored with a stamp which describes state of
+    network group ranges and of ip_addrs table at the moment of
+    index loading. Index is reused only while stamp is the same.
+
+    Addresses are released by deleting rows of ip_addrs in many
+    places, including cascade deletes of nodes and networks and
+    other processes (e.g. receiver), so index isn't told about
+    released addresses. It's reloaded instead when the stamp,
+    one aggregate query over ip_addrs, shows that rows were deleted
+    or inserted by someone else. Inserts made through
+    NetworkManager._commit_ips are applied to cached indexes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def get(self, network_group_id, stamp):
+        with self._lock:
+            cached = self._indexes.get(network_group_id)
+            if cached and cached[0] == stamp:
+                return cached[1]
+            return None
+
+    def put(self, network_group_id, stamp, index):
+        with self._lock:
+            self._indexes[network_group_id] = (stamp, index)
+
+    def track_insert(self, ips, last_id):
+        """Keeps cached indexes in step with newly inserted
+        IP addresses so they don't have to be reloaded.
+
+        :param ips: inserted IP addresses.
+        :param last_id: the greatest database id of inserted rows.
+        """
+        with self._lock:
+            for ng_id, (stamp, index) in self._indexes.items():
+                ranges, gateway, (count, max_id) = stamp
+                index.load(ips)
+                stamp = (ranges, gateway,
+                         (count + len(ips), max(max_id, last_id)))
+                self._indexes[ng_id] = (stamp, index)
+
+
+ip_allocation_cache = IPAllocationCache()
@@ -15,9 +15,6 @@
 #    under the License.
 
 from itertools import chain
-from itertools import groupby
-from itertools import ifilter
-from itertools import imap
 from itertools import islice
 
 import math
@@ -26,6 +23,7 @@ from netaddr import IPAddress
 from netaddr import IPNetwork
 from netaddr import IPRange
 from netaddr import IPSet
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import not_
 
@@ -40,9 +38,12 @@ from nailgun.api.models import NetworkGroup
 from nailgun.api.models import Node
 from nailgun.api.models import NodeNICInterface
 from nailgun.api.models import Vlan
+from nailgun.db import cached_in_scope
 from nailgun.db import db
 from nailgun.errors import errors
 from nailgun.logger import logger
+from nailgun.network.allocation import IPAllocationIndex
+from nailgun.network.allocation import ip_allocation_cache
 
 
 class NetworkManager(object):
@@ -62,6 +63,19 @@ class NetworkManager(object):
         db().add(ip_range)
         db().commit()
 
+    def _get_admin_id(self, model):
+        """Id of admin Network or NetworkGroup. It's asked by many
+        helpers during one request, so it's looked up once per
+        session scope.
+        """
+        def get_id():
+            admin = db().query(model.id).filter_by(
+                name="fuelweb_admin"
+            ).first()
+            return admin[0] if admin else None
+
+        return cached_in_scope(('admin_id', model.__name__), get_id)
+
     def get_admin_network_id(self, fail_if_not_found=True):
         '''Method for receiving Admin Network ID.
 
@@ -71,12 +85,10 @@ class NetworkManager(object):
         :returns: Admin Network ID or None.
         :raises: errors.AdminNetworkNotFound
         '''
-        admin_net = db().query(Network).filter_by(
-            name="fuelweb_admin"
-        ).first()
-        if not admin_net and fail_if_not_found:
+        admin_net_id = self._get_admin_id(Network)
+        if admin_net_id is None and fail_if_not_found:
             raise errors.AdminNetworkNotFound()
-        return admin_net.id
+        return admin_net_id
 
     def get_admin_network(self, fail_if_not_found=True):
         '''Method for receiving Admin Network.
@@ -87,12 +99,13 @@ class NetworkManager(object):
         :returns: Admin Network or None.
         :raises: errors.AdminNetworkNotFound
         '''
-        admin_net = db().query(Network).filter_by(
-            name="fuelweb_admin"
-        ).first()
-        if not admin_net and fail_if_not_found:
-            raise errors.AdminNetworkNotFound()
-        return admin_net
+        admin_net_id = self._get_admin_id(Network)
+        if admin_net_id is None:
+            if fail_if_not_found:
+                raise errors.AdminNetworkNotFound()
+            return None
+        # object is taken from identity map if it's already loaded
+        return db().query(Network).get(admin_net_id)
 
     def get_admin_network_group_id(self, fail_if_not_found=True):
         '''Method for receiving Admin NetworkGroup ID.
@@ -103,12 +116,10 @@ class NetworkManager(object):
         :returns: Admin NetworkGroup ID or None.
         :raises: errors.AdminNetworkNotFound
         '''
-        admin_ng = db().query(NetworkGroup).filter_by(
-            name="fuelweb_admin"
-        ).first()
-        if not admin_ng and fail_if_not_found:
+        admin_ng_id = self._get_admin_id(NetworkGroup)
+        if admin_ng_id is None and fail_if_not_found:
             raise errors.AdminNetworkNotFound()
-        return admin_ng.id
+        return admin_ng_id
 
     def get_admin_network_group(self, fail_if_not_found=True):
         '''Method for receiving Admin NetworkGroup.
@@ -119,12 +130,13 @@ class NetworkManager(object):
         :returns: Admin NetworkGroup or None.
         :raises: errors.AdminNetworkNotFound
         '''
-        admin_ng = db().query(NetworkGroup).filter_by(
-            name="fuelweb_admin"
-        ).first()
-        if not admin_ng and fail_if_not_found:
-            raise errors.AdminNetworkNotFound()
-        return admin_ng
+        admin_ng_id = self._get_admin_id(NetworkGroup)
+        if admin_ng_id is None:
+            if fail_if_not_found:
+                raise errors.AdminNetworkNotFound()
+            return None
+        # object is taken from identity map if it's already loaded
+        return db().query(NetworkGroup).get(admin_ng_id)
 
     def create_network_groups(self, cluster_id):
         '''Method for creation of network groups for cluster.
@@ -304,14 +316,10 @@ class NetworkManager(object):
                 num=num - len(node_admin_ips)
             )
             logger.info(len(free_ips))
-            for ip in free_ips:
-                ip_db = IPAddr(
-                    node=node_id,
-                    ip_addr=ip,
-                    network=admin_net_id
-                )
-                db().add(ip_db)
-            db().commit()
+            self._commit_ips([
+                {'network': admin_net_id, 'node': node_id, 'ip_addr': ip}
+                for ip in free_ips
+            ])
 
     def assign_ips(self, nodes_ids, network_name):
         """Idempotent assignment IP addresses to nodes.
@@ -330,10 +338,14 @@ class NetworkManager(object):
         :raises: Exception, errors.AssignIPError
         """
 
-        cluster_id = db().query(Node).get(nodes_ids[0]).cluster_id
+        nodes_clusters = dict(
+            db().query(Node.id, Node.cluster_id).filter(
+                Node.id.in_(nodes_ids)
+            ).all()
+        )
+        cluster_id = nodes_clusters.get(nodes_ids[0])
         for node_id in nodes_ids:
-            node = db().query(Node).get(node_id)
-            if node.cluster_id != cluster_id:
+            if nodes_clusters.get(node_id) != cluster_id:
                 raise Exception(
                     u"Node id='{0}' doesn't belong to cluster_id='{1}'".format(
                         node_id,
@@ -351,48 +363,52 @@ class NetworkManager(object):
                 (network_name, cluster_id)
             )
 
-        for node_id in nodes_ids:
-            node_ips = imap(
-                lambda i: i.ip_addr,
-                self._get_ips_except_admin(
-                    node_id=node_id,
-                    network_id=network.id
-                )
-            )
-            # check if any of node_ips in required ranges
-
-            ip_already_assigned = False
-
-            for ip in node_ips:
-                if self.check_ip_belongs_to_net(ip, network):
-                    logger.info(
-                        u"Node id='{0}' already has an IP address "
-                        "inside '{1}' network.".format(
-                            node_id,
-                            network.name
-                        )
-                    )
-                    ip_already_assigned = True
-                    break
-
-            if ip_already_assigned:
-                continue
+        # all addresses of given nodes in this network by one query
+        nodes_ips = db().query(IPAddr.node, IPAddr.ip_addr).filter(
+            IPAddr.network == network.id
+        ).filter(
+            IPAddr.node.in_(nodes_ids)
+        ).all()
 
-            # IP address has not been assigned, let's do it
-            logger.info(
-                "Assigning IP for node '{0}' in network '{1}'".format(
-                    node_id,
-                    network_name
+        ips_in_net = network.network_group.ips_in_ranges(
+            [ip for node_id, ip in nodes_ips]
+        )
+        nodes_with_ip = set()
+        for (node_id, ip), in_net in zip(nodes_ips, ips_in_net):
+            if in_net and node_id not in nodes_with_ip:
+                logger.info(
+                    u"Node id='{0}' already has an IP address "
+                    "inside '{1}' network.".format(
+                        node_id,
+                        network.name
+                    )
                 )
+                nodes_with_ip.add(node_id)
+
+        # keep order of nodes and don't assign twice to duplicates
+        nodes_wo_ip = []
+        for node_id in nodes_ids:
+            if node_id not in nodes_with_ip:
+                nodes_wo_ip.append(node_id)
+                nodes_with_ip.add(node_id)
+        if not nodes_wo_ip:
+            return
+
+        # IP addresses have not been assigned, let's do it
+        logger.info(
+            u"Assigning IPs for nodes {0} in network '{1}'".format(
+                nodes_wo_ip,
+                network_name
             )
-            free_ip = self.get_free_ips(network.network_group.id)[0]
-            ip_db = IPAddr(
-                network=network.id,
-                node=node_id,
-                ip_addr=free_ip
-            )
-            db().add(ip_db)
-            db().commit()
+        )
+        free_ips = self.get_free_ips(
+            network.network_group_id,
+            num=len(nodes_wo_ip)
+        )
+        self._commit_ips([
+            {'network': network.id, 'node': node_id, 'ip_addr': ip}
+            for node_id, ip in zip(nodes_wo_ip, free_ips)
+        ])
 
     def assign_vip(self, cluster_id, network_name):
         """Idempotent assignment VirtualIP addresses to cluster.
@@ -433,20 +449,14 @@ class NetworkManager(object):
             not_(IPAddr.network == admin_net_id)
         ).all()]
         # check if any of used_ips in required cidr: network.cidr
-        ips_belongs_to_net = False
-        for ip in cluster_ips:
-            if self.check_ip_belongs_to_net(ip, network):
-                ips_belongs_to_net = True
-                break
-
-        if ips_belongs_to_net:
+        if any(network.network_group.ips_in_ranges(cluster_ips)):
             vip = cluster_ips[0]
         else:
             # IP address has not been assigned, let's do it
             vip = self.get_free_ips(network.network_group.id)[0]
-            ne_db = IPAddr(network=network.id, ip_addr=vip)
-            db().add(ne_db)
-            db().commit()
+            self._commit_ips([
+                {'network': network.id, 'node': None, 'ip_addr': vip}
+            ])
         return vip
 
     def clear_vlans(self):
@@ -484,40 +494,66 @@ class NetworkManager(object):
             yield chain([s.next()], s)
 
     def check_ip_belongs_to_net(self, ip_addr, network):
-        addr = IPAddress(ip_addr)
-        ipranges = imap(
-            lambda ir: IPRange(ir.first, ir.last),
-            network.network_group.ip_ranges
+        return network.network_group.ip_in_ranges(ip_addr)
+
+    def _ip_addrs_stamp(self):
+        """Returns (count, max id) of ip_addrs table. Since ids
+        are never reused, insert changes count and max id, delete
+        changes count, and insert together with delete changes max id.
+        """
+        count, max_id = db().query(
+            func.count(IPAddr.id),
+            func.max(IPAddr.id)
+        ).one()
+        return (count, max_id or 0)
+
+    def _get_allocation_index(self, network_group):
+        """Returns IPAllocationIndex for given Network Group.
+        Index is loaded with one query and reused while
+        ranges of network group and ip_addrs table don't change.
+        """
+        ranges = tuple(
+            (ir.first, ir.last) for ir in network_group.ip_ranges
         )
-        for r in ipranges:
-            if addr in r:
-                return True
-        return False
-
-    def _iter_free_ips(self, network_group):
-        """Represents iterator over free IP addresses
-        in all ranges for given Network Group
+        stamp = (ranges, network_group.gateway, self._ip_addrs_stamp())
+        index = ip_allocation_cache.get(network_group.id, stamp)
+        if index is None:
+            index = IPAllocationIndex(
+                ranges,
+                reserved=[network_group.gateway]
+            )
+            index.load(ip for (ip,) in db().query(IPAddr.ip_addr))
+            ip_allocation_cache.put(network_group.id, stamp, index)
+        return index
+
+    def _commit_ips(self, ips):
+        """Inserts IP addresses by one statement, commits them
+        and keeps cached allocation indexes in step with database.
+        Stamp of indexes is moved by number of inserted rows and
+        the greatest inserted id, so rows inserted or deleted by
+        others meanwhile still make indexes reload.
+
+        :param ips: List of dicts with 'network', 'node', 'ip_addr' keys.
+        :type  ips: list
+        :returns: None
         """
-        for ip_addr in ifilter(
-            lambda ip: db().query(IPAddr).filter_by(
-                ip_addr=str(ip)
-            ).first() is None and not ip == network_group.gateway,
-            chain(*[
-                IPRange(ir.first, ir.last)
-                for ir in network_group.ip_ranges
-            ])
-        ):
-            yield ip_addr
+        if not ips:
+            return
+        db().execute(IPAddr.__table__.insert(), ips)
+        # the last id drawn by this session is the greatest id of
+        # inserted rows, so ids of rows themselves aren't needed
+        last_id = db().query(func.currval('ip_addrs_id_seq')).scalar()
+        db().commit()
+        ip_allocation_cache.track_insert(
+            [ip['ip_addr'] for ip in ips],
+            last_id
+        )
 
     def get_free_ips(self, network_group_id, num=1):
         """Returns list of free IP addresses for given Network Group
         """
         ng = db().query(NetworkGroup).get(network_group_id)
-        free_ips = []
-        for ip in self._iter_free_ips(ng):
-            free_ips.append(str(ip))
-            if len(free_ips) == num:
-                break
+        free_ips = self._get_allocation_index(ng).get_free(num)
         if len(free_ips) < num:
             raise errors.OutOfIPs()
         return free_ips
@@ -549,7 +585,8 @@ class NetworkManager(object):
         raise errors.OutOfIPs()
 
     def _get_ips_except_admin(self, node_id=None,
-                              network_id=None, joined=False):
+                              network_id=None, joined=False,
+                              nodes_ids=None):
         """Method for receiving IP addresses for node or network
         excluding Admin Network IP address.
 
@@ -557,6 +594,8 @@ class NetworkManager(object):
         :type  node_id: int
         :param network_id: Network database ID.
         :type  network_id: int
+        :param nodes_ids: List of nodes database IDs.
+        :type  nodes_ids: list
         :returns: List of free IP addresses as SQLAlchemy objects.
         """
         ips = db().query(IPAddr).order_by(IPAddr.id)
@@ -566,6 +605,10 @@ class NetworkManager(object):
                 joinedload('network_data.network_group'))
         if node_id:
             ips = ips.filter_by(node=node_id)
+        if nodes_ids is not None:
+            if not nodes_ids:
+                return []
+            ips = ips.filter(IPAddr.node.in_(nodes_ids))
         if network_id:
             ips = ips.filter_by(network=network_id)
 
@@ -671,23 +714,34 @@ class NetworkManager(object):
 
         return network_data
 
-    def get_grouped_ips_by_node(self):
-        """returns {node.id: generator([IPAddr1, IPAddr2])}
+    def get_grouped_ips_by_node(self, nodes_ids=None):
+        """returns {node.id: [IPAddr1, IPAddr2]}
+
+        :param nodes_ids: Take only IPs of these nodes.
+        :type  nodes_ids: list
         """
-        ips_db = self._get_ips_except_admin(joined=True)
-        return dict(groupby(ips_db, lambda ip: ip.node))
+        ips_db = self._get_ips_except_admin(joined=True, nodes_ids=nodes_ids)
+        grouped = {}
+        for ip in ips_db:
+            grouped.setdefault(ip.node, []).append(ip)
+        return grouped
 
     def get_networks_grouped_by_cluster(self):
         networks = db().query(Network).options(joinedload('network_group')).\
             order_by(Network.id).all()
-        return dict(groupby(networks,
-                    lambda net: net.network_group.cluster_id))
+        grouped = {}
+        for net in networks:
+            grouped.setdefault(net.network_group.cluster_id, []).append(net)
+        return grouped
 
-    def get_node_networks_optimized(self, node_db, ips_db, networks):
+    def get_node_networks_optimized(self, node_db, ips_db, networks,
+                                    interfaces=None):
         """Method for receiving data for a given node with db data provided
         as input
         @nodes_db - List of Node instances
         @ips_db - generator([IPAddr1, IPAddr2])
+        @interfaces - index returned by get_interfaces_by_network,
+        if it is not specified interfaces of node are used
         """
         cluster_db = node_db.cluster
         if cluster_db is None:
@@ -699,9 +753,10 @@ class NetworkManager(object):
         for ip in ips_db:
             #
             net = ip.network_data
-            interface = self._get_interface_by_network_name(
+            interface = self._get_interface_from_index(
                 node_db,
-                net.name
+                net.name,
+                interfaces
             )
 
             # Get prefix from netmask instead of cidr
@@ -729,9 +784,10 @@ class NetworkManager(object):
         nets_wo_ips = [n for n in networks if n.id not in network_ids]
 
         for net in nets_wo_ips:
-            interface = self._get_interface_by_network_name(
+            interface = self._get_interface_from_index(
                 node_db,
-                net.name
+                net.name,
+                interfaces
             )
 
             if net.name == 'fixed' and cluster_db.net_manager == 'VlanManager':
@@ -891,6 +947,35 @@ class NetworkManager(object):
 
         raise errors.CanNotFindInterface()
 
+    def get_interfaces_by_network(self, cluster_id):
+        """Method for receiving interfaces of all cluster nodes
+        by assigned networks in one query.
+
+        :param cluster_id: Cluster database ID.
+        :type  cluster_id: int
+        :returns: {(node_id, network_name): NodeNICInterface}
+        """
+        interfaces = db().query(NodeNICInterface, NetworkGroup.name).join(
+            NodeNICInterface.assigned_networks
+        ).join(
+            Node, Node.id == NodeNICInterface.node_id
+        ).filter(
+            Node.cluster_id == cluster_id
+        ).order_by(NodeNICInterface.id)
+
+        index = {}
+        for interface, network_name in interfaces:
+            index.setdefault((interface.node_id, network_name), interface)
+        return index
+
+    def _get_interface_from_index(self, node, network_name, interfaces):
+        if interfaces is None:
+            return self._get_interface_by_network_name(node, network_name)
+        try:
+            return interfaces[(node.id, network_name)]
+        except KeyError:
+            raise errors.CanNotFindInterface()
+
     def get_end_point_ip(self, cluster_id):
         cluster_db = db().query(Cluster).get(cluster_id)
         ip = None
@@ -14,7 +14,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from contextlib import contextmanager
 from datetime import datetime
+import threading
 
 from nailgun.api.models import Notification
 from nailgun.api.models import Task
@@ -23,34 +25,137 @@ from nailgun.errors import errors
 from nailgun.logger import logger
 
 
+# notifications collected by buffered() block of current thread
+_local = threading.local()
+
+
 def notify(topic, message,
            cluster_id=None, node_id=None, task_uuid=None):
-    if topic == 'discover' and node_id is None:
-        raise errors.CannotFindNodeIDForDiscovering(
-            "No node id in discover notification")
-    task = None
-    if task_uuid:
-        task = db().query(Task).filter_by(uuid=task_uuid).first()
-
-    exist = None
-    if node_id and task:
-        exist = db().query(Notification).filter_by(
-            node_id=node_id,
-            message=message,
-            task=task
-        ).first()
-
-    if not exist:
-        notification = Notification()
-        notification.topic = topic
-        notification.message = message
-        notification.cluster_id = cluster_id
-        notification.node_id = node_id
-        if task:
-            notification.task_id = task.id
-        notification.datetime = datetime.now()
-        db().add(notification)
-        db().commit()
+    notify_many([{
+        'topic': topic,
+        'message': message,
+        'cluster_id': cluster_id,
+        'node_id': node_id,
+        'task_uuid': task_uuid
+    }])
+
+
+def notify_many(notifications):
+    """Adds several notifications with one query for duplicates,
+    one insert and one commit. Inside of buffered() block
+    notifications are only collected.
+
+    :param notifications: list of dicts with arguments of notify().
+    """
+    for data in notifications:
+        if data['topic'] == 'discover' and data.get('node_id') is None:
+            raise errors.CannotFindNodeIDForDiscovering(
+                "No node id in discover notification")
+    if not notifications:
+        return
+
+    buf = getattr(_local, 'buffer', None)
+    if buf is not None:
+        buf.extend(notifications)
+        return
+
+    _write(notifications)
+    db().commit()
+
+
+@contextmanager
+def buffered(flush_on=()):
+    """Collects notifications added in the block and writes them
+    with one insert when the block is finished, without commit.
+    Notifications are dropped if the block raises exception which
+    isn't an instance of flush_on. Nested blocks are the part of
+    outer one.
+
+    :param flush_on: tuple of exception classes.
+    """
+    if getattr(_local, 'buffer', None) is not None:
+        yield
+        return
+    _local.buffer = []
+    try:
+        yield
+    except flush_on:
+        _write(_local.buffer)
+        raise
+    except Exception:
+        if _local.buffer:
+            logger.warning(
+                "%d notifications are dropped because of error",
+                len(_local.buffer))
+        raise
+    else:
+        _write(_local.buffer)
+    finally:
+        _local.buffer = None
+
+
+def _write(notifications):
+    if not notifications:
+        return
+
+    tasks_uuids = set(
+        data['task_uuid'] for data in notifications if data.get('task_uuid'))
+    tasks = {}
+    if tasks_uuids:
+        tasks = dict(
+            db().query(Task.uuid, Task.id).filter(Task.uuid.in_(tasks_uuids))
+        )
+
+    rows = []
+    seen = set()
+    for data in notifications:
+        task_id = tasks.get(data.get('task_uuid'))
+        node_id = data.get('node_id')
+        if node_id is not None:
+            node_id = int(node_id)
+        message_hash = Notification.get_message_hash(data['message'])
+        key = (node_id, task_id, message_hash)
+        if key in seen:
+            continue
+        seen.add(key)
+        rows.append({
+            'topic': data['topic'],
+            'message': data['message'],
+            'message_hash': message_hash,
+            'cluster_id': data.get('cluster_id'),
+            'node_id': node_id,
+            'task_id': task_id,
+            'status': 'unread',
+            'datetime': datetime.now()
+        })
+
+    # notifications about node in the scope of task are not repeated
+    checked = [r for r in rows if r['node_id'] and r['task_id']]
+    if checked:
+        exist = set(
+            db().query(
+                Notification.node_id,
+                Notification.task_id,
+                Notification.message_hash
+            ).filter(
+                Notification.node_id.in_(set(r['node_id'] for r in checked))
+            ).filter(
+                Notification.task_id.in_(set(r['task_id'] for r in checked))
+            ).filter(
+                Notification.message_hash.in_(
+                    set(r['message_hash'] for r in checked))
+            )
+        )
+        rows = [
+            r for r in rows
+            if (r['node_id'], r['task_id'], r['message_hash']) not in exist
+        ]
+    if not rows:
+        return
+
+    db().execute(Notification.__table__.insert(), rows)
+    for row in rows:
         logger.info(
-            "Notification: topic: %s message: %s" % (topic, message)
+            "Notification: topic: %s message: %s" % (
+                row['topic'], row['message'])
         )
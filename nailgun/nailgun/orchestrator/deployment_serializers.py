@@ -16,6 +16,7 @@
 
 """Deployment serializers for orchestrator"""
 
+from nailgun.api.models import Network
 from nailgun.api.models import NetworkGroup
 from nailgun.api.models import Node
 from nailgun.db import db
@@ -25,6 +26,7 @@ from nailgun.settings import settings
 from nailgun.task.helpers import TaskHelper
 from netaddr import IPNetwork
 from sqlalchemy import and_
+from sqlalchemy.orm import joinedload
 
 
 class Priority(object):
@@ -48,6 +50,81 @@ class Priority(object):
         return self.priority
 
 
+class SerializationContext(object):
+    """Data of nodes which is required for serialization.
+
+    Nodes with their roles and interfaces, IP addresses and
+    networks are loaded in a fixed number of queries and network
+    data of every node is computed only once, so all serialization
+    steps share it instead of querying database again.
+    """
+
+    def __init__(self, nodes):
+        """:param nodes: iterable of Node objects, preferably with
+        roles and interfaces eager loaded.
+        """
+        self.nodes = list(nodes)
+        self.netmanager = NetworkManager()
+        self._ips = self.netmanager.get_grouped_ips_by_node(
+            [n.id for n in self.nodes])
+
+        self._networks = {}
+        self._interfaces = {}
+        clusters_ids = set(n.cluster_id for n in self.nodes
+                           if n.cluster_id is not None)
+        for cluster_id in clusters_ids:
+            self._interfaces.update(
+                self.netmanager.get_interfaces_by_network(cluster_id))
+        if clusters_ids:
+            networks = db().query(Network).join(NetworkGroup).filter(
+                NetworkGroup.cluster_id.in_(clusters_ids)
+            ).options(
+                joinedload('network_group')
+            ).order_by(Network.id)
+            for net in networks:
+                self._networks.setdefault(
+                    net.network_group.cluster_id, []).append(net)
+
+        self._network_data = {}
+
+    def select(self, nodes):
+        """Loaded nodes of context which have ids of given nodes,
+        in order of context.
+
+        :param nodes: iterable of Node objects.
+        :raises: ValueError if some of nodes aren't in context.
+        """
+        ids = set(n.id for n in nodes)
+        selected = [n for n in self.nodes if n.id in ids]
+        if len(selected) != len(ids):
+            raise ValueError(
+                "Nodes {0} aren't in serialization context".format(
+                    sorted(ids - set(n.id for n in selected))))
+        return selected
+
+    def get_interface(self, node_id, network_name):
+        """Interface of node to which network is assigned
+
+        :raises: errors.CanNotFindInterface
+        """
+        try:
+            return self._interfaces[(int(node_id), network_name)]
+        except KeyError:
+            raise errors.CanNotFindInterface()
+
+    def network_data(self, node):
+        """Same as node.network_data but without per node queries
+        """
+        if node.id not in self._network_data:
+            self._network_data[node.id] = \
+                self.netmanager.get_node_networks_optimized(
+                    node,
+                    self._ips.get(node.id, []),
+                    self._networks.get(node.cluster_id, []),
+                    self._interfaces)
+        return self._network_data[node.id]
+
+
 class OrchestratorSerializer(object):
     """Base class for orchestrator searilization."""
 
@@ -56,11 +133,12 @@ class OrchestratorSerializer(object):
         """Method generates facts which
         through an orchestrator passes to puppet
         """
-        common_attrs = cls.get_common_attrs(cluster)
-        nodes = cls.serialize_nodes(cls.get_nodes_to_serialization(cluster))
+        context = cls.get_context(cluster)
+        common_attrs = cls.get_common_attrs(cluster, context)
+        nodes = cls.serialize_nodes(context.nodes, context)
 
         if cluster.net_manager == 'VlanManager':
-            cls.add_vlan_interfaces(nodes)
+            cls.add_vlan_interfaces(nodes, context)
 
         cls.set_deployment_priorities(nodes)
 
@@ -73,11 +151,12 @@ class OrchestratorSerializer(object):
             nodes)
 
     @classmethod
-    def get_common_attrs(cls, cluster):
+    def get_common_attrs(cls, cluster, context=None):
         """Common attributes for all facts
         """
+        context = context or cls.get_context(cluster)
         attrs = cls.serialize_cluster_attrs(cluster)
-        attrs['nodes'] = cls.node_list(cls.get_nodes_to_serialization(cluster))
+        attrs['nodes'] = cls.node_list(context.nodes, context)
 
         for node in attrs['nodes']:
             if node['role'] in 'cinder':
@@ -106,6 +185,16 @@ class OrchestratorSerializer(object):
             and_(Node.cluster == cluster,
                  False == Node.pending_deletion)).order_by(Node.id)
 
+    @classmethod
+    def get_context(cls, cluster):
+        """Data of nodes which need to serialize
+        """
+        return SerializationContext(
+            cls.get_nodes_to_serialization(cluster).options(
+                joinedload('role_list'),
+                joinedload('pending_role_list'),
+                joinedload('interfaces')))
+
     @classmethod
     def novanetwork_attrs(cls, cluster):
         """Network configuration
@@ -126,16 +215,15 @@ class OrchestratorSerializer(object):
         return attrs
 
     @classmethod
-    def add_vlan_interfaces(cls, nodes):
+    def add_vlan_interfaces(cls, nodes, context=None):
         """Assign fixed_interfaces and vlan_interface.
         They should be equal.
         """
-        netmanager = NetworkManager()
+        context = context or SerializationContext(
+            db().query(Node).filter(
+                Node.id.in_([int(node['uid']) for node in nodes])))
         for node in nodes:
-            node_db = db().query(Node).get(node['uid'])
-
-            fixed_interface = netmanager._get_interface_by_network_name(
-                node_db.id, 'fixed')
+            fixed_interface = context.get_interface(node['uid'], 'fixed')
 
             node['fixed_interface'] = fixed_interface.name
             node['vlan_interface'] = fixed_interface.name
@@ -170,26 +258,30 @@ class OrchestratorSerializer(object):
         ]
 
     @classmethod
-    def serialize_nodes(cls, nodes):
+    def serialize_nodes(cls, nodes, context=None):
         """Serialize node for each role.
         For example if node has two roles then
         in orchestrator will be passed two serialized
         nodes.
         """
+        context = context or SerializationContext(nodes)
         serialized_nodes = []
-        for node in nodes:
+        for node in context.select(nodes):
             for role in set(node.pending_roles + node.roles):
-                serialized_node = cls.serialize_node(node, role)
+                serialized_node = cls.serialize_node(node, role, context)
                 serialized_nodes.append(serialized_node)
 
         return serialized_nodes
 
     @classmethod
-    def serialize_node(cls, node, role):
+    def serialize_node(cls, node, role, context=None):
         """Serialize node, then it will be
         merged with common attributes
         """
-        network_data = node.network_data
+        if context:
+            network_data = context.network_data(node)
+        else:
+            network_data = node.network_data
         interfaces = cls.configure_interfaces(network_data)
         cls.__add_hw_interfaces(interfaces, node.meta['interfaces'])
         node_attrs = {
@@ -211,14 +303,15 @@ class OrchestratorSerializer(object):
         return node_attrs
 
     @classmethod
-    def node_list(cls, nodes):
+    def node_list(cls, nodes, context=None):
         """Generate nodes list. Represents
         as "nodes" parameter in facts.
         """
+        context = context or SerializationContext(nodes)
         node_list = []
 
-        for node in nodes:
-            network_data = node.network_data
+        for node in context.select(nodes):
+            network_data = context.network_data(node)
 
             for role in set(node.pending_roles + node.roles):
                 node_list.append({
@@ -383,10 +476,11 @@ class OrchestratorHASerializer(OrchestratorSerializer):
             controllers[0]['role'] = 'primary-controller'
 
     @classmethod
-    def node_list(cls, nodes):
+    def node_list(cls, nodes, context=None):
         """Node list
         """
-        node_list = super(OrchestratorHASerializer, cls).node_list(nodes)
+        node_list = super(OrchestratorHASerializer, cls).node_list(
+            nodes, context)
 
         for node in node_list:
             node['swift_zone'] = node['uid']
@@ -394,11 +488,11 @@ class OrchestratorHASerializer(OrchestratorSerializer):
         return node_list
 
     @classmethod
-    def get_common_attrs(cls, cluster):
+    def get_common_attrs(cls, cluster, context=None):
         """Common attributes for all facts
         """
         common_attrs = super(OrchestratorHASerializer, cls).get_common_attrs(
-            cluster)
+            cluster, context)
 
         netmanager = NetworkManager()
         common_attrs['management_vip'] = netmanager.assign_vip(
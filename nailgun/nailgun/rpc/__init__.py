@@ -15,9 +15,11 @@
 #    under the License.
 
 import json
+import logging
 
 from kombu import Connection
 from kombu import Exchange
+from kombu import pools
 from kombu import Queue
 
 from nailgun.logger import logger
@@ -59,14 +61,63 @@ nailgun_queue = Queue(
 )
 
 
+class Publisher(object):
+    """Process wide publisher of messages to orchestrator.
+
+    Connections and producers are taken from kombu pools, so AMQP
+    handshake is made once per pooled connection instead of once per
+    message, and lost connection is reestablished automatically.
+    """
+
+    def __init__(self, url, limit=None, max_retries=3):
+        """:param url: AMQP broker URL.
+        :param limit: Max number of pooled connections.
+        :param max_retries: How many times to reconnect and retry
+        publishing if connection is lost.
+        """
+        self.connection = Connection(url)
+        self.max_retries = max_retries
+        self.producers = pools.ProducerPool(
+            self.connection.Pool(limit=limit),
+            limit=limit
+        )
+        # queue is declared with the first message only and
+        # again after connection is lost, not with every message
+        self._declared = False
+
+    def _on_connection_error(self, exc, interval):
+        self._declared = False
+        logger.warning(
+            "Connection to AMQP broker is lost: %s. "
+            "Retry in %s seconds", exc, interval
+        )
+
+    def publish(self, name, message):
+        with self.producers.acquire(block=True) as producer:
+            publish = producer.connection.ensure(
+                producer,
+                producer.publish,
+                errback=self._on_connection_error,
+                max_retries=self.max_retries
+            )
+            publish(message,
+                    serializer='json',
+                    exchange=naily_exchange, routing_key=name,
+                    declare=[] if self._declared else [naily_queue])
+            self._declared = True
+
+
+publisher = Publisher(
+    conn_str,
+    limit=settings.RABBITMQ.get('pool_limit')
+)
+
+
 def cast(name, message):
-    logger.debug(
-        "RPC cast to orchestrator:\n{0}".format(
-            json.dumps(message, indent=4)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "RPC cast to orchestrator:\n{0}".format(
+                json.dumps(message, indent=4)
+            )
         )
-    )
-    with Connection(conn_str) as conn:
-        with conn.Producer(serializer='json') as producer:
-            producer.publish(message,
-                             exchange=naily_exchange, routing_key=name,
-                             declare=[naily_queue])
+    publisher.publish(name, message)
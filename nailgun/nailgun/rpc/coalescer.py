@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from copy import deepcopy
+
+
+class ProgressCoalescer(object):
+    """Merges queued progress-only deploy_resp messages of the same
+    task, so receiver updates database once for a bunch of them.
+
+    Message is progress-only if it doesn't change task status and
+    its nodes are just reporting progress of provisioning or
+    deployment. Any other message (errors, ready or offline nodes,
+    other methods) is passed as is, and all messages of task which
+    were merged before it are passed ahead of it, so order of
+    messages of one task is kept.
+    """
+
+    methods = ('deploy_resp',)
+    task_fields = set(['task_uuid', 'nodes', 'progress', 'status'])
+    task_statuses = (None, 'running')
+    node_fields = set(['uid', 'status', 'progress'])
+    node_statuses = (None, 'provisioning', 'deploying')
+
+    @classmethod
+    def is_progress_only(cls, body):
+        if body.get('method') not in cls.methods:
+            return False
+        args = body.get('args') or {}
+        if not set(args.keys()) <= cls.task_fields or \
+                args.get('status') not in cls.task_statuses:
+            return False
+        for node in args.get('nodes') or []:
+            if not set(node.keys()) <= cls.node_fields or \
+                    node.get('status') not in cls.node_statuses:
+                return False
+        return True
+
+    @classmethod
+    def merge(cls, older, newer):
+        """:returns: message which has the same effect as
+        older and newer messages received one after another.
+        """
+        merged = deepcopy(older)
+        args = merged['args']
+        newer_args = newer['args']
+
+        nodes = args.setdefault('nodes', [])
+        nodes_by_uid = dict((node['uid'], node) for node in nodes)
+        for node in newer_args.get('nodes') or []:
+            if node['uid'] in nodes_by_uid:
+                nodes_by_uid[node['uid']].update(node)
+            else:
+                node = dict(node)
+                nodes.append(node)
+                nodes_by_uid[node['uid']] = node
+        if not nodes:
+            del args['nodes']
+
+        if 'progress' in newer_args:
+            args['progress'] = newer_args['progress']
+        elif newer_args.get('nodes'):
+            # task progress should be calculated by nodes
+            args.pop('progress', None)
+        if 'status' in newer_args:
+            args['status'] = newer_args['status']
+        return merged
+
+    @classmethod
+    def coalesce(cls, items):
+        """:param items: list of (body, payload) pairs in order
+        of receiving, payload is anything caller needs to keep
+        with message (e.g. message for acknowledgement).
+        :returns: list of (body, payloads) pairs, where payloads
+        are payloads of all messages merged into body.
+        """
+        result = []
+        # task_uuid -> index of merged message in result
+        pending = {}
+        for body, payload in items:
+            task_uuid = (body.get('args') or {}).get('task_uuid')
+            if cls.is_progress_only(body):
+                if task_uuid in pending:
+                    merged, payloads = result[pending[task_uuid]]
+                    result[pending[task_uuid]] = (
+                        cls.merge(merged, body),
+                        payloads + [payload]
+                    )
+                else:
+                    pending[task_uuid] = len(result)
+                    result.append((body, [payload]))
+                continue
+            # merged messages of task should be handled before this one
+            pending.pop(task_uuid, None)
+            result.append((body, [payload]))
+        return result
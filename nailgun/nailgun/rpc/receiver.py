@@ -23,6 +23,7 @@ import traceback
 
 
 from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
 
 from nailgun.api.models import IPAddr
 from nailgun.api.models import Node
@@ -32,8 +33,8 @@ from nailgun.db import db
 from nailgun.logger import logger
 from nailgun.network.manager import NetworkManager
 from nailgun import notifier
-from nailgun.settings import settings
 from nailgun.task.helpers import TaskHelper
+from nailgun.task.progress import deployment_progress
 
 
 class TaskNotFound(Exception):
@@ -42,6 +43,22 @@ class TaskNotFound(Exception):
 
 class NailgunReceiver(object):
 
+    @classmethod
+    def _get_nodes_by_uids(cls, *nodes_lists):
+        """Loads all nodes mentioned in message with one query.
+
+        :returns: {str(node id): Node}
+        """
+        uids = set()
+        for nodes in nodes_lists:
+            uids.update(int(node['uid']) for node in nodes)
+        if not uids:
+            return {}
+        return dict(
+            (str(node_db.id), node_db) for node_db in
+            db().query(Node).filter(Node.id.in_(uids))
+        )
+
     @classmethod
     def remove_nodes_resp(cls, **kwargs):
         logger.info(
@@ -56,8 +73,11 @@ class NailgunReceiver(object):
         status = kwargs.get('status')
         progress = kwargs.get('progress')
 
+        nodes_db = cls._get_nodes_by_uids(
+            nodes, inaccessible_nodes, error_nodes)
+
         for node in nodes:
-            node_db = db().query(Node).get(node['uid'])
+            node_db = nodes_db.get(str(node['uid']))
             if not node_db:
                 logger.error(
                     u"Failed to delete node '%s': node doesn't exist",
@@ -68,7 +88,7 @@ class NailgunReceiver(object):
 
         for node in inaccessible_nodes:
             # Nodes which not answered by rpc just removed from db
-            node_db = db().query(Node).get(node['uid'])
+            node_db = nodes_db.get(str(node['uid']))
             if node_db:
                 logger.warn(
                     u'Node %s not answered by RPC, removing from db',
@@ -76,7 +96,7 @@ class NailgunReceiver(object):
                 db().delete(node_db)
 
         for node in error_nodes:
-            node_db = db().query(Node).get(node['uid'])
+            node_db = nodes_db.get(str(node['uid']))
             if not node_db:
                 logger.error(
                     u"Failed to delete node '%s' marked as error from Naily:"
@@ -87,15 +107,15 @@ class NailgunReceiver(object):
             node_db.status = 'error'
             db().add(node_db)
             node['name'] = node_db.name
-        db().commit()
 
         success_msg = u"No nodes were removed"
         err_msg = u"No errors occurred"
+        notifications = []
         if nodes:
             success_msg = u"Successfully removed {0} node(s)".format(
                 len(nodes)
             )
-            notifier.notify("done", success_msg)
+            notifications.append({'topic': "done", 'message': success_msg})
         if error_nodes:
             err_msg = u"Failed to remove {0} node(s): {1}".format(
                 len(error_nodes),
@@ -103,7 +123,10 @@ class NailgunReceiver(object):
                     [n.get('name') or "ID: {0}".format(n['uid'])
                         for n in error_nodes])
             )
-            notifier.notify("error", err_msg)
+            notifications.append({'topic': "error", 'message': err_msg})
+        # nodes changes are committed together with notifications
+        notifier.notify_many(notifications)
+        db().commit()
         if not error_msg:
             error_msg = ". ".join([success_msg, err_msg])
 
@@ -191,8 +214,10 @@ class NailgunReceiver(object):
             status = task.status
 
         # First of all, let's update nodes in database
+        nodes_db = cls._get_nodes_by_uids(nodes)
+        notifications = []
         for node in nodes:
-            node_db = db().query(Node).get(node['uid'])
+            node_db = nodes_db.get(str(node['uid']))
 
             if not node_db:
                 logger.warning(
@@ -230,44 +255,26 @@ class NailgunReceiver(object):
                                 and not node_db.error_msg:
                             node_db.error_msg = u"Node is offline"
                         # Notification on particular node failure
-                        notifier.notify(
-                            "error",
+                        notifications.append({
+                            'topic': "error",
+                            'message':
                             u"Failed to deploy node '{0}': {1}".format(
                                 node_db.name,
                                 node_db.error_msg or "Unknown error"
                             ),
-                            cluster_id=task.cluster_id,
-                            node_id=node['uid'],
-                            task_uuid=task_uuid
-                        )
+                            'cluster_id': task.cluster_id,
+                            'node_id': node['uid'],
+                            'task_uuid': task_uuid
+                        })
 
-            db().add(node_db)
-            db().commit()
+        # nodes changes are committed together with notifications
+        notifier.notify_many(notifications)
+        db().commit()
 
         # We should calculate task progress by nodes info
         task = db().query(Task).filter_by(uuid=task_uuid).first()
-        coeff = settings.PROVISIONING_PROGRESS_COEFF or 0.3
         if nodes and not progress:
-            nodes_progress = []
-            nodes_db = db().query(Node).filter_by(
-                cluster_id=task.cluster_id).all()
-            for node in nodes_db:
-                if node.status == "discover":
-                    nodes_progress.append(0)
-                elif not node.online:
-                    nodes_progress.append(100)
-                elif node.status in ['provisioning', 'provisioned'] or \
-                        node.needs_reprovision:
-                    nodes_progress.append(float(node.progress) * coeff)
-                elif node.status in ['deploying', 'ready'] or \
-                        node.needs_redeploy:
-                    nodes_progress.append(
-                        100.0 * coeff + float(node.progress) * (1.0 - coeff)
-                    )
-            if nodes_progress:
-                progress = int(
-                    float(sum(nodes_progress)) / len(nodes_progress)
-                )
+            progress = deployment_progress.get_progress(task)
 
         # Let's check the whole task status
         if status in ('error',):
@@ -489,14 +496,12 @@ class NailgunReceiver(object):
                     error_msg = 'At least two nodes are required to be in '\
                                 'the environment for network verification.'
             else:
+                cached_nodes_by_uid = dict(
+                    (str(n['uid']), n) for n in cached_nodes)
                 error_nodes = []
                 for node in nodes:
-                    cached_nodes_filtered = filter(
-                        lambda n: str(n['uid']) == str(node['uid']),
-                        cached_nodes
-                    )
-
-                    if not cached_nodes_filtered:
+                    cached_node = cached_nodes_by_uid.get(str(node['uid']))
+                    if not cached_node:
                         logger.warning(
                             "verify_networks_resp: arguments contain node "
                             "data which is not in the task cache: %r",
@@ -504,58 +509,36 @@ class NailgunReceiver(object):
                         )
                         continue
 
-                    cached_node = cached_nodes_filtered[0]
-
-                    for cached_network in cached_node['networks']:
-                        received_networks_filtered = filter(
-                            lambda n: n['iface'] == cached_network['iface'],
-                            node.get('networks', [])
+                    received_vlans = {}
+                    for received_network in node.get('networks', []):
+                        received_vlans.setdefault(
+                            received_network['iface'],
+                            set(received_network['vlans'])
                         )
 
-                        if received_networks_filtered:
-                            received_network = received_networks_filtered[0]
+                    for cached_network in cached_node['networks']:
+                        iface = cached_network['iface']
+                        if iface in received_vlans:
                             absent_vlans = list(
                                 set(cached_network['vlans']) -
-                                set(received_network['vlans'])
+                                received_vlans[iface]
                             )
                         else:
                             logger.warning(
                                 "verify_networks_resp: arguments don't contain"
                                 " data for interface: uid=%s iface=%s",
-                                node['uid'], cached_network['iface']
+                                node['uid'], iface
                             )
                             absent_vlans = cached_network['vlans']
 
                         if absent_vlans:
-                            data = {'uid': node['uid'],
-                                    'interface': received_network['iface'],
-                                    'absent_vlans': absent_vlans}
-                            node_db = db().query(Node).get(node['uid'])
-                            if node_db:
-                                data['name'] = node_db.name
-                                db_nics = filter(
-                                    lambda i:
-                                    i.name == received_network['iface'],
-                                    node_db.interfaces
-                                )
-                                if db_nics:
-                                    data['mac'] = db_nics[0].mac
-                                else:
-                                    logger.warning(
-                                        "verify_networks_resp: can't find "
-                                        "interface %r for node %r in DB",
-                                        received_network['iface'], node_db.id
-                                    )
-                                    data['mac'] = 'unknown'
-                            else:
-                                logger.warning(
-                                    "verify_networks_resp: can't find node "
-                                    "%r in DB",
-                                    node['uid']
-                                )
-
-                            error_nodes.append(data)
+                            error_nodes.append({
+                                'uid': node['uid'],
+                                'interface': iface,
+                                'absent_vlans': absent_vlans
+                            })
 
+                cls._add_names_and_macs(error_nodes)
                 if error_nodes:
                     result = error_nodes
                     status = 'error'
@@ -569,6 +552,45 @@ class NailgunReceiver(object):
         TaskHelper.update_task_status(task_uuid, status,
                                       progress, error_msg, result)
 
+    @classmethod
+    def _add_names_and_macs(cls, error_nodes):
+        """Adds node name and interface MAC to verification
+        errors, all nodes are loaded with one query.
+        """
+        if not error_nodes:
+            return
+        nodes_db = db().query(Node).options(
+            joinedload('interfaces')
+        ).filter(
+            Node.id.in_(set(int(data['uid']) for data in error_nodes))
+        )
+        names = {}
+        macs = {}
+        for node_db in nodes_db:
+            names[node_db.id] = node_db.name
+            for nic in node_db.interfaces:
+                macs.setdefault((node_db.id, nic.name), nic.mac)
+
+        for data in error_nodes:
+            node_id = int(data['uid'])
+            if node_id not in names:
+                logger.warning(
+                    "verify_networks_resp: can't find node "
+                    "%r in DB",
+                    data['uid']
+                )
+                continue
+            data['name'] = names[node_id]
+            if (node_id, data['interface']) in macs:
+                data['mac'] = macs[(node_id, data['interface'])]
+            else:
+                logger.warning(
+                    "verify_networks_resp: can't find "
+                    "interface %r for node %r in DB",
+                    data['interface'], node_id
+                )
+                data['mac'] = 'unknown'
+
     @classmethod
     def _master_networks_gen(cls, ifaces):
         for iface in ifaces:
@@ -14,40 +14,276 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import Queue
 import threading
+import time
 import traceback
 
 from kombu import Connection
 from kombu.mixins import ConsumerMixin
 
+from nailgun.api.models import Task
 from nailgun.db import db
 from nailgun.logger import logger
+from nailgun import notifier
 import nailgun.rpc as rpc
+from nailgun.rpc.coalescer import ProgressCoalescer
 from nailgun.rpc.receiver import NailgunReceiver
+from nailgun.settings import settings
 
 
-class RPCConsumer(ConsumerMixin):
+class RPCWorker(threading.Thread):
+    """Thread which calls receiver methods for messages
+    from its own queue one by one.
 
-    def __init__(self, connection, receiver):
-        self.connection = connection
+    All messages which are waiting in queue are taken at once and
+    progress-only messages of the same task are merged, so under
+    load database is updated once per batch instead of once per
+    message.
+
+    Every worker has its own database session (db is scoped
+    by thread). Processed messages are passed to consumer
+    thread for acknowledgement, because channel shouldn't
+    be used from several threads.
+    """
+
+    def __init__(self, receiver, processed):
+        super(RPCWorker, self).__init__()
+        self.daemon = True
         self.receiver = receiver
+        self.messages = Queue.Queue()
+        self.processed = processed
+        self._lock = threading.Lock()
+        # method name -> [count, total wait, total time, max time]
+        self._latency = {}
+        self.coalesced = 0
 
-    def get_consumers(self, Consumer, channel):
-        return [Consumer(queues=[rpc.nailgun_queue],
-                         callbacks=[self.consume_msg])]
+    def stop(self):
+        self.messages.put(None)
 
-    def consume_msg(self, body, msg):
+    def _get_batch(self):
+        """Waits for message and takes all queued messages.
+
+        :returns: (list of items, whether worker should stop)
+        """
+        batch = [self.messages.get()]
+        while batch[-1] is not None:
+            try:
+                batch.append(self.messages.get_nowait())
+            except Queue.Empty:
+                break
+        if batch[-1] is None:
+            return batch[:-1], True
+        return batch, False
+
+    def run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._get_batch()
+            coalesced = ProgressCoalescer.coalesce(
+                [(body, (msg, received_at))
+                 for body, msg, received_at in batch]
+            )
+            with self._lock:
+                self.coalesced += len(batch) - len(coalesced)
+            for body, payloads in coalesced:
+                started_at = time.time()
+                try:
+                    self.process_msg(body)
+                finally:
+                    for msg, received_at in payloads:
+                        self.processed.put(msg)
+                    self._account(
+                        body.get("method"),
+                        started_at - payloads[0][1],
+                        time.time() - started_at
+                    )
+        db.remove()
+
+    def process_msg(self, body):
         callback = getattr(self.receiver, body["method"])
         try:
-            callback(**body["args"])
+            # notifications of message are written by one insert
+            with notifier.buffered():
+                callback(**body["args"])
             db().commit()
         except Exception:
             logger.error(traceback.format_exc())
             db().rollback()
         finally:
-            msg.ack()
             db().expire_all()
 
+    def _account(self, method, wait, duration):
+        with self._lock:
+            stats = self._latency.setdefault(method, [0, 0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += wait
+            stats[2] += duration
+            stats[3] = max(stats[3], duration)
+
+    def latency(self):
+        with self._lock:
+            return dict(
+                (method, list(stats))
+                for method, stats in self._latency.iteritems()
+            )
+
+
+class RPCConsumer(ConsumerMixin):
+    """Consumer which dispatches messages to pool of workers.
+
+    Messages are dispatched by cluster of their task (or by top-level
+    task for tasks without cluster), so messages of all tasks of one
+    cluster are always handled by the same worker in order they were
+    received, as their handlers update the same cluster, nodes and
+    parent tasks. Messages of different clusters are handled in
+    parallel.
+    """
+
+    # how often to acknowledge processed messages
+    # if there are no new messages, seconds
+    ack_interval = 0.1
+    # how long to wait for workers to handle queued messages
+    # when consumer is stopped, seconds
+    stop_timeout = 10
+    # max number of remembered dispatch keys of tasks
+    max_dispatch_keys = 1000
+
+    def __init__(self, connection, receiver, workers=1,
+                 prefetch_count=None, metrics_interval=None):
+        self.connection = connection
+        self.receiver = receiver
+        self.prefetch_count = prefetch_count
+        self.metrics_interval = metrics_interval
+        self._metrics_logged_at = time.time()
+        self.processed = Queue.Queue()
+        # task uuid -> key by which its messages are dispatched
+        self._dispatch_keys = {}
+        self.workers = [
+            RPCWorker(receiver, self.processed)
+            for _ in xrange(max(workers, 1))
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def get_consumers(self, Consumer, channel):
+        consumer = Consumer(queues=[rpc.nailgun_queue],
+                            callbacks=[self.consume_msg])
+        if self.prefetch_count:
+            consumer.qos(prefetch_count=self.prefetch_count)
+        return [consumer]
+
+    def consume(self, *args, **kwargs):
+        kwargs.setdefault('safety_interval', self.ack_interval)
+        return super(RPCConsumer, self).consume(*args, **kwargs)
+
+    def get_dispatch_key(self, task_uuid):
+        """:returns: ('cluster', cluster id) for tasks of cluster,
+        uuid of top-level task for others or task_uuid itself if
+        there is no such task.
+        """
+        key = self._dispatch_keys.get(task_uuid)
+        if key is not None:
+            return key
+        try:
+            task = db().query(Task).filter_by(uuid=task_uuid).first()
+            if task is None:
+                return task_uuid
+            if task.cluster_id is not None:
+                key = ('cluster', task.cluster_id)
+            else:
+                while task.parent is not None:
+                    task = task.parent
+                key = task.uuid
+        finally:
+            # consumer thread shouldn't keep transaction open
+            db().rollback()
+        if len(self._dispatch_keys) >= self.max_dispatch_keys:
+            self._dispatch_keys.clear()
+        self._dispatch_keys[task_uuid] = key
+        return key
+
+    def get_worker(self, body):
+        task_uuid = body.get("args", {}).get("task_uuid")
+        if task_uuid is None:
+            return self.workers[0]
+        key = self.get_dispatch_key(task_uuid)
+        return self.workers[hash(key) % len(self.workers)]
+
+    def consume_msg(self, body, msg):
+        self.get_worker(body).messages.put((body, msg, time.time()))
+        self.ack_processed()
+
+    def on_iteration(self):
+        self.ack_processed()
+        if self.metrics_interval and \
+                time.time() - self._metrics_logged_at > self.metrics_interval:
+            self._metrics_logged_at = time.time()
+            logger.debug("RPC consumer metrics: %s", self.metrics())
+
+    def ack_processed(self):
+        while True:
+            try:
+                msg = self.processed.get_nowait()
+            except Queue.Empty:
+                break
+            try:
+                msg.ack()
+            except Exception:
+                # message will be redelivered by broker
+                logger.error(traceback.format_exc())
+
+    def stop_workers(self, timeout=None):
+        """Stops workers after they handle queued messages.
+
+        :param timeout: max time to wait for all workers, seconds,
+            stop_timeout by default.
+        """
+        if timeout is None:
+            timeout = self.stop_timeout
+        for worker in self.workers:
+            worker.stop()
+        deadline = time.time() + timeout
+        for worker in self.workers:
+            worker.join(max(deadline - time.time(), 0))
+        alive = [w.name for w in self.workers if w.is_alive()]
+        if alive:
+            logger.warning(
+                "RPC workers %s haven't stopped in %s seconds",
+                ", ".join(alive), timeout
+            )
+
+    def metrics(self):
+        """:returns: Depth of workers queues, number of processed
+        but not acknowledged messages, number of messages merged
+        with other ones, and for every receiver method
+        number of handled messages, average time spent in queue,
+        average and max handling time in seconds.
+        """
+        handlers = {}
+        for worker in self.workers:
+            for method, stats in worker.latency().iteritems():
+                total = handlers.setdefault(method, [0, 0.0, 0.0, 0.0])
+                total[0] += stats[0]
+                total[1] += stats[1]
+                total[2] += stats[2]
+                total[3] = max(total[3], stats[3])
+        return {
+            'queue_depth': [w.messages.qsize() for w in self.workers],
+            'not_acknowledged': self.processed.qsize(),
+            'coalesced': sum(w.coalesced for w in self.workers),
+            'handlers': dict(
+                (method, {
+                    'count': count,
+                    'avg_wait': wait / count,
+                    'avg_latency': duration / count,
+                    'max_latency': max_duration
+                })
+                for method, (count, wait, duration, max_duration)
+                in handlers.iteritems()
+            )
+        }
+
 
 class RPCKombuThread(threading.Thread):
 
@@ -65,6 +301,16 @@ class RPCKombuThread(threading.Thread):
         super(RPCKombuThread, self).join(timeout)
 
     def run(self):
+        consumer_settings = settings.RPC_CONSUMER
         with Connection(rpc.conn_str) as conn:
-            self.consumer = RPCConsumer(conn, self.receiver)
-            self.consumer.run()
+            self.consumer = RPCConsumer(
+                conn,
+                self.receiver,
+                workers=int(consumer_settings.get('workers', 1)),
+                prefetch_count=consumer_settings.get('prefetch_count'),
+                metrics_interval=consumer_settings.get('metrics_interval')
+            )
+            try:
+                self.consumer.run()
+            finally:
+                self.consumer.stop_workers()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from nailgun.api.models import Node
+from nailgun.api.models import Task
+from nailgun.db import db
+from nailgun.db import register_cache_invalidation
+from nailgun.settings import settings
+
+
+class NodesProgress(object):
+    """Running sum and count of progress of nodes of a cluster.
+    """
+
+    def __init__(self, cluster_id):
+        self.cluster_id = cluster_id
+        # node id -> node share of task progress
+        self.nodes = {}
+        self.total = 0.0
+        # ids of nodes which were changed since they were accounted
+        self.changed = set()
+
+    def set_node(self, node_id, progress):
+        self.remove_node(node_id)
+        if progress is not None:
+            self.nodes[node_id] = progress
+            self.total += progress
+
+    def remove_node(self, node_id):
+        progress = self.nodes.pop(node_id, None)
+        if progress is not None:
+            self.total -= progress
+
+    @property
+    def progress(self):
+        if not self.nodes:
+            return None
+        # small epsilon compensates float error accumulated by deltas
+        return int(self.total / len(self.nodes) + 1e-9)
+
+
+class DeploymentProgress(object):
+    """Progress of deployment tasks calculated by progress of nodes.
+
+    Nodes of task cluster are loaded only for the first message of
+    the task. Ids of nodes changed by any committed session of
+    the process are tracked, so later messages reload and recount
+    only changed nodes instead of the whole cluster. Progress of
+    task is forgotten when task is finished or deleted.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # task uuid -> NodesProgress
+        self._tasks = {}
+
+    @classmethod
+    def node_progress(cls, node):
+        """:returns: node share of task progress or None
+        if node shouldn't be taken into account.
+        """
+        coeff = settings.PROVISIONING_PROGRESS_COEFF or 0.3
+        if node.status == "discover":
+            return 0
+        elif not node.online:
+            return 100
+        elif node.status in ['provisioning', 'provisioned'] or \
+                node.needs_reprovision:
+            return float(node.progress) * coeff
+        elif node.status in ['deploying', 'ready'] or \
+                node.needs_redeploy:
+            return 100.0 * coeff + float(node.progress) * (1.0 - coeff)
+        return None
+
+    def get_progress(self, task):
+        """:returns: progress of task by its cluster nodes or
+        None if there are no nodes to calculate it.
+        """
+        with self._lock:
+            progress = self._tasks.get(task.uuid)
+            if progress is None or progress.cluster_id != task.cluster_id:
+                # task is registered before loading nodes, so nodes
+                # committed by other sessions meanwhile are reloaded later
+                progress = NodesProgress(task.cluster_id)
+                self._tasks[task.uuid] = progress
+                nodes = db().query(Node).filter_by(
+                    cluster_id=task.cluster_id)
+                for node in nodes:
+                    progress.set_node(node.id, self.node_progress(node))
+            elif progress.changed:
+                changed, progress.changed = progress.changed, set()
+                for node in db().query(Node).filter(Node.id.in_(changed)):
+                    changed.discard(node.id)
+                    if node.cluster_id == progress.cluster_id:
+                        progress.set_node(node.id, self.node_progress(node))
+                    else:
+                        progress.remove_node(node.id)
+                # nodes which were deleted
+                for node_id in changed:
+                    progress.remove_node(node_id)
+            return progress.progress
+
+    def nodes_changed(self, nodes_ids):
+        with self._lock:
+            for progress in self._tasks.itervalues():
+                progress.changed.update(nodes_ids)
+
+    def clear(self):
+        """Forgets progress of all tasks, so nodes of their clusters
+        are reloaded, e.g. after bulk update of unknown nodes.
+        """
+        with self._lock:
+            self._tasks.clear()
+
+    def forget(self, task_uuid):
+        with self._lock:
+            self._tasks.pop(task_uuid, None)
+
+
+deployment_progress = DeploymentProgress()
+
+
+def _nodes_changed(nodes_ids):
+    # ids of nodes changed by bulk update or delete aren't known
+    if nodes_ids is None:
+        deployment_progress.clear()
+    else:
+        deployment_progress.nodes_changed(nodes_ids)
+
+
+def _tasks_finished(tasks_uuids):
+    if tasks_uuids is None:
+        deployment_progress.clear()
+    else:
+        for task_uuid in tasks_uuids:
+            deployment_progress.forget(task_uuid)
+
+
+register_cache_invalidation(Node, _nodes_changed, key=lambda n: n.id)
+register_cache_invalidation(
+    Task,
+    _tasks_finished,
+    key=lambda t: t.uuid,
+    predicate=lambda session, t: (
+        t in session.deleted or t.status in ('ready', 'error'))
+)
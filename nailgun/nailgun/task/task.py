@@ -118,7 +118,7 @@ class DeploymentTask(object):
                     n.status = 'provisioned'
                 n.progress = 0
                 db().add(n)
-                db().commit()
+        db().commit()
 
         # here we replace provisioning data if user redefined them
         serialized_cluster = task.cluster.replaced_deployment_info or \
@@ -48,6 +48,9 @@ from nailgun.db import db
 from nailgun.db import flush
 from nailgun.db import syncdb
 from nailgun.fixtures.fixman import upload_fixture
+from nailgun.keepalive.liveness import node_liveness
+from nailgun.logs.parser import log_parsers
+from nailgun.logs.sources import log_dirs
 from nailgun.network.manager import NetworkManager
 from nailgun.wsgi import build_app
 
@@ -616,6 +619,9 @@ class BaseTestCase(TestCase):
 
     def setUp(self):
         flush()
+        node_liveness.clear()
+        log_parsers.clear()
+        log_dirs.clear()
         self.env = Environment(app=self.app)
         self.env.upload_fixtures(self.fixtures)
 
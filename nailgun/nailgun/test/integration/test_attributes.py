@@ -117,6 +117,29 @@ class TestAttributes(BaseIntegrationTest):
         )
         self.assertEquals(400, resp.status)
 
+    def test_attributes_not_modified(self):
+        cluster_id = self.env.create_cluster(api=True)['id']
+        url = reverse(
+            'ClusterAttributesHandler',
+            kwargs={'cluster_id': cluster_id})
+        resp = self.app.get(url, headers=self.default_headers)
+        etag = resp.header('ETag')
+        headers = dict(self.default_headers, **{'If-None-Match': etag})
+        resp = self.app.get(url, headers=headers)
+        self.assertEquals(304, resp.status)
+
+        self.app.put(
+            url,
+            params=json.dumps({'editable': {'foo': 'bar'}}),
+            headers=self.default_headers
+        )
+        resp = self.app.get(url, headers=headers)
+        self.assertEquals(200, resp.status)
+        self.assertEquals(
+            {'foo': 'bar'},
+            json.loads(resp.body)['editable']
+        )
+
     def test_get_default_attributes(self):
         cluster = self.env.create_cluster(api=True)
         release = self.db.query(Release).get(
@@ -47,6 +47,25 @@ class TestHandlers(BaseIntegrationTest):
         self.assertEquals(cluster.name, response['name'])
         self.assertEquals(cluster.release.id, response['release']['id'])
 
+    def test_cluster_get_not_modified(self):
+        cluster = self.env.create_cluster(api=False)
+        url = reverse('ClusterHandler', kwargs={'cluster_id': cluster.id})
+        resp = self.app.get(url, headers=self.default_headers)
+        self.assertEquals(200, resp.status)
+        etag = resp.header('ETag')
+
+        headers = dict(self.default_headers, **{'If-None-Match': etag})
+        resp = self.app.get(url, headers=headers)
+        self.assertEquals(304, resp.status)
+        self.assertEquals('', resp.body)
+
+        cluster.name = 'Renamed cluster'
+        self.db.commit()
+        resp = self.app.get(url, headers=headers)
+        self.assertEquals(200, resp.status)
+        self.assertNotEquals(etag, resp.header('ETag'))
+        self.assertEquals('Renamed cluster', json.loads(resp.body)['name'])
+
     def test_cluster_creation(self):
         release = self.env.create_release(api=False)
         yet_another_cluster_name = 'Yet another cluster'
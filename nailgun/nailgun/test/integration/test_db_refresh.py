@@ -21,9 +21,13 @@ from paste.fixture import TestApp
 from sqlalchemy.orm.events import orm
 
 from nailgun.api.models import Node
+from nailgun.db import db
 from nailgun.db import engine
 from nailgun.db import flush
+from nailgun.db import has_pending_invalidation
 from nailgun.db import NoCacheQuery
+from nailgun.db import register_cache_invalidation
+from nailgun.db import session_scope
 from nailgun.wsgi import build_app
 
 
@@ -59,3 +63,69 @@ class TestDBRefresh(TestCase):
             Node.id == node.id
         ).first()
         self.assertEquals(node.mac, u"12345678")
+
+    def test_session_scope_trusts_identity_map(self):
+        node = Node()
+        node.mac = u"ASDFGHJKLMNOPR"
+        node.timestamp = datetime.now()
+        db().add(node)
+        db().commit()
+
+        with session_scope():
+            node = db().query(Node).filter(Node.id == node.id).first()
+            node2 = self.db2.query(Node).filter(
+                Node.id == node.id
+            ).first()
+            node2.mac = u"12345678"
+            self.db2.commit()
+            db().query(Node).filter(Node.id == node.id).first()
+            self.assertEquals(node.mac, u"ASDFGHJKLMNOPR")
+            db().commit()
+        db().query(Node).filter(Node.id == node.id).first()
+        self.assertEquals(node.mac, u"12345678")
+        db().commit()
+
+
+# keys passed to invalidation callback registered by tests below
+invalidated = []
+register_cache_invalidation(
+    Node,
+    invalidated.append,
+    key=lambda node: node.id,
+    predicate=lambda session, node: node.name != 'ignored'
+)
+
+
+class TestCacheInvalidation(TestCase):
+
+    def setUp(self):
+        self.db = orm.scoped_session(
+            orm.sessionmaker(bind=engine, query_cls=NoCacheQuery)
+        )()
+        flush()
+        invalidated[:] = []
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_invalidation_on_commit(self):
+        node = Node(mac=u"ASDFGHJKLMNOPR", timestamp=datetime.now())
+        self.db.add(node)
+        self.db.flush()
+        self.assertTrue(has_pending_invalidation(self.db, Node))
+        self.assertEquals(invalidated, [])
+        self.db.commit()
+        self.assertEquals(invalidated, [set([node.id])])
+        self.assertFalse(has_pending_invalidation(self.db, Node))
+
+        node.mac = u"12345678"
+        self.db.flush()
+        self.db.rollback()
+        node.name = 'ignored'
+        self.db.commit()
+        self.assertEquals(invalidated, [set([node.id])])
+
+        self.db.query(Node).update({'mac': u"87654321"},
+                                   synchronize_session=False)
+        self.db.commit()
+        self.assertEquals(invalidated, [set([node.id]), None])
@@ -14,10 +14,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import json
 import time
 
+from nailgun.api.models import Node
+from nailgun.api.models import Notification
+from nailgun.keepalive.liveness import NodeLiveness
 from nailgun.keepalive.watcher import KeepAliveThread
 from nailgun.test.base import BaseIntegrationTest
+from nailgun.test.base import reverse
 
 
 class TestKeepalive(BaseIntegrationTest):
@@ -58,3 +63,60 @@ class TestKeepalive(BaseIntegrationTest):
         time.sleep(self.watcher.interval + 2)
         self.env.refresh_nodes()
         self.assertEqual(node.online, True)
+
+    def test_node_becomes_online_on_check_in(self):
+        node = self.env.create_node(status="discover",
+                                    roles=["controller"],
+                                    name="Dead or alive")
+        self.env.wait_for_true(
+            self.check_online,
+            args=[node, False],
+            timeout=self.timeout)
+        notification = self.db.query(Notification).filter_by(
+            node_id=node.id, topic="error").first()
+        self.assertIn("has gone away", notification.message)
+
+        resp = self.app.put(
+            reverse('NodeCollectionHandler'),
+            json.dumps([{'mac': node.mac, 'is_agent': True}]),
+            headers=self.default_headers)
+        self.assertEquals(resp.status, 200)
+        self.env.refresh_nodes()
+        self.assertEquals(node.online, True)
+        notification = self.db.query(Notification).filter_by(
+            node_id=node.id, topic="discover").first()
+        self.assertIn("is back online", notification.message)
+
+
+class TestNodeLiveness(BaseIntegrationTest):
+
+    def test_flush_honours_interval_and_batch(self):
+        node1 = self.env.create_node(api=False)
+        node2 = self.env.create_node(api=False)
+        liveness = NodeLiveness(flush_interval=60, flush_batch=2)
+
+        liveness.touch(node1.id)
+        self.assertEquals(liveness.flush(), 0)
+        liveness.touch(node2.id)
+        self.assertEquals(liveness.flush(), 2)
+        self.assertEquals(liveness.flush(force=True), 0)
+
+    def test_flush_switches_returned_node_online(self):
+        node = self.env.create_node(api=False, online=False)
+        liveness = NodeLiveness(flush_interval=60, flush_batch=100)
+        liveness.touch(node.id, online=node.online)
+
+        self.db.expire_all()
+        self.assertFalse(self.db.query(Node).get(node.id).online)
+        self.assertEquals(self.db.query(Notification).count(), 0)
+
+        self.assertEquals(liveness.flush(), 1)
+        self.db.expire_all()
+        self.assertTrue(self.db.query(Node).get(node.id).online)
+        notification = self.db.query(Notification).one()
+        self.assertIn("is back online", notification.message)
+
+        # node which is already online isn't reported again
+        liveness.touch(node.id, online=False)
+        liveness.flush()
+        self.assertEquals(self.db.query(Notification).count(), 1)
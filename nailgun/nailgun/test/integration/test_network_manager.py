@@ -35,6 +35,7 @@ from nailgun.api.models import NetworkGroup
 from nailgun.api.models import Node
 from nailgun.api.models import NodeNICInterface
 from nailgun.api.models import Vlan
+from nailgun.errors import errors
 from nailgun.network.manager import NetworkManager
 from nailgun.test.base import BaseIntegrationTest
 from nailgun.test.base import fake_tasks
@@ -134,6 +135,47 @@ class TestNetworkManager(BaseIntegrationTest):
             1
         )
 
+    def test_assign_ips_for_many_nodes_at_once(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[{"pending_addition": True} for _ in xrange(5)]
+        )
+        nodes_ids = [n.id for n in self.env.nodes]
+        self.env.network_manager.assign_ips(nodes_ids[:2], "management")
+        self.env.network_manager.assign_ips(nodes_ids, "management")
+
+        management_net = self.db.query(Network).join(NetworkGroup).\
+            filter(NetworkGroup.cluster_id == self.env.clusters[0].id).\
+            filter_by(name='management').first()
+        ips = self.db.query(IPAddr).filter_by(
+            network=management_net.id
+        ).all()
+        self.assertEquals(
+            sorted([ip.node for ip in ips]),
+            sorted(nodes_ids)
+        )
+        self.assertEquals(len(set([ip.ip_addr for ip in ips])), 5)
+
+    def test_assign_ips_fails_for_nodes_from_different_clusters(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[{"pending_addition": True}]
+        )
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[{"pending_addition": True}]
+        )
+        self.assertRaises(
+            Exception,
+            self.env.network_manager.assign_ips,
+            [n.id for n in self.env.nodes],
+            "management"
+        )
+        ips_count = self.db.query(IPAddr).filter(
+            IPAddr.node.in_([n.id for n in self.env.nodes])
+        ).count()
+        self.assertEquals(ips_count, 0)
+
     def test_get_default_nic_networkgroups(self):
         cluster = self.env.create_cluster(api=True)
         node = self.env.create_node(api=True)
@@ -262,6 +304,46 @@ class TestNetworkManager(BaseIntegrationTest):
             full_results.append(result)
         self.assertEqual(len(full_results), 2)
 
+    def test_get_interfaces_by_network(self):
+        cluster = self.env.create(
+            cluster_kwargs={'net_manager': 'VlanManager'},
+            nodes_kwargs=[
+                {"pending_addition": True, "api": True},
+                {"pending_addition": True, "api": True}
+            ]
+        )
+        self.env.create_node(api=True)
+        netmanager = self.env.network_manager
+
+        interfaces = netmanager.get_interfaces_by_network(cluster['id'])
+        self.assertEquals(
+            set(node_id for node_id, _ in interfaces),
+            set(n.id for n in self.env.nodes[:2])
+        )
+        for node in self.env.nodes[:2]:
+            for ng in node.cluster.network_groups:
+                self.assertEquals(
+                    interfaces[(node.id, ng.name)],
+                    netmanager._get_interface_by_network_name(
+                        node, ng.name)
+                )
+
+        netmanager.assign_ips(
+            [n.id for n in self.env.nodes[:2]], "management")
+        ips_mapped = netmanager.get_grouped_ips_by_node()
+        networks_grouped = netmanager.get_networks_grouped_by_cluster()
+        for node in self.env.nodes[:2]:
+            args = (
+                node,
+                ips_mapped.get(node.id, []),
+                networks_grouped.get(node.cluster_id, [])
+            )
+            self.assertEquals(
+                netmanager.get_node_networks_optimized(*args),
+                netmanager.get_node_networks_optimized(
+                    *args, interfaces=interfaces)
+            )
+
     def test_nets_empty_list_if_node_does_not_belong_to_cluster(self):
         node = self.env.create_node(api=False)
         network_data = self.env.network_manager.get_node_networks(node.id)
@@ -462,3 +544,114 @@ class TestNetworkManager(BaseIntegrationTest):
             ),
             itertools.product((0, 1), ('eth0', 'eth1'))
         )
+
+    def test_get_free_ips_skips_used_ips_and_gateway(self):
+        cluster = self.env.create_cluster(api=True)
+        ng = self.db.query(NetworkGroup).filter_by(
+            cluster_id=cluster['id'],
+            name='management'
+        ).first()
+        ip_range = ng.ip_ranges[0]
+        first = IPAddress(ip_range.first)
+        ng.gateway = str(first)
+        self.db.add(IPAddr(ip_addr=str(first + 1)))
+        self.db.commit()
+
+        free_ips = self.env.network_manager.get_free_ips(ng.id, num=2)
+        self.assertEquals(free_ips, [str(first + 2), str(first + 3)])
+
+    def test_get_free_ips_notices_released_ips(self):
+        cluster = self.env.create_cluster(api=True)
+        ng = self.db.query(NetworkGroup).filter_by(
+            cluster_id=cluster['id'],
+            name='management'
+        ).first()
+        vip = self.env.network_manager.assign_vip(cluster['id'], 'management')
+        self.assertNotIn(
+            vip,
+            self.env.network_manager.get_free_ips(ng.id, num=5)
+        )
+
+        self.db.query(IPAddr).filter_by(ip_addr=vip).delete()
+        self.db.commit()
+        self.assertIn(
+            vip,
+            self.env.network_manager.get_free_ips(ng.id, num=5)
+        )
+
+    def test_commit_ips_keeps_cached_index_in_step(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[{"api": False}]
+        )
+        node = self.env.nodes[0]
+        net = self.db.query(Network).first()
+        self.db.add(IPAddr(network=net.id, ip_addr='10.20.0.5'))
+        self.db.commit()
+        manager = self.env.network_manager
+        index = manager._get_allocation_index(net.network_group)
+
+        manager._commit_ips([
+            {'network': net.id, 'ip_addr': '10.20.0.6', 'node': node.id},
+            {'network': net.id, 'ip_addr': '10.20.0.7', 'node': None}
+        ])
+        self.assertIs(manager._get_allocation_index(net.network_group), index)
+
+        # row inserted by someone else makes index reload
+        self.db.add(IPAddr(network=net.id, ip_addr='10.20.0.8'))
+        self.db.commit()
+        self.assertIsNot(
+            manager._get_allocation_index(net.network_group), index)
+
+    def test_get_free_ips_from_overlapping_ranges(self):
+        cluster = self.env.create_cluster(api=True)
+        ng = self.db.query(NetworkGroup).filter_by(
+            cluster_id=cluster['id'],
+            name='management'
+        ).first()
+        map(self.db.delete, ng.ip_ranges)
+        for first, last in (('10.0.0.5', '10.0.0.7'),
+                            ('10.0.0.2', '10.0.0.6')):
+            self.db.add(IPAddrRange(
+                first=first,
+                last=last,
+                network_group_id=ng.id
+            ))
+        ng.gateway = '10.0.0.1'
+        self.db.commit()
+
+        self.assertEquals(
+            self.env.network_manager.get_free_ips(ng.id, num=6),
+            ['10.0.0.2', '10.0.0.3', '10.0.0.4', '10.0.0.5',
+             '10.0.0.6', '10.0.0.7']
+        )
+        self.assertRaises(
+            errors.OutOfIPs,
+            self.env.network_manager.get_free_ips, ng.id, num=7
+        )
+
+    def test_get_free_ips_raises_out_of_ips(self):
+        cluster = self.env.create_cluster(api=True)
+        ng = self.db.query(NetworkGroup).filter_by(
+            cluster_id=cluster['id'],
+            name='management'
+        ).first()
+        map(self.db.delete, ng.ip_ranges)
+        self.db.add(IPAddrRange(
+            first='10.0.0.1',
+            last='10.0.0.2',
+            network_group_id=ng.id
+        ))
+        self.db.commit()
+
+        self.env.network_manager.assign_vip(cluster['id'], 'management')
+        self.assertEquals(
+            self.env.network_manager.get_free_ips(ng.id),
+            ['10.0.0.2']
+        )
+        self.assertRaises(
+            errors.OutOfIPs,
+            self.env.network_manager.get_free_ips,
+            ng.id,
+            num=2
+        )
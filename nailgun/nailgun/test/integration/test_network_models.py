@@ -18,6 +18,7 @@ import json
 
 from sqlalchemy.sql import not_
 
+from nailgun.api.models import IPAddrRange
 from nailgun.api.models import Network
 from nailgun.api.models import NetworkGroup
 from nailgun.api.models import Vlan
@@ -187,3 +188,81 @@ class TestNetworkModels(BaseIntegrationTest):
         self.assertEquals(len(nets_db), kw['amount'])
         self.assertEquals(nets_db[0].gateway, "10.0.0.5")
         self.assertEquals(nets_db[1].gateway, "10.0.0.5")
+
+    def test_network_group_ip_ranges_membership(self):
+        cluster = self.env.create_cluster(api=False)
+        ng = NetworkGroup(
+            release=cluster.release_id,
+            cidr='10.0.0.0/24',
+            netmask='255.255.255.0',
+            name='fixed',
+            cluster_id=cluster.id
+        )
+        ng.ip_ranges = [
+            IPAddrRange(first='10.0.0.20', last='10.0.0.30'),
+            IPAddrRange(first='10.0.0.2', last='10.0.0.10'),
+            IPAddrRange(first='10.0.0.5', last='10.0.0.12')
+        ]
+        self.db.add(ng)
+        self.db.commit()
+
+        self.assertEquals(
+            ng.ips_in_ranges(
+                ['10.0.0.1', '10.0.0.2', '10.0.0.12', '10.0.0.13',
+                 '10.0.0.25', '10.0.0.31']
+            ),
+            [False, True, True, False, True, False]
+        )
+        firsts, lasts = ng.ip_ranges_bounds
+        self.assertEquals(len(firsts), 2)
+
+    def test_network_group_ip_ranges_bounds_reset_on_commit(self):
+        cluster = self.env.create_cluster(api=True)
+        ng = self.db.query(NetworkGroup).filter_by(
+            cluster_id=cluster['id'],
+            name='public'
+        ).first()
+        self.assertFalse(ng.ip_in_ranges('172.16.0.50'))
+        self.assertIn(ng.id, NetworkGroup._ip_ranges_bounds)
+
+        self.db.add(IPAddrRange(network_group_id=ng.id,
+                                first='172.16.0.50', last='172.16.0.60'))
+        self.db.flush()
+        self.db.expire(ng, ['ip_ranges'])
+        # other sessions don't see changes yet, so bounds stay cached
+        self.assertIn(ng.id, NetworkGroup._ip_ranges_bounds)
+        self.assertTrue(ng.ip_in_ranges('172.16.0.50'))
+        self.db.rollback()
+        self.assertIn(ng.id, NetworkGroup._ip_ranges_bounds)
+        self.assertFalse(ng.ip_in_ranges('172.16.0.50'))
+
+        self.db.query(IPAddrRange).filter_by(
+            network_group_id=ng.id).delete()
+        self.db.commit()
+        self.assertNotIn(ng.id, NetworkGroup._ip_ranges_bounds)
+        self.assertFalse(ng.ip_in_ranges('172.16.0.20'))
+
+    def test_network_group_ip_ranges_bounds_reset_on_update(self):
+        cluster = self.env.create_cluster(api=True)
+        ng = self.db.query(NetworkGroup).filter_by(
+            cluster_id=cluster['id'],
+            name='public'
+        ).first()
+        self.assertFalse(ng.ip_in_ranges('172.16.0.50'))
+
+        nets = self.env.generate_ui_networks(cluster['id'])
+        for net in nets['networks']:
+            if net['id'] == ng.id:
+                net['ip_ranges'] = [['172.16.0.20', '172.16.0.60']]
+        resp = self.app.put(
+            reverse(
+                'NetworkConfigurationHandler',
+                kwargs={'cluster_id': cluster['id']}),
+            json.dumps(nets),
+            headers=self.default_headers
+        )
+        self.assertEquals(resp.status, 202)
+
+        ng = self.db.query(NetworkGroup).get(ng.id)
+        self.assertTrue(ng.ip_in_ranges('172.16.0.50'))
+        self.assertFalse(ng.ip_in_ranges('172.16.0.61'))
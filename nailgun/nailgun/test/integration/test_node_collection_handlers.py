@@ -16,8 +16,12 @@
 
 import json
 
+from mock import patch
+
+from nailgun.api.handlers.node import NodeCollectionHandler
 from nailgun.api.models import Node
 from nailgun.api.models import Notification
+from nailgun.keepalive.liveness import node_liveness
 from nailgun.test.base import BaseIntegrationTest
 from nailgun.test.base import reverse
 
@@ -69,6 +73,151 @@ class TestHandlers(BaseIntegrationTest):
             response[0]['id']
         )
 
+    def test_node_list_is_streamed_by_chunks(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[{"pending_addition": True} for _ in xrange(5)]
+        )
+        self.env.network_manager.assign_ips(
+            [n.id for n in self.env.nodes],
+            "management"
+        )
+
+        with patch.object(NodeCollectionHandler, 'stream_chunk_size', 2):
+            resp = self.app.get(
+                reverse('NodeCollectionHandler'),
+                headers=self.default_headers
+            )
+        self.assertEquals(200, resp.status)
+        response = json.loads(resp.body)
+        self.assertEquals(
+            [n['id'] for n in response],
+            sorted([n.id for n in self.env.nodes])
+        )
+        for node in response:
+            management = filter(
+                lambda net: net['name'] == 'management',
+                node['network_data']
+            )[0]
+            self.assertIn('ip', management)
+
+    def test_node_list_fields_projection(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[{"roles": ["controller"]}, {}]
+        )
+        resp = self.app.get(
+            reverse('NodeCollectionHandler'),
+            params={'fields': 'status,roles'},
+            headers=self.default_headers
+        )
+        self.assertEquals(200, resp.status)
+        response = json.loads(resp.body)
+        self.assertEquals(2, len(response))
+        for node in response:
+            self.assertEquals(
+                set(node.keys()),
+                set(['id', 'status', 'roles'])
+            )
+        self.assertEquals(response[0]['roles'], ['controller'])
+
+        resp = self.app.get(
+            reverse('NodeCollectionHandler'),
+            params={'fields': 'network_data'},
+            headers=self.default_headers
+        )
+        response = json.loads(resp.body)
+        for node in response:
+            self.assertEquals(
+                set(node.keys()),
+                set(['id', 'network_data'])
+            )
+
+    def test_node_list_invalid_fields(self):
+        resp = self.app.get(
+            reverse('NodeCollectionHandler'),
+            params={'fields': 'status,password'},
+            headers=self.default_headers,
+            expect_errors=True
+        )
+        self.assertEquals(400, resp.status)
+
+    def test_node_list_pagination(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[{} for _ in xrange(5)]
+        )
+        nodes_ids = sorted([n.id for n in self.env.nodes])
+
+        def get_ids(**params):
+            params['fields'] = 'id'
+            resp = self.app.get(
+                reverse('NodeCollectionHandler'),
+                params=params,
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            return [n['id'] for n in json.loads(resp.body)]
+
+        with patch.object(NodeCollectionHandler, 'stream_chunk_size', 2):
+            self.assertEquals(get_ids(limit=3), nodes_ids[:3])
+            self.assertEquals(get_ids(limit=3, offset=3), nodes_ids[3:])
+            self.assertEquals(get_ids(offset=1), nodes_ids[1:])
+            self.assertEquals(
+                get_ids(after_id=nodes_ids[1], limit=2),
+                nodes_ids[2:4]
+            )
+
+        resp = self.app.get(
+            reverse('NodeCollectionHandler'),
+            params={'limit': 'abc'},
+            headers=self.default_headers,
+            expect_errors=True
+        )
+        self.assertEquals(400, resp.status)
+
+    def test_node_list_since_revision(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[{} for _ in xrange(3)]
+        )
+        nodes_ids = sorted([n.id for n in self.env.nodes])
+
+        def get_changes(since):
+            resp = self.app.get(
+                reverse('NodeCollectionHandler'),
+                params={'since': since, 'fields': 'id,name'},
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            return json.loads(resp.body)
+
+        response = get_changes(0)
+        self.assertEquals(response['ids'], nodes_ids)
+        self.assertEquals([n['id'] for n in response['items']], nodes_ids)
+        revision = response['revision']
+        self.assertEquals(get_changes(revision)['items'], [])
+
+        node = self.db.query(Node).get(nodes_ids[1])
+        node.name = 'changed'
+        self.db.commit()
+        response = get_changes(revision)
+        self.assertEquals(response['ids'], nodes_ids)
+        self.assertEquals(
+            response['items'],
+            [{'id': nodes_ids[1], 'name': 'changed'}]
+        )
+        self.assertTrue(response['revision'] > revision)
+
+        for param in ('limit', 'offset', 'after_id'):
+            resp = self.app.get(
+                reverse('NodeCollectionHandler'),
+                params={'since': revision, param: 1},
+                headers=self.default_headers,
+                expect_errors=True
+            )
+            self.assertEquals(400, resp.status)
+
     def test_node_get_with_cluster_None(self):
         self.env.create(
             cluster_kwargs={"api": False},
@@ -200,9 +349,55 @@ class TestHandlers(BaseIntegrationTest):
             headers=self.default_headers)
         self.assertEquals(resp.status, 200)
         node = self.db.query(Node).get(node.id)
-        self.assertNotEquals(node.timestamp, timestamp)
+        self.assertGreater(node_liveness.last_seen(node.id), timestamp)
         self.assertEquals('new', node.manufacturer)
 
+        node_liveness.flush(force=True)
+        self.db.refresh(node)
+        self.assertNotEquals(node.timestamp, timestamp)
+
+    def test_agent_same_meta_skips_processing(self):
+        node = self.env.create_node(api=True)
+        node_db = self.db.query(Node).get(node['id'])
+        meta = self.env.default_metadata()
+        meta['interfaces'][0]['mac'] = node_db.mac
+
+        def put_meta(meta):
+            return self.app.put(
+                reverse('NodeCollectionHandler'),
+                json.dumps([
+                    {'mac': node_db.mac, 'meta': meta, 'is_agent': True}
+                ]),
+                headers=self.default_headers)
+
+        with patch('nailgun.api.handlers.node.NetworkManager.'
+                   'update_interfaces_info') as update_interfaces:
+            # the same meta as was sent on node creation
+            resp = put_meta(meta)
+            self.assertEquals(resp.status, 200)
+            self.assertEquals(update_interfaces.call_count, 0)
+
+            digest = node_db.meta_digest
+            meta['memory']['total'] += 1
+            resp = put_meta(meta)
+            self.assertEquals(resp.status, 200)
+            self.assertEquals(update_interfaces.call_count, 1)
+            self.db.refresh(node_db)
+            self.assertNotEquals(node_db.meta_digest, digest)
+            self.assertEquals(node_db.meta['memory']['total'],
+                              meta['memory']['total'])
+
+            resp = put_meta(meta)
+            self.assertEquals(resp.status, 200)
+            self.assertEquals(update_interfaces.call_count, 1)
+
+    def test_meta_digest_reset_on_meta_change(self):
+        node = self.env.create_node(api=True)
+        node_db = self.db.query(Node).get(node['id'])
+        self.assertIsNotNone(node_db.meta_digest)
+        node_db.meta = dict(node_db.meta, foo='bar')
+        self.assertIsNone(node_db.meta_digest)
+
     def test_node_create_ext_mac(self):
         node1 = self.env.create_node(
             api=False
@@ -15,6 +15,7 @@
 #    under the License.
 
 import json
+from mock import patch
 import uuid
 
 from nailgun.api.models import Notification
@@ -87,6 +88,47 @@ class TestNotification(BaseIntegrationTest):
         self.assertEqual(notifications[0].status, "unread")
         self.assertEqual(notifications[0].topic, "error")
 
+    def test_notification_deploy_error_nodes_not_repeated(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[{"api": False}, {"api": False}]
+        )
+        cluster = self.env.clusters[0]
+        receiver = rcvr.NailgunReceiver()
+
+        task = Task(
+            uuid=str(uuid.uuid4()),
+            name="super",
+            cluster_id=cluster.id
+        )
+        self.db.add(task)
+        self.db.commit()
+
+        kwargs = {
+            'task_uuid': task.uuid,
+            'nodes': [
+                {'uid': node.id, 'status': 'error', 'progress': 10}
+                for node in self.env.nodes
+            ]
+        }
+        with patch.object(notifier, 'notify_many',
+                          wraps=notifier.notify_many) as notify_many:
+            receiver.deploy_resp(**kwargs)
+            receiver.deploy_resp(**kwargs)
+        self.assertEquals(notify_many.call_count, 2)
+
+        notifications = self.db.query(Notification).filter_by(
+            cluster_id=cluster.id
+        ).all()
+        self.assertEqual(
+            sorted(n.node_id for n in notifications),
+            sorted(n.id for n in self.env.nodes)
+        )
+        for node in self.env.nodes:
+            self.db.refresh(node)
+            self.assertEquals(node.status, 'error')
+            self.assertEquals(node.progress, 100)
+
     def test_notification_node_discover(self):
 
         resp = self.app.post(
@@ -163,3 +205,38 @@ class TestNotification(BaseIntegrationTest):
             notifications[0].message,
             "Cluster deletion fake error"
         )
+
+    def test_buffered_notifications_written_at_once(self):
+        node = self.env.create_node(api=False)
+        with patch.object(notifier, '_write',
+                          wraps=notifier._write) as write:
+            with notifier.buffered():
+                notifier.notify("error", "Error 1", node_id=node.id)
+                notifier.notify("error", "Error 1", node_id=node.id)
+                with notifier.buffered():
+                    notifier.notify("done", "Done", node_id=node.id)
+                self.assertEqual(
+                    self.db.query(Notification).count(), 0)
+        self.db.commit()
+        self.assertEqual(write.call_count, 1)
+
+        notifications = self.db.query(Notification).filter_by(
+            node_id=node.id
+        ).order_by(Notification.id).all()
+        self.assertEqual(
+            [(n.topic, n.message) for n in notifications],
+            [("error", "Error 1"), ("done", "Done")]
+        )
+        self.assertEqual(
+            notifications[0].message_hash,
+            Notification.get_message_hash("Error 1")
+        )
+
+    def test_buffered_notifications_dropped_on_error(self):
+        def fail():
+            with notifier.buffered():
+                notifier.notify("error", "Error")
+                raise ValueError()
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(self.db.query(Notification).count(), 0)
@@ -15,15 +15,20 @@
 #    under the License.
 
 
+from mock import patch
+
 from nailgun.api.models import Cluster
 from nailgun.api.models import IPAddrRange
 from nailgun.api.models import NetworkGroup
 from nailgun.api.models import Node
 from nailgun.db import db
+from nailgun.network.manager import NetworkManager
 from nailgun.orchestrator.deployment_serializers \
     import OrchestratorHASerializer
 from nailgun.orchestrator.deployment_serializers \
     import OrchestratorSerializer
+from nailgun.orchestrator.deployment_serializers \
+    import SerializationContext
 from nailgun.settings import settings
 from nailgun.test.base import BaseIntegrationTest
 
@@ -94,6 +99,38 @@ class TestOrchestratorSerializer(OrchestratorSerializerTestBase):
                 node_db, serialized_node['role'])
             self.assertEquals(serialized_node, expected_node)
 
+    def test_serialize_shares_nodes_network_data(self):
+        with patch.object(NetworkManager, 'get_node_networks') as get_nets:
+            facts = self.serializer.serialize(self.cluster)
+        self.assertFalse(get_nets.called)
+        self.assert_roles_flattened(facts)
+
+        for fact in facts:
+            node_db = self.db.query(Node).get(int(fact['uid']))
+            expected_node = self.serializer.serialize_node(
+                node_db, fact['role'])
+            self.assertEquals(
+                fact['network_data'],
+                expected_node['network_data']
+            )
+
+    def test_serialize_nodes_from_shared_context(self):
+        context = SerializationContext(self.cluster.nodes)
+        controller = self.serializer.by_role(
+            self.serializer.serialize_nodes(self.cluster.nodes),
+            'controller')[0]
+        node_db = self.db.query(Node).get(int(controller['uid']))
+
+        for method in (self.serializer.serialize_nodes,
+                       self.serializer.node_list):
+            serialized = method([node_db], context)
+            self.assertEquals(
+                set(n['uid'] for n in serialized), set([str(node_db.id)]))
+
+        other = self.env.create_node(api=False)
+        self.assertRaises(
+            ValueError, self.serializer.serialize_nodes, [other], context)
+
     def test_serialize_node(self):
         node = self.env.create_node(
             api=True, cluster_id=self.cluster.id, pending_addition=True)
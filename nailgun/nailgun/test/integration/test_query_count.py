@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Number of SQL statements issued by handlers when identity map
+of session is trusted during request and when every query reloads
+objects. Counts are logged, e.g. run with --nologcapture to see them.
+"""
+
+import contextlib
+
+from mock import patch
+from sqlalchemy import event
+
+from nailgun.db import engine
+from nailgun.logger import logger
+from nailgun.test.base import BaseIntegrationTest
+from nailgun.test.base import reverse
+
+
+@contextlib.contextmanager
+def no_session_scope():
+    yield
+
+
+class StatementCounter(object):
+    """Counts SQL statements while count isn't None.
+    """
+
+    def __init__(self):
+        self.count = None
+
+    def __call__(self, *args):
+        if self.count is not None:
+            self.count += 1
+
+
+counter = StatementCounter()
+event.listen(engine, 'before_cursor_execute', counter)
+
+
+class TestQueryCount(BaseIntegrationTest):
+
+    def setUp(self):
+        super(TestQueryCount, self).setUp()
+        self.cluster = self.env.create(
+            cluster_kwargs={'mode': 'multinode'},
+            nodes_kwargs=[
+                {'roles': ['controller'], 'pending_addition': True},
+                {'roles': ['compute'], 'pending_addition': True},
+                {'roles': ['cinder'], 'pending_addition': True},
+            ]
+        )
+
+    def count_queries(self, handler, **kwargs):
+        counter.count = 0
+        try:
+            resp = self.app.get(
+                reverse(handler, kwargs=kwargs),
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            return counter.count
+        finally:
+            counter.count = None
+
+    def compare(self, handler, **kwargs):
+        with patch('nailgun.db.session_scope', no_session_scope):
+            before = self.count_queries(handler, **kwargs)
+        after = self.count_queries(handler, **kwargs)
+        logger.info(
+            "%s: %d queries with reloading, %d in session scope",
+            handler, before, after)
+        self.assertLessEqual(after, before)
+        return before, after
+
+    def test_cluster_handler(self):
+        self.compare('ClusterHandler', cluster_id=self.cluster['id'])
+
+    def test_node_collection_handler(self):
+        self.compare('NodeCollectionHandler')
+
+    def test_network_configuration_handler(self):
+        self.compare(
+            'NetworkConfigurationHandler', cluster_id=self.cluster['id'])
+
+    def test_deployment_defaults_handler(self):
+        before, after = self.compare(
+            'DefaultDeploymentInfo', cluster_id=self.cluster['id'])
+        self.assertLess(after, before)
@@ -15,7 +15,10 @@
 #    under the License.
 
 import json
+from mock import Mock
 from mock import patch
+import Queue
+import threading
 import uuid
 
 from nailgun.api.models import Attributes
@@ -28,6 +31,10 @@ from nailgun.api.models import Notification
 from nailgun.api.models import Task
 from nailgun.api.models import Vlan
 from nailgun.rpc import receiver as rcvr
+from nailgun.rpc.threaded import RPCConsumer
+from nailgun.rpc.threaded import RPCWorker
+from nailgun.task.progress import deployment_progress
+from nailgun.task.progress import DeploymentProgress
 from nailgun.test.base import BaseIntegrationTest
 from nailgun.test.base import reverse
 
@@ -342,6 +349,57 @@ class TestVerifyNetworks(BaseIntegrationTest):
                         }]
         self.assertEqual(task.result, error_nodes)
 
+    def test_verify_networks_resp_several_interfaces_error(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[
+                {"api": False},
+                {"api": False},
+                {"api": False}
+            ]
+        )
+        cluster_db = self.env.clusters[0]
+        node1, node2, node3 = self.env.nodes
+        nets_sent = [{'iface': 'eth0', 'vlans': range(100, 105)},
+                     {'iface': 'eth9', 'vlans': range(200, 203)}]
+        nets_resp = [{'iface': 'eth9', 'vlans': [200]},
+                     {'iface': 'eth0', 'vlans': range(100, 105)}]
+
+        task = Task(
+            name="super",
+            cluster_id=cluster_db.id
+        )
+        task.cache = {
+            "args": {
+                'nodes': [{'uid': n.id, 'networks': nets_sent}
+                          for n in self.env.nodes]
+            }
+        }
+        self.db.add(task)
+        self.db.commit()
+
+        kwargs = {'task_uuid': task.uuid,
+                  'status': 'ready',
+                  'nodes': [{'uid': node1.id, 'networks': nets_sent},
+                            {'uid': node2.id, 'networks': nets_resp},
+                            {'uid': node3.id, 'networks': nets_resp[:1]}]}
+        self.receiver.verify_networks_resp(**kwargs)
+        self.db.refresh(task)
+        self.assertEqual(task.status, "error")
+        for data in task.result:
+            data['absent_vlans'] = sorted(data['absent_vlans'])
+        self.assertEqual(task.result, [
+            {'uid': node2.id, 'interface': 'eth9',
+             'name': node2.name, 'mac': 'unknown',
+             'absent_vlans': [201, 202]},
+            {'uid': node3.id, 'interface': 'eth0',
+             'name': node3.name, 'mac': node3.interfaces[0].mac,
+             'absent_vlans': range(100, 105)},
+            {'uid': node3.id, 'interface': 'eth9',
+             'name': node3.name, 'mac': 'unknown',
+             'absent_vlans': [201, 202]},
+        ])
+
     def test_verify_networks_resp_without_vlans_only(self):
         """Verify that network verification without vlans passes
         when there only iface without vlans configured
@@ -628,6 +686,132 @@ class TestConsumer(BaseIntegrationTest):
         self.db.refresh(self.env.nodes[0])
         self.assertEqual(self.env.nodes[0].progress, 100)
 
+    def test_task_progress_recounts_only_changed_nodes(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[
+                {"api": False, "status": "provisioned", "progress": 100}
+                for _ in xrange(4)
+            ]
+        )
+        task = Task(
+            uuid=str(uuid.uuid4()),
+            name="deploy",
+            status="running",
+            cluster_id=self.env.clusters[0].id
+        )
+        self.db.add(task)
+        self.db.commit()
+        node1, node2 = self.env.nodes[:2]
+
+        node_progress = DeploymentProgress.node_progress
+        with patch.object(DeploymentProgress, 'node_progress',
+                          side_effect=node_progress) as counted:
+            self.receiver.deploy_resp(
+                task_uuid=task.uuid,
+                nodes=[{'uid': node1.id, 'status': 'deploying',
+                        'progress': 50}]
+            )
+            self.assertEquals(counted.call_count, 4)
+            self.db.refresh(task)
+            # 3 nodes with 30% and one with 30% + 50% of 70%
+            self.assertEquals(task.progress, 38)
+
+            self.receiver.deploy_resp(
+                task_uuid=task.uuid,
+                nodes=[{'uid': node2.id, 'status': 'deploying',
+                        'progress': 100}]
+            )
+            self.assertEquals(counted.call_count, 5)
+            self.db.refresh(task)
+            self.assertEquals(task.progress, 56)
+
+            # nodes changed by somebody else are noticed too
+            self.db.delete(self.env.nodes[3])
+            self.db.commit()
+            self.receiver.deploy_resp(
+                task_uuid=task.uuid,
+                nodes=[{'uid': node1.id, 'status': 'deploying',
+                        'progress': 100}]
+            )
+            self.db.refresh(task)
+            self.assertEquals(task.progress, 76)
+
+    def test_task_progress_notices_bulk_updates(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[
+                {"api": False, "status": "provisioned", "progress": 100,
+                 "online": True}
+                for _ in xrange(2)
+            ]
+        )
+        task = Task(
+            uuid=str(uuid.uuid4()),
+            name="deploy",
+            status="running",
+            cluster_id=self.env.clusters[0].id
+        )
+        self.db.add(task)
+        self.db.commit()
+        node1, node2 = self.env.nodes
+
+        self.receiver.deploy_resp(
+            task_uuid=task.uuid,
+            nodes=[{'uid': node1.id, 'status': 'deploying',
+                    'progress': 0}]
+        )
+        self.db.refresh(task)
+        self.assertEquals(task.progress, 30)
+
+        # e.g. watcher marks nodes which have gone away
+        self.db.query(Node).filter_by(id=node2.id).update(
+            {'online': False}, synchronize_session=False)
+        self.db.commit()
+        self.receiver.deploy_resp(
+            task_uuid=task.uuid,
+            nodes=[{'uid': node1.id, 'status': 'deploying',
+                    'progress': 0}]
+        )
+        self.db.refresh(task)
+        # offline node is counted as finished
+        self.assertEquals(task.progress, 65)
+
+    def test_task_progress_forgotten_when_task_is_finished(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[
+                {"api": False, "status": "provisioned", "progress": 100}
+            ]
+        )
+        tasks = []
+        for i in xrange(2):
+            task = Task(
+                uuid=str(uuid.uuid4()),
+                name="deploy",
+                status="running",
+                cluster_id=self.env.clusters[0].id
+            )
+            self.db.add(task)
+            tasks.append(task)
+        self.db.commit()
+        for task in tasks:
+            self.receiver.deploy_resp(
+                task_uuid=task.uuid,
+                nodes=[{'uid': self.env.nodes[0].id,
+                        'status': 'deploying', 'progress': 50}]
+            )
+            self.assertIn(task.uuid, deployment_progress._tasks)
+
+        # not only by deployment response
+        tasks[0].status = 'error'
+        self.db.delete(tasks[1])
+        self.db.flush()
+        self.assertIn(tasks[0].uuid, deployment_progress._tasks)
+        self.db.commit()
+        self.assertNotIn(tasks[0].uuid, deployment_progress._tasks)
+        self.assertNotIn(tasks[1].uuid, deployment_progress._tasks)
+
     def test_remove_nodes_resp(self):
         self.env.create(
             cluster_kwargs={},
@@ -816,3 +1000,124 @@ class TestConsumer(BaseIntegrationTest):
             .join(NetworkGroup).\
             filter(NetworkGroup.cluster_id == cluster_db.id).all()
         self.assertNotEqual(len(nets_db), 0)
+
+
+class TestRPCConsumerWorkers(BaseIntegrationTest):
+
+    class Receiver(object):
+        handled = []
+        lock = threading.Lock()
+
+        @classmethod
+        def verify_networks_resp(cls, **kwargs):
+            with cls.lock:
+                cls.handled.append(
+                    (kwargs['task_uuid'], kwargs['progress'],
+                     threading.current_thread().name))
+
+    def setUp(self):
+        super(TestRPCConsumerWorkers, self).setUp()
+        self.Receiver.handled[:] = []
+        self.consumer = RPCConsumer(None, self.Receiver, workers=3)
+
+    def tearDown(self):
+        self.consumer.stop_workers()
+        super(TestRPCConsumerWorkers, self).tearDown()
+
+    def test_messages_of_task_handled_in_order_by_one_worker(self):
+        tasks = [str(uuid.uuid4()) for _ in xrange(4)]
+        messages = []
+        for progress in xrange(10):
+            for task_uuid in tasks:
+                msg = Mock()
+                messages.append(msg)
+                self.consumer.consume_msg(
+                    {'method': 'verify_networks_resp',
+                     'args': {'task_uuid': task_uuid,
+                              'progress': progress}},
+                    msg)
+        for worker in self.consumer.workers:
+            worker.stop()
+        for worker in self.consumer.workers:
+            worker.join()
+        self.consumer.on_iteration()
+
+        for msg in messages:
+            msg.ack.assert_called_once_with()
+        for task_uuid in tasks:
+            handled = [h for h in self.Receiver.handled if h[0] == task_uuid]
+            self.assertEquals([h[1] for h in handled], range(10))
+            self.assertEquals(len(set(h[2] for h in handled)), 1)
+
+        metrics = self.consumer.metrics()
+        self.assertEquals(metrics['queue_depth'], [0, 0, 0])
+        self.assertEquals(metrics['not_acknowledged'], 0)
+        self.assertEquals(
+            metrics['handlers']['verify_networks_resp']['count'], 40)
+
+    def test_tasks_of_cluster_handled_by_one_worker(self):
+        cluster = self.env.create_cluster(api=False)
+        parent = Task(uuid=str(uuid.uuid4()), name='deploy',
+                      cluster_id=cluster.id)
+        tasks = [parent] + [
+            Task(uuid=str(uuid.uuid4()), name=name,
+                 cluster_id=cluster.id, parent=parent)
+            for name in ('provision', 'deployment')
+        ]
+        self.db.add_all(tasks)
+        self.db.commit()
+
+        workers = set(
+            self.consumer.get_worker({'args': {'task_uuid': task.uuid}})
+            for task in tasks
+        )
+        self.assertEquals(len(workers), 1)
+        self.assertEquals(
+            self.consumer.get_dispatch_key(tasks[1].uuid),
+            ('cluster', cluster.id)
+        )
+
+    def test_stop_workers_waits_limited_time(self):
+        worker = self.consumer.workers[0]
+        started = threading.Event()
+        release = threading.Event()
+
+        def process_msg(body):
+            started.set()
+            release.wait(5)
+
+        with patch.object(worker, 'process_msg', process_msg):
+            worker.messages.put(({'method': 'verify_networks_resp'},
+                                 Mock(), 0))
+            started.wait(5)
+            self.consumer.stop_workers(timeout=0.1)
+            self.assertTrue(worker.is_alive())
+            release.set()
+            worker.join(5)
+        self.assertFalse(worker.is_alive())
+
+    def test_progress_messages_are_coalesced(self):
+        processed = Queue.Queue()
+        worker = RPCWorker(self.Receiver, processed)
+        for progress in xrange(10):
+            worker.messages.put((
+                {'method': 'deploy_resp',
+                 'args': {'task_uuid': 'uuid',
+                          'nodes': [{'uid': progress % 2,
+                                     'progress': progress}]}},
+                progress,
+                0))
+        worker.stop()
+        with patch.object(self.Receiver, 'deploy_resp',
+                          create=True) as deploy_resp:
+            # all messages are queued before worker is started
+            worker.start()
+            worker.join()
+        deploy_resp.assert_called_once_with(
+            task_uuid='uuid',
+            nodes=[{'uid': 0, 'progress': 8}, {'uid': 1, 'progress': 9}])
+        self.assertEquals(
+            [processed.get_nowait() for _ in xrange(10)],
+            range(10)
+        )
+        self.assertEquals(worker.coalesced, 9)
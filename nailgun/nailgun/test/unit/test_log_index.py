@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import threading
+
+from mock import patch
+
+from nailgun.logs.index import LogIndex
+from nailgun.logs.index import LogIndexStorage
+from nailgun.test.base import BaseTestCase
+
+
+def parse_date(line):
+    date = line.split(' ', 1)[0]
+    return int(date) if date.isdigit() else None
+
+
+class TestLogIndex(BaseTestCase):
+
+    def setUp(self):
+        super(TestLogIndex, self).setUp()
+        self.log_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.log_dir, 'test.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+        super(TestLogIndex, self).tearDown()
+
+    def write_entries(self, dates, mode='a'):
+        with open(self.log_file, mode) as f:
+            for date in dates:
+                f.write('%d entry of %d\n' % (date, date))
+                f.write('  continuation of entry\n')
+
+    def check_index(self, index):
+        with open(self.log_file) as f:
+            data = f.read()
+        self.assertEquals(index.size, len(data))
+        self.assertEquals(index.offsets, sorted(index.offsets))
+        for offset, date in zip(index.offsets, index.dates):
+            self.assertTrue(offset == 0 or data[offset - 1] == '\n')
+            self.assertEquals(parse_date(data[offset:]), date)
+
+    def test_index_built_extended_and_rebuilt(self):
+        self.write_entries(range(1000, 1100))
+        index = LogIndex(self.log_file, parse_date, 200)
+        self.assertTrue(index.update())
+        self.check_index(index)
+        self.assertTrue(len(index.offsets) > 10)
+        self.assertFalse(index.update())
+
+        offsets = list(index.offsets)
+        self.write_entries(range(1100, 1200))
+        self.assertTrue(index.update())
+        self.check_index(index)
+        self.assertEquals(index.offsets[:len(offsets)], offsets)
+        self.assertTrue(len(index.offsets) > len(offsets))
+
+        # rotation: file is replaced by a new one
+        os.rename(self.log_file, self.log_file + '.1')
+        self.write_entries(range(5000, 5010), mode='w')
+        self.assertTrue(index.update())
+        self.check_index(index)
+        self.assertEquals(index.dates[0], 5000)
+
+        # truncation
+        self.write_entries(range(7000, 7005), mode='w')
+        self.assertTrue(index.update())
+        self.check_index(index)
+        self.assertEquals(index.dates[0], 7000)
+
+    def test_bounds(self):
+        self.write_entries(range(1000, 1100))
+        index = LogIndex(self.log_file, parse_date, 200)
+        index.update()
+        with open(self.log_file) as f:
+            data = f.read()
+
+        start, end = index.bounds(date_after=1050, date_before=1060)
+        self.assertTrue(0 < start < end < index.size)
+        entries = [
+            parse_date(line) for line in data[start:end].splitlines()
+            if parse_date(line) is not None
+        ]
+        self.assertEquals(
+            set(range(1051, 1060)) - set(entries), set())
+        self.assertTrue(len(entries) < 30)
+
+        self.assertEquals(index.bounds(), (0, index.size))
+        self.assertEquals(index.bounds(date_before=1), (0, 0))
+        self.assertEquals(
+            index.bounds(date_after=2000), (index.offsets[-1], index.size))
+
+    def test_sidecar_is_reused(self):
+        self.write_entries(range(1000, 1100))
+        with patch.dict('nailgun.logs.index.settings.config',
+                        {'LOG_INDEX_DIR': os.path.join(self.log_dir, 'i')}):
+            index = LogIndexStorage().get(self.log_file, parse_date, 200)
+            with patch.object(LogIndex, '_extend') as extend:
+                loaded = LogIndexStorage().get(
+                    self.log_file, parse_date, 200)
+                self.assertFalse(extend.called)
+        self.assertEquals(loaded.dump(), index.dump())
+
+    def test_sidecar_is_saved_when_checkpoints_change(self):
+        self.write_entries(range(1000, 1100))
+        storage = LogIndexStorage()
+        with patch.dict('nailgun.logs.index.settings.config',
+                        {'LOG_INDEX_DIR': os.path.join(self.log_dir, 'i')}):
+            with patch.object(storage, '_write_sidecar',
+                              wraps=storage._write_sidecar) as write:
+                storage.get(self.log_file, parse_date, 200)
+                self.assertEquals(write.call_count, 1)
+
+                # new entry doesn't reach the next checkpoint
+                self.write_entries([1100])
+                index = storage.get(self.log_file, parse_date, 2000)
+                write.reset_mock()
+                self.write_entries([1101])
+                storage.get(self.log_file, parse_date, 2000)
+                self.assertEquals(index.size,
+                                  os.path.getsize(self.log_file))
+                self.assertFalse(write.called)
+
+                self.write_entries(range(1102, 1300))
+                storage.get(self.log_file, parse_date, 2000)
+                self.assertEquals(write.call_count, 1)
+
+    def test_index_update_doesnt_block_other_files(self):
+        self.write_entries(range(1000, 1010))
+        other_file = os.path.join(self.log_dir, 'other.log')
+        with open(other_file, 'w') as f:
+            f.write('1000 entry\n')
+        storage = LogIndexStorage()
+        building = threading.Event()
+        release = threading.Event()
+
+        def slow_parse_date(line):
+            building.set()
+            release.wait(5)
+            return parse_date(line)
+
+        with patch.dict('nailgun.logs.index.settings.config',
+                        {'LOG_INDEX_DIR': os.path.join(self.log_dir, 'i')}):
+            thread = threading.Thread(
+                target=storage.get,
+                args=(self.log_file, slow_parse_date, 200))
+            thread.start()
+            try:
+                self.assertTrue(building.wait(5))
+                index = storage.get(other_file, parse_date, 200)
+                self.assertEquals(index.dates, [1000])
+                self.assertTrue(thread.is_alive())
+            finally:
+                release.set()
+                thread.join(5)
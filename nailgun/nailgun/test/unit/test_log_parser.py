@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from nailgun.api.models import RedHatAccount
+from nailgun.logger import logger
+from nailgun.logs.parser import DateFormat
+from nailgun.logs.parser import log_parsers
+from nailgun.settings import settings
+from nailgun.test.base import BaseIntegrationTest
+from nailgun.test.base import BaseTestCase
+from nailgun.test.base import reverse
+
+
+class TestDateFormat(BaseTestCase):
+
+    def test_parse_as_strptime(self):
+        for date_format, value in (
+            ('%Y-%m-%d %H:%M:%S', '2013-10-10 10:00:59'),
+            ('%Y-%m-%dT%H:%M:%S', '2012-02-29T23:10:00'),
+            ('%d/%m/%Y %H.%M.%S', '01/12/2013 00.00.00'),
+            ('%b %d %H:%M:%S', 'Oct 10 10:00:00'),
+        ):
+            date_format = DateFormat(date_format)
+            self.assertEquals(
+                date_format.parse(value),
+                time.strptime(value, date_format.date_format)[:6]
+            )
+            self.assertEquals(date_format.format(date_format.parse(value)),
+                              value)
+        self.assertIsNotNone(DateFormat('%Y-%m-%d %H:%M:%S').regexp)
+        self.assertIsNone(DateFormat('%b %d %H:%M:%S').regexp)
+
+    def test_parse_invalid_dates(self):
+        date_format = DateFormat('%Y-%m-%d %H:%M:%S')
+        for value in ('2013-02-29 10:00:00', '2013-13-01 10:00:00',
+                      '2013-10-10 25:00:00', '2013-10-10 10:00',
+                      '2013-10-10 10:00:00 ', 'date111'):
+            self.assertRaises(ValueError, date_format.parse, value)
+
+
+def scrub(text):
+    for regex, replace in log_parsers.get_scrub_patterns():
+        text = regex.sub(replace, text)
+    return text
+
+
+class TestLogParsers(BaseIntegrationTest):
+
+    log_config = {
+        'id': 'test',
+        'regexp': r'^(?P<date>\S+ \S+) (?P<level>\w+) (?P<text>.*)$',
+        'skip_regexp': r'^#',
+        'date_format': '%Y-%m-%d %H:%M:%S'
+    }
+
+    def test_parser_is_cached_by_source(self):
+        log_config = dict(self.log_config)
+        parser = log_parsers.get(log_config)
+        self.assertIs(log_parsers.get(dict(log_config)), parser)
+        self.assertTrue(parser.is_skipped('# comment'))
+        self.assertEquals(
+            parser.entry_time('2013-10-10 10:00:00 INFO text'),
+            1381399200
+        )
+        self.assertIsNone(parser.entry_time('continuation of entry'))
+
+        log_config['skip_regexp'] = r'^;'
+        parser = log_parsers.get(log_config)
+        self.assertFalse(parser.is_skipped('# comment'))
+        self.assertTrue(parser.is_skipped('; comment'))
+
+    def test_scrub_patterns_reset_on_accounts_change(self):
+        self.assertEquals(scrub('user secret'), 'user secret')
+        account = RedHatAccount(username='user', password='secret',
+                                license_type='rhsm')
+        self.db.add(account)
+        self.db.flush()
+        # changes aren't committed yet
+        self.assertEquals(scrub('user secret'), 'user secret')
+        self.db.commit()
+        self.assertEquals(scrub('user secret'),
+                          'username password')
+
+        self.db.query(RedHatAccount).update({'password': 'other'})
+        self.db.rollback()
+        self.assertEquals(scrub('user secret'),
+                          'username password')
+
+        self.db.query(RedHatAccount).update({'password': 'other'})
+        self.db.commit()
+        self.assertEquals(scrub('user secret other'),
+                          'username secret password')
+
+
+@unittest.skipUnless(os.environ.get('NAILGUN_LOG_BENCHMARK_MB'),
+                     "NAILGUN_LOG_BENCHMARK_MB isn't set")
+class TestLogEntryParsingBenchmark(BaseIntegrationTest):
+    """Time of reading entries of log file by LogEntryCollectionHandler,
+    file is test_logs_handlers fixture scaled up to 100000 entries.
+    Timings are logged, e.g. run with --nologcapture to see them.
+    Benchmark is run only if NAILGUN_LOG_BENCHMARK_MB is set, as
+    benchmark of log reader.
+    """
+
+    entries_count = 100000
+
+    def setUp(self):
+        super(TestLogEntryParsingBenchmark, self).setUp()
+        self.log_dir = tempfile.mkdtemp()
+        log_file = os.path.join(self.log_dir, 'nailgun.log')
+        settings.update({
+            'LOG_INDEX_DIR': os.path.join(self.log_dir, 'index'),
+            'LOGS': [{
+                'id': 'nailgun',
+                'name': 'Nailgun',
+                'remote': False,
+                'regexp': (r'^(?P<date>\d{4}-\d{2}-\d{2}\s\d{2}:\d{2}:\d{2}):'
+                           '(?P<level>\w+):(?P<text>.+)$'),
+                'date_format': settings.UI_LOG_DATE_FORMAT,
+                'levels': [],
+                'path': log_file
+            }]
+        })
+        started = int(time.time()) - self.entries_count
+        with open(log_file, 'w') as f:
+            for i in xrange(self.entries_count):
+                # ten entries per second
+                date = time.strftime(settings.UI_LOG_DATE_FORMAT,
+                                     time.gmtime(started + i / 10))
+                f.write('{0}:LEVEL{1}:text{1}\n'.format(date, i % 10))
+        self.db.add(RedHatAccount(username='REDHATUSERNAME',
+                                  password='REDHATPASSWORD',
+                                  license_type='rhsm'))
+        self.db.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+        super(TestLogEntryParsingBenchmark, self).tearDown()
+
+    def test_read_all_entries(self):
+        for attempt in ('first', 'cached'):
+            started = time.time()
+            resp = self.app.get(
+                reverse('LogEntryCollectionHandler'),
+                params={
+                    'source': 'nailgun',
+                    'truncate_log': 'true',
+                    'max_entries': self.entries_count
+                },
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            entries = json.loads(resp.body)['entries']
+            self.assertEquals(len(entries), self.entries_count)
+            logger.info("Parsed %d entries (%s request) in %.3fs",
+                        len(entries), attempt, time.time() - started)
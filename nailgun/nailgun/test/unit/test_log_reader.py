@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from itertools import islice
+import os
+from StringIO import StringIO
+import tempfile
+import time
+import unittest
+
+from mock import patch
+
+from nailgun.logger import logger
+from nailgun.logs.reader import read_backwards
+from nailgun.test.base import BaseTestCase
+
+
+def no_mmap(*args, **kwargs):
+    raise EnvironmentError("mmap is not available")
+
+
+class TestReadBackwards(BaseTestCase):
+
+    contents = [
+        'first line\n',
+        '\n',
+        'x' * 10000 + '\n',
+        'line without newline at the end'
+    ]
+
+    def read_all(self, f, bufsize=4096):
+        lines = list(read_backwards(f, bufsize))
+        lines.reverse()
+        return lines
+
+    def test_mapped_and_chunked_files(self):
+        f = tempfile.TemporaryFile(mode='w+')
+        f.write(''.join(self.contents))
+        f.flush()
+        for bufsize in (1, 7, 4096):
+            f.seek(0, os.SEEK_END)
+            self.assertEquals(self.read_all(f, bufsize), self.contents)
+            # file is rewound when all lines are read
+            self.assertEquals(f.tell(), 0)
+            with patch('nailgun.logs.reader.mmap.mmap', no_mmap):
+                f.seek(0, os.SEEK_END)
+                self.assertEquals(self.read_all(f, bufsize), self.contents)
+        f.close()
+
+    def test_file_without_fileno(self):
+        f = StringIO(''.join(self.contents))
+        f.seek(len(self.contents[0]) + len(self.contents[1]))
+        self.assertEquals(self.read_all(f, 3), self.contents[:2])
+
+    def test_lines_are_read_lazily(self):
+        f = tempfile.TemporaryFile(mode='w+')
+        f.write(''.join(self.contents))
+        f.flush()
+        with patch('nailgun.logs.reader.mmap.mmap', no_mmap):
+            lines = read_backwards(f, 16)
+            self.assertEquals(next(lines), self.contents[-1])
+            # only the last chunks of file were read
+            self.assertTrue(f.tell() > len(''.join(self.contents[:3])))
+        f.close()
+
+
+@unittest.skipUnless(os.environ.get('NAILGUN_LOG_BENCHMARK_MB'),
+                     "NAILGUN_LOG_BENCHMARK_MB isn't set")
+class TestReadBackwardsBenchmark(BaseTestCase):
+    """Time of reading the last lines of big log file by mapped and
+    chunked readers. Timings are logged, e.g. run with --nologcapture
+    to see them. Benchmark is run only if size of file in megabytes
+    is set by NAILGUN_LOG_BENCHMARK_MB environment variable.
+    """
+
+    line = '2013-10-10 10:00:00 INFO [7f0c] ' + 'x' * 90 + '\n'
+
+    def setUp(self):
+        super(TestReadBackwardsBenchmark, self).setUp()
+        size = int(os.environ['NAILGUN_LOG_BENCHMARK_MB']) << 20
+        self.log_file = tempfile.NamedTemporaryFile(mode='w+')
+        block = self.line * 10000
+        for i in xrange(size / len(block) + 1):
+            self.log_file.write(block)
+        self.log_file.flush()
+
+    def tearDown(self):
+        self.log_file.close()
+        super(TestReadBackwardsBenchmark, self).tearDown()
+
+    def read_last(self, count):
+        with open(self.log_file.name) as f:
+            f.seek(0, os.SEEK_END)
+            started = time.time()
+            lines = list(islice(read_backwards(f), count))
+            return time.time() - started, lines
+
+    def test_read_last_lines(self):
+        for count in (100, 10000):
+            mapped_time, mapped = self.read_last(count)
+            with patch('nailgun.logs.reader.mmap.mmap', no_mmap):
+                chunked_time, chunked = self.read_last(count)
+            self.assertEquals(mapped, [self.line] * count)
+            self.assertEquals(chunked, mapped)
+            logger.info(
+                "Last %d lines: mapped %.4fs, chunked %.4fs",
+                count, mapped_time, chunked_time
+            )
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import time
+
+from mock import patch
+
+from nailgun.logs.sources import LogDirCache
+from nailgun.logs.sources import scandir
+from nailgun.test.base import BaseTestCase
+
+
+class TestLogDirCache(BaseTestCase):
+
+    def setUp(self):
+        super(TestLogDirCache, self).setUp()
+        self.log_dir = tempfile.mkdtemp()
+        self.cache = LogDirCache()
+        self.changes = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+        super(TestLogDirCache, self).tearDown()
+
+    def touch(self, *names):
+        for name in names:
+            open(os.path.join(self.log_dir, name), 'w').close()
+        # directory looks as if it was changed a while ago,
+        # mtime is different after every change
+        self.changes += 1
+        mtime = time.time() - 60 + self.changes
+        os.utime(self.log_dir, (mtime, mtime))
+
+    def test_listing_is_cached_by_mtime(self):
+        os.mkdir(os.path.join(self.log_dir, 'install'))
+        self.touch('messages.log', 'agent.log')
+        with patch('nailgun.logs.sources.scandir',
+                   wraps=scandir) as list_dir:
+            for i in xrange(3):
+                self.assertEquals(self.cache.files(self.log_dir),
+                                  set(['messages.log', 'agent.log']))
+            self.assertEquals(list_dir.call_count, 1)
+
+            self.touch('dmesg.log')
+            self.assertEquals(self.cache.files(self.log_dir),
+                              set(['messages.log', 'agent.log', 'dmesg.log']))
+            self.assertEquals(list_dir.call_count, 2)
+
+    def test_recently_changed_directory_is_not_cached(self):
+        open(os.path.join(self.log_dir, 'messages.log'), 'w').close()
+        with patch('nailgun.logs.sources.scandir',
+                   wraps=scandir) as list_dir:
+            self.cache.files(self.log_dir)
+            self.cache.files(self.log_dir)
+            self.assertEquals(list_dir.call_count, 2)
+
+    def test_missing_directory(self):
+        self.assertEquals(
+            self.cache.files(os.path.join(self.log_dir, 'missing')),
+            set()
+        )
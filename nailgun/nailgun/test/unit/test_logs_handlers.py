@@ -31,10 +31,13 @@ import nailgun
 from nailgun.api.handlers.logs import read_backwards
 from nailgun.api.models import RedHatAccount
 from nailgun.errors import errors
+from nailgun.logs.search import LogSearch
+from nailgun.logs.search import SearchedFile
 from nailgun.settings import settings
 from nailgun.task.manager import DumpTaskManager
 from nailgun.task.task import DumpTask
 from nailgun.test.base import BaseIntegrationTest
+from nailgun.test.base import BaseTestCase
 from nailgun.test.base import fake_tasks
 from nailgun.test.base import reverse
 
@@ -48,6 +51,7 @@ class TestLogs(BaseIntegrationTest):
         regexp = (r'^(?P<date>\d{4}-\d{2}-\d{2}\s\d{2}:\d{2}:\d{2}):'
                   '(?P<level>\w+):(?P<text>.+)$')
         settings.update({
+            'LOG_INDEX_DIR': os.path.join(self.log_dir, 'index'),
             'LOGS': [
                 {
                     'id': 'nailgun',
@@ -107,6 +111,40 @@ class TestLogs(BaseIntegrationTest):
         response = json.loads(resp.body)
         self.assertEquals(response, [settings.LOGS[1]])
 
+    def test_log_source_by_nodes_collection_handler(self):
+        nodes = [
+            self.env.create_node(api=False, ip='40.30.20.1%d' % i)
+            for i in xrange(3)
+        ]
+        log_entry = ['date111', 'level222', 'text333']
+        for node in nodes[:2]:
+            self._create_logfile_for_node(settings.LOGS[1], [log_entry],
+                                          node)
+        resp = self.app.get(
+            reverse('LogSourceByNodesCollectionHandler'),
+            params={'nodes': ','.join(str(n.id) for n in nodes)},
+            headers=self.default_headers
+        )
+        self.assertEquals(200, resp.status)
+        self.assertEquals(json.loads(resp.body), {
+            str(nodes[0].id): [settings.LOGS[1]['id']],
+            str(nodes[1].id): [settings.LOGS[1]['id']],
+            str(nodes[2].id): []
+        })
+
+        for params, status in (
+            ({}, 400),
+            ({'nodes': 'a'}, 400),
+            ({'nodes': nodes[-1].id + 1}, 404),
+        ):
+            resp = self.app.get(
+                reverse('LogSourceByNodesCollectionHandler'),
+                params=params,
+                headers=self.default_headers,
+                expect_errors=True
+            )
+            self.assertEquals(status, resp.status)
+
     def test_log_entry_collection_handler(self):
         node_ip = '10.20.30.40'
         log_entries = [
@@ -179,6 +217,138 @@ class TestLogs(BaseIntegrationTest):
         self.assertEquals(response['entries'], log_entries)
         settings.LOGS[0]['multiline'] = False
 
+    def test_log_entry_collection_handler_dates(self):
+        log_entries = [
+            ['2013-10-10 10:00:0%d' % i, 'LEVEL', 'text%d' % i]
+            for i in xrange(10)
+        ]
+        self._create_logfile_for_node(settings.LOGS[0], log_entries)
+
+        with patch.dict(settings.config, {'LOG_INDEX_STEP': 40}):
+            resp = self.app.get(
+                reverse('LogEntryCollectionHandler'),
+                params={
+                    'source': settings.LOGS[0]['id'],
+                    'date_after': '2013-10-10 10:00:02',
+                    'date_before': '2013-10-10 10:00:07'
+                },
+                headers=self.default_headers
+            )
+        self.assertEquals(200, resp.status)
+        response = json.loads(resp.body)
+        response['entries'].reverse()
+        self.assertEquals(response['entries'], log_entries[3:7])
+
+    def _search_logs(self, expect_errors=False, **params):
+        resp = self.app.get(
+            reverse('LogSearchHandler'),
+            params=params,
+            headers=self.default_headers,
+            expect_errors=expect_errors
+        )
+        if resp.status != 200:
+            return resp.status, None
+        lines = [json.loads(line) for line in resp.body.splitlines()]
+        return lines[:-1], lines[-1]
+
+    def test_log_search_handler(self):
+        nodes = [
+            self.env.create_node(api=False, ip='10.20.30.4%d' % i)
+            for i in xrange(2)
+        ]
+        self.env.create_rh_account(username='RHUSER', password='RHPASS')
+        for i, node in enumerate(nodes):
+            self._create_logfile_for_node(settings.LOGS[1], [
+                ['2013-10-10 10:00:0%d' % j, 'LEVEL%d' % (j % 2),
+                 'node%d text%d RHPASS' % (i, j)]
+                for j in xrange(4)
+            ], node)
+        self._create_logfile_for_node(settings.LOGS[0], [
+            ['2013-10-10 10:00:00', 'LEVEL1', 'master text']
+        ])
+
+        entries, trailer = self._search_logs(
+            source='nailgun,syslog',
+            node=','.join(str(n.id) for n in nodes),
+            text='text',
+            levels='level1'
+        )
+        self.assertEquals(trailer, {'cursor': None, 'has_more': False})
+        self.assertEquals(
+            [(e['source'], e['node'], e['text']) for e in entries],
+            [('nailgun', None, 'master text')] + [
+                ('syslog', node.id, 'node%d text%d password' % (i, j))
+                for i, node in enumerate(nodes) for j in (1, 3)
+            ]
+        )
+        self.assertEquals(entries[1]['date'], '2013-10-10 10:00:01')
+        self.assertEquals(entries[1]['level'], 'LEVEL1')
+
+        entries, trailer = self._search_logs(
+            source='syslog',
+            node=nodes[1].id,
+            regexp=r'text[12]',
+            date_after='2013-10-10 10:00:01'
+        )
+        self.assertEquals([e['text'] for e in entries],
+                          ['node1 text2 password'])
+
+        # credentials are hidden before matching
+        entries, trailer = self._search_logs(
+            source='syslog', node=nodes[0].id, text='RHPASS')
+        self.assertEquals(entries, [])
+
+    def test_log_search_handler_cursor(self):
+        settings.LOGS[1]['multiline'] = True
+        nodes = [
+            self.env.create_node(api=False, ip='10.20.30.4%d' % i)
+            for i in xrange(3)
+        ]
+        for node in nodes:
+            self._create_logfile_for_node(settings.LOGS[1], [
+                ['2013-10-10 10:00:0%d' % i, 'LEVEL', 'text\nline%d' % i]
+                for i in xrange(5)
+            ], node)
+        node_ids = ','.join(str(n.id) for n in nodes)
+
+        all_entries, trailer = self._search_logs(source='syslog',
+                                                 node=node_ids)
+        self.assertEquals(len(all_entries), 15)
+        self.assertEquals(all_entries[0]['text'], 'text\nline0')
+
+        for workers in (1, 2):
+            found, cursor = [], None
+            with patch.dict(settings.config, {'LOG_SEARCH_WORKERS': workers}):
+                while True:
+                    params = {'source': 'syslog', 'node': node_ids,
+                              'limit': 4}
+                    if cursor:
+                        params['cursor'] = cursor
+                    entries, trailer = self._search_logs(**params)
+                    self.assertTrue(len(entries) <= 4)
+                    found.extend(entries)
+                    cursor = trailer['cursor']
+                    if not trailer['has_more']:
+                        break
+            self.assertEquals(found, all_entries)
+
+    def test_log_search_handler_invalid_params(self):
+        node = self.env.create_node(api=False, ip='10.20.30.40')
+        for params, status in (
+            ({}, 400),
+            ({'source': 'unknown'}, 404),
+            ({'source': 'syslog'}, 400),
+            ({'source': 'syslog', 'node': 'a'}, 400),
+            ({'source': 'syslog', 'node': node.id + 1}, 404),
+            ({'source': 'nailgun', 'regexp': '('}, 400),
+            ({'source': 'nailgun', 'cursor': 'abc'}, 400),
+            ({'source': 'nailgun', 'limit': '-1'}, 400),
+        ):
+            self.assertEquals(
+                self._search_logs(expect_errors=True, **params),
+                (status, None)
+            )
+
     def test_backward_reader(self):
         f = tempfile.TemporaryFile(mode='r+')
         forward_lines = []
@@ -450,3 +620,21 @@ class TestLogs(BaseIntegrationTest):
         response = json.loads(resp.body)
         response['entries'].reverse()
         self.assertEquals(response['entries'], response_log_entries)
+
+
+class TestLogSearchPool(BaseTestCase):
+
+    def test_replaced_pool_is_stopped(self):
+        old_pool = LogSearch.get_pool(3)
+        self.assertIs(LogSearch.get_pool(3), old_pool)
+        threads = list(old_pool._pool)
+
+        pool = LogSearch.get_pool(2)
+        self.assertIsNot(pool, old_pool)
+        self.assertFalse(any(t.is_alive() for t in threads))
+
+        # search which got the old pool searches files by itself
+        search = LogSearch([], workers=3)
+        searched = SearchedFile('/nonexistent', {'id': 'test'}, None)
+        self.assertEquals(
+            search._apply_async(old_pool, searched, 0).get(), [])
@@ -14,9 +14,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+from datetime import datetime
 import json
 
 from nailgun.api.models import Notification
+from nailgun.db import engine
 from nailgun.test.base import BaseIntegrationTest
 from nailgun.test.base import reverse
 
@@ -75,6 +78,97 @@ class TestHandlers(BaseIntegrationTest):
         response = json.loads(resp.body)
         self.assertEquals(len(response), 2)
 
+    def test_get_since_revision(self):
+        n0 = self.env.create_notification()
+        n1 = self.env.create_notification()
+
+        def get_changes(since):
+            resp = self.app.get(
+                reverse('NotificationCollectionHandler'),
+                params={'since': since},
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            return json.loads(resp.body)
+
+        response = get_changes(0)
+        self.assertEquals(response['ids'], [n0.id, n1.id])
+        self.assertEquals(
+            [n['id'] for n in response['items']],
+            [n0.id, n1.id]
+        )
+        revision = response['revision']
+
+        self.assertEquals(get_changes(revision)['items'], [])
+
+        n0.status = 'read'
+        self.db.delete(n1)
+        self.db.commit()
+        response = get_changes(revision)
+        self.assertEquals(response['ids'], [n0.id])
+        self.assertEquals(
+            [(n['id'], n['status']) for n in response['items']],
+            [(n0.id, 'read')]
+        )
+        self.assertTrue(response['revision'] > revision)
+
+        for params in (
+            {'since': 'abc'},
+            {'since': revision, 'limit': 1},
+            {'since': revision, 'before': n0.id}
+        ):
+            resp = self.app.get(
+                reverse('NotificationCollectionHandler'),
+                params=params,
+                headers=self.default_headers,
+                expect_errors=True
+            )
+            self.assertEquals(400, resp.status)
+
+    def test_get_since_revision_with_transaction_in_progress(self):
+        def get_changes(since):
+            resp = self.app.get(
+                reverse('NotificationCollectionHandler'),
+                params={'since': since},
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            return json.loads(resp.body)
+
+        table = Notification.__table__
+        with contextlib.closing(engine.connect()) as con:
+            trans = con.begin()
+            con.execute(table.insert().values(
+                topic='discover', message='slow', status='unread',
+                datetime=datetime.now()))
+            # committed after transaction which is still in progress
+            n0 = self.env.create_notification()
+            response = get_changes(0)
+            self.assertEquals(
+                [n['id'] for n in response['items']], [n0.id])
+            trans.commit()
+
+        # notifications committed while the slow transaction was in
+        # progress may be returned again, but none of them are lost
+        response = get_changes(response['revision'])
+        self.assertIn('slow', [n['message'] for n in response['items']])
+
+    def test_get_since_revision_filtered(self):
+        c = self.env.create_cluster(api=False)
+        self.env.create_notification(topic='error')
+        n1 = self.env.create_notification(topic='error', cluster_id=c.id)
+        self.env.create_notification(topic='done', cluster_id=c.id)
+
+        resp = self.app.get(
+            reverse('NotificationCollectionHandler'),
+            params={'since': 0, 'topic': 'error', 'cluster_id': c.id},
+            headers=self.default_headers
+        )
+        self.assertEquals(200, resp.status)
+        response = json.loads(resp.body)
+        self.assertEquals(response['ids'], [n1.id])
+        self.assertEquals([n['id'] for n in response['items']], [n1.id])
+
     def test_update(self):
         c = self.env.create_cluster(api=False)
         n0 = self.env.create_notification()
@@ -107,3 +201,68 @@ class TestHandlers(BaseIntegrationTest):
         self.assertEquals(rn1['status'], 'read')
         self.assertIsNone(rn0.get('cluster', None))
         self.assertEquals(rn0['status'], 'read')
+
+    def get_notifications(self, expect_errors=False, **params):
+        resp = self.app.get(
+            reverse('NotificationCollectionHandler'),
+            params=params,
+            headers=self.default_headers,
+            expect_errors=expect_errors
+        )
+        if expect_errors:
+            return resp
+        self.assertEquals(200, resp.status)
+        return [n['id'] for n in json.loads(resp.body)]
+
+    def test_get_pages(self):
+        ids = [self.env.create_notification().id for i in xrange(5)]
+        ids.reverse()
+
+        self.assertEquals(self.get_notifications(limit=2), ids[:2])
+        self.assertEquals(
+            self.get_notifications(limit=2, before=ids[1]), ids[2:4])
+        self.assertEquals(
+            self.get_notifications(limit=2, before=ids[3]), ids[4:])
+        self.assertEquals(
+            self.get_notifications(limit=2, before=ids[4]), [])
+
+    def test_get_filtered(self):
+        c = self.env.create_cluster(api=False)
+        n0 = self.env.create_notification(topic='error')
+        n1 = self.env.create_notification(topic='done', cluster_id=c.id)
+        n2 = self.env.create_notification(topic='discover', status='read')
+
+        self.assertEquals(self.get_notifications(topic='error'), [n0.id])
+        self.assertEquals(
+            self.get_notifications(topic='error,done'), [n1.id, n0.id])
+        self.assertEquals(self.get_notifications(cluster_id=c.id), [n1.id])
+        self.assertEquals(self.get_notifications(status='read'), [n2.id])
+
+        for params in ({'topic': 'abc'}, {'cluster_id': 'abc'}):
+            resp = self.get_notifications(expect_errors=True, **params)
+            self.assertEquals(400, resp.status)
+
+    def test_unread_count(self):
+        for status in ('unread', 'read', 'unread'):
+            self.env.create_notification(status=status)
+        resp = self.app.get(
+            reverse('NotificationUnreadCountHandler'),
+            headers=self.default_headers
+        )
+        self.assertEquals(200, resp.status)
+        self.assertEquals(json.loads(resp.body), {'unread': 2})
+
+    def test_update_invalid_id(self):
+        n0 = self.env.create_notification()
+        resp = self.app.put(
+            reverse('NotificationCollectionHandler'),
+            json.dumps([
+                {'id': n0.id, 'status': 'read'},
+                {'id': n0.id + 1, 'status': 'read'}
+            ]),
+            headers=self.default_headers,
+            expect_errors=True
+        )
+        self.assertEquals(400, resp.status)
+        self.db.refresh(n0)
+        self.assertEquals(n0.status, 'unread')
@@ -17,6 +17,7 @@
 import json
 
 from nailgun.api.models import Release
+from nailgun.api.models import Role
 from nailgun.test.base import BaseIntegrationTest
 from nailgun.test.base import reverse
 
@@ -31,6 +32,33 @@ class TestHandlers(BaseIntegrationTest):
         response = json.loads(resp.body)
         self.assertEquals([], response)
 
+    def test_release_list_not_modified(self):
+        self.env.create_release(api=False)
+        url = reverse('ReleaseCollectionHandler')
+        resp = self.app.get(url, headers=self.default_headers)
+        etag = resp.header('ETag')
+        headers = dict(self.default_headers, **{'If-None-Match': etag})
+        resp = self.app.get(url, headers=headers)
+        self.assertEquals(304, resp.status)
+
+        self.env.create_release(api=False)
+        resp = self.app.get(url, headers=headers)
+        self.assertEquals(200, resp.status)
+        self.assertEquals(2, len(json.loads(resp.body)))
+
+    def test_release_list_modified_by_roles(self):
+        release = self.env.create_release(api=False)
+        url = reverse('ReleaseCollectionHandler')
+        resp = self.app.get(url, headers=self.default_headers)
+        headers = dict(
+            self.default_headers, **{'If-None-Match': resp.header('ETag')})
+
+        self.db.add(Role(name='new_role', release_id=release.id))
+        self.db.commit()
+        resp = self.app.get(url, headers=headers)
+        self.assertEquals(200, resp.status)
+        self.assertIn('new_role', json.loads(resp.body)[0]['roles'])
+
     def test_release_creation(self):
         resp = self.app.post(
             reverse('ReleaseCollectionHandler'),
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nailgun.rpc.coalescer import ProgressCoalescer
+from nailgun.test.base import BaseTestCase
+
+
+class TestProgressCoalescer(BaseTestCase):
+
+    def deploy_resp(self, **kwargs):
+        return {'method': 'deploy_resp', 'args': kwargs}
+
+    def test_progress_only_messages(self):
+        self.assertTrue(ProgressCoalescer.is_progress_only(
+            self.deploy_resp(task_uuid='1', progress=10)))
+        self.assertTrue(ProgressCoalescer.is_progress_only(
+            self.deploy_resp(task_uuid='1', nodes=[
+                {'uid': 1, 'status': 'deploying', 'progress': 10}])))
+        for body in (
+            self.deploy_resp(task_uuid='1', status='ready'),
+            self.deploy_resp(task_uuid='1', status='error', error='Fail'),
+            self.deploy_resp(task_uuid='1', nodes=[
+                {'uid': 1, 'status': 'error', 'error_type': 'deploy'}]),
+            self.deploy_resp(task_uuid='1', nodes=[
+                {'uid': 1, 'status': 'ready', 'progress': 100}]),
+            self.deploy_resp(task_uuid='1', nodes=[
+                {'uid': 1, 'online': False}]),
+            {'method': 'provision_resp',
+             'args': {'task_uuid': '1', 'progress': 10}}
+        ):
+            self.assertFalse(ProgressCoalescer.is_progress_only(body))
+
+    def test_merged_messages_keep_latest_values(self):
+        merged = ProgressCoalescer.merge(
+            self.deploy_resp(task_uuid='1', progress=10, nodes=[
+                {'uid': 1, 'status': 'provisioning', 'progress': 90},
+                {'uid': 2, 'progress': 10}]),
+            self.deploy_resp(task_uuid='1', nodes=[
+                {'uid': 1, 'status': 'deploying', 'progress': 0},
+                {'uid': 3, 'progress': 5}])
+        )
+        self.assertEquals(merged, self.deploy_resp(task_uuid='1', nodes=[
+            {'uid': 1, 'status': 'deploying', 'progress': 0},
+            {'uid': 2, 'progress': 10},
+            {'uid': 3, 'progress': 5}]))
+
+    def test_state_transitions_keep_order(self):
+        items = [
+            (self.deploy_resp(task_uuid='1', progress=10), 1),
+            (self.deploy_resp(task_uuid='2', progress=10), 2),
+            (self.deploy_resp(task_uuid='1', progress=20), 3),
+            (self.deploy_resp(task_uuid='1', status='error'), 4),
+            (self.deploy_resp(task_uuid='1', progress=30), 5),
+            (self.deploy_resp(task_uuid='2', progress=20), 6),
+        ]
+        self.assertEquals(ProgressCoalescer.coalesce(items), [
+            (self.deploy_resp(task_uuid='1', progress=20), [1, 3]),
+            (self.deploy_resp(task_uuid='2', progress=20), [2, 6]),
+            (self.deploy_resp(task_uuid='1', status='error'), [4]),
+            (self.deploy_resp(task_uuid='1', progress=30), [5]),
+        ])
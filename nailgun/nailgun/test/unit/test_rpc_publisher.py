@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from kombu import Connection
+from kombu import Producer
+from mock import patch
+
+from nailgun import rpc
+from nailgun.test.base import BaseTestCase
+
+
+class TestPublisher(BaseTestCase):
+
+    def test_messages_published_through_pooled_connection(self):
+        publisher = rpc.Publisher('memory://', limit=2)
+        establish_connection = Connection._establish_connection
+        established = []
+
+        def count_connections(conn):
+            established.append(conn)
+            return establish_connection(conn)
+
+        with patch.object(Connection, '_establish_connection',
+                          count_connections):
+            for i in xrange(3):
+                publisher.publish('naily', {'method': 'test', 'args': i})
+        self.assertEquals(len(established), 1)
+
+        with Connection('memory://') as conn:
+            queue = conn.SimpleQueue(rpc.naily_queue)
+            for i in xrange(3):
+                message = queue.get(timeout=1)
+                self.assertEquals(
+                    message.payload,
+                    {'method': 'test', 'args': i}
+                )
+                message.ack()
+            queue.close()
+
+    def test_queue_is_declared_with_the_first_message_only(self):
+        publisher = rpc.Publisher('memory://')
+        declared = []
+
+        def publish(producer, body, **kwargs):
+            declared.append(kwargs['declare'])
+
+        with patch.object(Producer, 'publish', publish):
+            for i in xrange(3):
+                publisher.publish('naily', {'method': 'test'})
+            publisher._on_connection_error(IOError(), 0)
+            publisher.publish('naily', {'method': 'test'})
+        self.assertEquals(
+            declared,
+            [[rpc.naily_queue], [], [], [rpc.naily_queue]]
+        )
+
+    def test_message_is_pretty_printed_only_for_debug(self):
+        with patch.object(rpc, 'publisher') as publisher:
+            with patch.object(rpc.logger, 'isEnabledFor',
+                              return_value=False):
+                with patch.object(rpc.json, 'dumps') as dumps:
+                    rpc.cast('naily', {'method': 'test'})
+        self.assertFalse(dumps.called)
+        publisher.publish.assert_called_once_with(
+            'naily', {'method': 'test'})
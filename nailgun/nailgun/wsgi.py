@@ -23,6 +23,7 @@ from web.httpserver import WSGIServer
 curdir = os.path.dirname(__file__)
 sys.path.insert(0, curdir)
 
+from nailgun.api.handlers import buffer_notifications
 from nailgun.api.handlers import forbid_client_caching
 from nailgun.db import engine
 from nailgun.db import load_db_driver
@@ -35,6 +36,7 @@ from nailgun.urls import urls
 def build_app():
     app = web.application(urls, locals())
     app.add_processor(load_db_driver)
+    app.add_processor(buffer_notifications)
     app.add_processor(forbid_client_caching)
     return app
 